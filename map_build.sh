@@ -3,18 +3,20 @@
 # setup the virtual environment
 source .venv/bin/activate
 
-# Make/clean build dir
+# Make the build dir, existing outputs are only replaced if they have
+# changed so deploys only copy changed files (see build/manifest.json).
+# The text outputs also get .gz/.br copies for the web server to send.
+# The build of all the licences writes build/metrics.prom for monitoring.
 
-rm -r build
-mkdir build
+mkdir -p build
 
 # build the files
-./rpt -qblk build/beacons.kml -z build/beacons.kmz -H build/beacons.html
-./rpt -qdlk build/digipeaters.kml -z build/digipeaters.kmz -H build/digipeaters.html
-./rpt -qrlk build/repeaters.kml -z build/repeaters.kmz -H build/repeaters.html
-./rpt -qalk build/licences.kml -z build/licences.kmz -H build/licences.html
-./rpt -qask build/sites.kml -z build/sites.kmz -H build/sites.html
-./rpt -qak build/all.kml -z build/all.kmz -H build/all.html -j build/data-gen.js -c build/licences.csv -x build/licences.xlsx
+./rpt -qblk build/beacons.kml -z build/beacons.kmz -H build/beacons.html --manifest build/manifest.json --compress
+./rpt -qdlk build/digipeaters.kml -z build/digipeaters.kmz -H build/digipeaters.html --manifest build/manifest.json --compress
+./rpt -qrlk build/repeaters.kml -z build/repeaters.kmz -H build/repeaters.html --manifest build/manifest.json --compress
+./rpt -qalk build/licences.kml -z build/licences.kmz -H build/licences.html --manifest build/manifest.json --compress
+./rpt -qask build/sites.kml -z build/sites.kmz -H build/sites.html --manifest build/manifest.json --compress
+./rpt -qak build/all.kml -z build/all.kmz -H build/all.html -j build/data-gen.js -c build/licences.csv -x build/licences.xlsx --manifest build/manifest.json --compress --metrics build/metrics.prom
 
 # copy static files
 #cp html/data.html build
@@ -23,16 +25,16 @@ mkdir build
 #cp html/repeaters.js build
 #cp html/treeview.css build
 #cp html/style.css build
-cp -r html/* build
+cp -rp html/* build
 
 
 #Build files for Br74
-mkdir build/74
-./rpt -qblB 74 -k build/74/beacons.kml -z build/74/beacons.kmz -H build/74/beacons.html
-./rpt -qdlB 74 -k build/74/digipeaters.kml -z build/74/digipeaters.kmz -H build/74/digipeaters.html
-./rpt -qrlB 74 -k build/74/repeaters.kml -z build/74/repeaters.kmz -H build/74/repeaters.html
-./rpt -qalB 74 -k build/74/licences.kml -z build/74/licences.kmz -H build/74/licences.html
-./rpt -qasB 74 -k build/74/sites.kml -z build/74/sites.kmz -H build/74/sites.html
-./rpt -qaB 74 -k build/74/all.kml -z build/74/all.kmz -H build/74/all.html -j build/74/data-gen.js -c build/74/licences.csv -x build/74/licences.xlsx
-cp -r html/* build/74
+mkdir -p build/74
+./rpt -qblB 74 -k build/74/beacons.kml -z build/74/beacons.kmz -H build/74/beacons.html --manifest build/manifest.json --compress
+./rpt -qdlB 74 -k build/74/digipeaters.kml -z build/74/digipeaters.kmz -H build/74/digipeaters.html --manifest build/manifest.json --compress
+./rpt -qrlB 74 -k build/74/repeaters.kml -z build/74/repeaters.kmz -H build/74/repeaters.html --manifest build/manifest.json --compress
+./rpt -qalB 74 -k build/74/licences.kml -z build/74/licences.kmz -H build/74/licences.html --manifest build/manifest.json --compress
+./rpt -qasB 74 -k build/74/sites.kml -z build/74/sites.kmz -H build/74/sites.html --manifest build/manifest.json --compress
+./rpt -qaB 74 -k build/74/all.kml -z build/74/all.kmz -H build/74/all.html -j build/74/data-gen.js -c build/74/licences.csv -x build/74/licences.xlsx --manifest build/manifest.json --compress
+cp -rp html/* build/74
 mv build/74/live-74.kml build/74/live.kml
\ No newline at end of file
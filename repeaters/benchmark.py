@@ -0,0 +1,341 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+"""End to end benchmark of the build pipeline on synthetic datasets.
+
+For each scale a synthetic dataset is generated and served by the stand-in
+RSM API server, then each stage of the pipeline is timed:
+    api               fetching the licences from the stand-in server
+    readCsv           parsing the data files, without the overlay cache
+    getLicenceInfo    ingesting the API responses and grouping them into sites
+    calcOffsets       calculating the repeater input offsets
+    readLinks         matching the links to the licences
+    generate*         each of the output generators, generateKmz includes
+                      generating the KML before packaging it
+
+The start up time of the command line is also timed in a new interpreter:
+    interpreter       starting python on its own, for reference
+    import            importing repeaters.repeaters
+    help              running rpt --help
+
+The API responses are recorded on the first pass and replayed for the timed
+ingestion so that stage does not include the network. The results can be
+saved as a baseline and later runs compared against it, failing if any stage
+is slower than the baseline by more than the threshold, eg:
+    python -m repeaters.benchmark --baseline baseline.json --save
+    python -m repeaters.benchmark --baseline baseline.json --threshold 0.25
+"""
+
+import datetime
+import importlib.util
+import json
+import logging
+import optparse
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from rsmapi import common
+from rsmapi import session as rsmSession
+from rsmapi.server import startServer
+
+from repeaters import repeaters
+from repeaters import synthetic
+from repeaters.overlays import Overlays, loadOverlays
+
+DEFAULT_SCALES = '1,10,100'
+STARTUP = 'startup'
+STARTUP_REPEAT = 10
+
+logger = logging.getLogger(__name__)
+
+# Filters used for every run: all licence types, no frequency limits,
+# include, exclude or branch filters and using the skip file
+FILTERS = (None, None, True, True, True, True, None, None, None, False)
+
+def timeStage(results: dict, name: str, repeat: int, function, *args):
+    """Runs a stage the given number of times and records the fastest time
+
+    Args:
+        results (dict): Stage times in seconds indexed by stage name
+        name (str): Name of the stage
+        repeat (int): Number of times to run the stage
+        function: Function to run
+        *args: Arguments for the function
+
+    Returns:
+        The result of the last run of the function
+    """
+    best = None
+    for i in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    results[name] = best
+    logger.info('%-20s %10.4fs' % (name, best))
+    return result
+
+def readCsv(dataDir: str) -> Overlays:
+    """Parses the data files from the data folder, without the cache so the
+    parsing is timed
+
+    Args:
+        dataDir (str): Data folder
+
+    Returns:
+        Overlays: The parsed data files
+    """
+    overlays = loadOverlays(dataDir, cache=False)
+    return overlays
+
+def runScale(scale: float, workDir: str, repeat: int=3, seed: int=1) -> dict:
+    """Generates a synthetic dataset at the given scale and times each stage
+    of the pipeline on it
+
+    Args:
+        scale (float): Multiple of today's amateur licence volume
+        workDir (str): Folder for the dataset and the generated outputs
+        repeat (int, optional): Number of times to run each stage. Defaults to 3.
+        seed (int, optional): Random seed for the dataset. Defaults to 1.
+
+    Returns:
+        dict: Stage times in seconds indexed by stage name
+    """
+    dataDir = os.path.join(workDir, 'data')
+    fixtureDir = os.path.join(workDir, 'fixtures')
+    sessionDir = os.path.join(workDir, 'session')
+    outDir = os.path.join(workDir, 'out')
+    os.makedirs(outDir, exist_ok=True)
+
+    dataset = synthetic.generateDataset(scale, seed)
+    synthetic.writeDataFolder(dataset, dataDir)
+    synthetic.writeFixtures(dataset, fixtureDir)
+    logger.info('Scale %g: %i licences' % (scale, len(dataset['records'])))
+    del dataset
+
+    results = {}
+    server = startServer(fixtureDir)
+    baseUrl = common.rsmBaseUrl
+    common.rsmBaseUrl = server.url()
+    common.rsmDelay = 0
+    try:
+        rsmSession.startRecording(sessionDir)
+        timeStage(results, 'api', 1, repeaters.readLicenceInfo, dataDir, *FILTERS)
+        rsmSession.stop()
+    finally:
+        server.shutdown()
+        server.server_close()
+        common.rsmBaseUrl = baseUrl
+
+    rsmSession.startReplay(sessionDir)
+    try:
+        overlays = timeStage(results, 'readCsv', repeat, readCsv, dataDir)
+        sites, licences, licensees = timeStage(results, 'getLicenceInfo', repeat,
+                                               repeaters.getLicenceInfo,
+                                               overlays.callsigns, overlays.ctcss,
+                                               overlays.info, overlays.skip,
+                                               *FILTERS)
+    finally:
+        rsmSession.stop()
+    timeStage(results, 'calcOffsets', repeat, repeaters.calcOffsets,
+              licences.values(), overlays.bandPlan, overlays.offsets)
+    links = timeStage(results, 'readLinks', repeat, repeaters.readLinks,
+                      overlays.links, licences, sites)
+
+    date = datetime.datetime.now()
+    out = lambda name: os.path.join(outDir, name)
+    timeStage(results, 'generateCsv', repeat, repeaters.generateCsv,
+              out('all.csv'), licences, sites)
+    if importlib.util.find_spec('openpyxl') is not None:
+        timeStage(results, 'generateXlsx', repeat, repeaters.generateXlsx,
+                  out('all.xlsx'), licences, sites)
+    if importlib.util.find_spec('pyarrow') is not None or importlib.util.find_spec('numpy') is not None:
+        timeStage(results, 'generateColumnar', repeat, repeaters.generateColumnar,
+                  out('all.parquet'), licences, sites)
+    timeStage(results, 'generateHtml', repeat, repeaters.generateHtml,
+              out('all.html'), licences, sites, links, False, False, date)
+    timeStage(results, 'generateJs', repeat, repeaters.generateJs,
+              out('data-gen.js'), licences, sites, links, False, False, date)
+    timeStage(results, 'generateJson', repeat, repeaters.generateJson,
+              out('all.json'), None, licences, sites, links, date)
+    timeStage(results, 'generateKml', repeat, repeaters.generateKml,
+              out('all.kml'), licences, sites, links, False, False, date)
+    timeStage(results, 'generateKmz', repeat, repeaters.generateKmz,
+              out('all.kmz'), licences, sites, links, False, False, date)
+    return results
+
+def runCommand(command: list) -> None:
+    """Runs a command discarding its output
+
+    Args:
+        command (list): Command and arguments
+    """
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+def runStartup(repeat: int=STARTUP_REPEAT) -> dict:
+    """Times starting the command line in a new interpreter
+
+    Args:
+        repeat (int, optional): Number of times to run each command. Defaults to STARTUP_REPEAT.
+
+    Returns:
+        dict: Times in seconds indexed by command name
+    """
+    commands = (('interpreter', [sys.executable, '-c', 'pass']),
+                ('import', [sys.executable, '-c', 'import repeaters.repeaters']),
+                ('help', [sys.executable, 'rpt.py', '--help']))
+    results = {}
+    for name, command in commands:
+        timeStage(results, name, repeat, runCommand, command)
+    return results
+
+def compareResults(results: dict, baseline: dict, threshold: float, minDelta: float) -> list:
+    """Compares the results with the baseline
+
+    Args:
+        results (dict): Stage times indexed by scale and stage name
+        baseline (dict): Baseline stage times indexed by scale and stage name
+        threshold (float): Fraction slower than the baseline that is a regression
+        minDelta (float): Minimum increase in seconds that is a regression
+
+    Returns:
+        list: Regressions as (scale, stage, baseline time, time)
+    """
+    regressions = []
+    for scale, stages in results.items():
+        for stage, elapsed in stages.items():
+            base = baseline.get(scale, {}).get(stage)
+            if base is None:
+                continue
+            if elapsed > base * (1 + threshold) and elapsed - base > minDelta:
+                regressions.append((scale, stage, base, elapsed))
+    return regressions
+
+def formatResults(results: dict, baseline: dict) -> str:
+    """Formats the results as a table with the change from the baseline
+
+    Args:
+        results (dict): Stage times indexed by scale and stage name
+        baseline (dict): Baseline stage times indexed by scale and stage name
+
+    Returns:
+        str: Table of results
+    """
+    scales = list(results.keys())
+    stages = []
+    for s in scales:
+        stages += [stage for stage in results[s] if stage not in stages]
+    lines = ['%-18s' % 'Stage' + ''.join('%18s' % (s if s == STARTUP else 'x' + s) for s in scales)]
+    for stage in stages:
+        line = '%-18s' % stage
+        for s in scales:
+            elapsed = results[s].get(stage)
+            if elapsed is None:
+                line += '%18s' % '-'
+                continue
+            base = baseline.get(s, {}).get(stage)
+            if base:
+                line += '%10.4f %+6.0f%%' % (elapsed, (elapsed / base - 1) * 100)
+            else:
+                line += '%10.4f        ' % elapsed
+        lines.append(line)
+    return '\n'.join(lines)
+
+def main() -> None:
+    """Main
+    """
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-s','--scales', action='store', type='string', dest='scales',
+                      default=DEFAULT_SCALES,
+                      help='Comma separated multiples of the current licence volume to benchmark')
+    parser.add_option('-r','--repeat', action='store', type='int', dest='repeat',
+                      default=3, help='Number of times to run each stage, the fastest is used')
+    parser.add_option('-S','--seed', action='store', type='int', dest='seed',
+                      default=1, help='Random seed for the synthetic datasets')
+    parser.add_option('-b','--baseline', action='store', type='string', dest='baseline',
+                      default=None, help='Baseline file to compare the results with')
+    parser.add_option('--save', action='store_true', dest='save', default=False,
+                      help='Save the results to the baseline file instead of comparing')
+    parser.add_option('-t','--threshold', action='store', type='float', dest='threshold',
+                      default=0.25, help='Fraction slower than the baseline that fails a stage')
+    parser.add_option('-m','--min-delta', action='store', type='float', dest='minDelta',
+                      default=0.005, help='Minimum increase in seconds that fails a stage')
+    parser.add_option('-k','--keep', action='store', type='string', dest='keep',
+                      default=None, help='Keep the datasets and outputs in the given folder')
+    parser.add_option('-v','--verbose', action='store_true', dest='verbose',
+                      help='Log the time of each stage as it completes')
+    (options, args) = parser.parse_args()
+
+    # Missing info records etc are expected in the synthetic data so only
+    # log the progress of the benchmark
+    logging.basicConfig(level=logging.CRITICAL)
+    if options.verbose:
+        logger.setLevel(logging.INFO)
+        logger.addHandler(logging.StreamHandler())
+        logger.propagate = False
+    if options.save and options.baseline is None:
+        parser.error('A baseline file must be given to save the results to')
+
+    # generateKmz reads the icons relative to the current folder
+    os.chdir(os.path.dirname(repeaters.module_path()))
+
+    workDir = options.keep if options.keep else tempfile.mkdtemp()
+    results = {STARTUP: runStartup()}
+    try:
+        for scale in [s for s in options.scales.split(',') if s]:
+            results[scale] = runScale(float(scale), os.path.join(workDir, 'x' + scale),
+                                      options.repeat, options.seed)
+    finally:
+        if not options.keep:
+            shutil.rmtree(workDir)
+
+    baseline = {}
+    if options.baseline and not options.save and os.path.isfile(options.baseline):
+        with open(options.baseline) as f:
+            baseline = json.load(f)['scales']
+
+    print(formatResults(results, baseline))
+
+    if options.save:
+        with open(options.baseline, 'w') as f:
+            json.dump({'created': datetime.datetime.now().isoformat(),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'repeat': options.repeat,
+                       'seed': options.seed,
+                       'scales': results}, f, indent=2)
+        print('Saved baseline to %s' % options.baseline)
+    elif baseline:
+        regressions = compareResults(results, baseline, options.threshold, options.minDelta)
+        for scale, stage, base, elapsed in regressions:
+            print('REGRESSION x%s %s: %0.4fs -> %0.4fs (%+0.0f%%)' % (
+                  scale, stage, base, elapsed, (elapsed / base - 1) * 100))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
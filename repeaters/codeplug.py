@@ -0,0 +1,404 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Radio codeplugs of the nearest repeaters to each of a list of locations.
+
+Reads a CSV file of locations (name, latitude, longitude) and writes a
+CHIRP compatible CSV channel list for each location with the nearest
+repeaters in the selected bands, nearest first, ready to import into CHIRP
+and upload to a radio:
+
+    rpt codeplug -n 30 --bands "2 meters,70 cm" -o codeplugs towns.csv
+
+The repeater sites are placed in a grid of cells. The locations are
+handled a cell at a time, the rings of cells around the cell are searched
+until they hold the nearest repeaters of every location in the cell, so
+the locations in a town or region share one search and only measure the
+distance to the sites found by it rather than every site in the country.
+"""
+
+import csv
+import logging
+import math
+import optparse
+import os
+import re
+
+from repeaters import repeaters
+from repeaters.publish import atomicFile
+from repeaters.repeaters import EARTH_RADIUS_KM, T_REPEATER, distance
+
+DEFAULT_COUNT = 20
+DEFAULT_BANDS = '2 meters,70 cm'
+DEFAULT_FOLDER = 'codeplugs'
+# Size of the grid cells in km
+CELL_KM = 25.0
+KM_PER_DEGREE = math.radians(1) * EARTH_RADIUS_KM
+
+CHIRP_COLUMNS = ('Location', 'Name', 'Frequency', 'Duplex', 'Offset', 'Tone',
+                 'rToneFreq', 'cToneFreq', 'DtcsCode', 'DtcsPolarity', 'RxDtcsCode',
+                 'CrossMode', 'Mode', 'TStep', 'Skip', 'Comment',
+                 'URCALL', 'RPT1CALL', 'RPT2CALL', 'DVCODE')
+CHIRP_DEFAULT_TONE = 88.5
+
+class Location:
+    '''
+    Place to generate a codeplug for
+    '''
+    def __init__(self, name: str, lat: float, lon: float) -> None:
+        """Constructor for a location
+
+        Args:
+            name (str): Name of the location
+            lat (float): Latitude
+            lon (float): Longitude
+        """
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.fileName = re.sub('[^A-Za-z0-9]+', '_', name).strip('_') + '.csv'
+
+def readLocations(fileName: str) -> 'list[Location]':
+    """Reads the locations from a CSV file of name, latitude and longitude,
+    skipping blank lines, comments starting with # and a header row
+
+    Args:
+        fileName (str): Locations file name
+
+    Returns:
+        list[Location]: Locations
+    """
+    locations = []
+    with open(fileName, newline='') as f:
+        for line, row in enumerate(csv.reader(f), 1):
+            if not row or row[0].startswith('#'):
+                continue
+            try:
+                locations.append(Location(row[0].strip(), float(row[1]), float(row[2])))
+            except (IndexError, ValueError):
+                if locations:
+                    raise ValueError('%s line %i is not a name, latitude and longitude' % (fileName, line))
+    return locations
+
+class SiteIndex:
+    '''
+    Grid of the sites holding licences to choose from
+    '''
+    def __init__(self, licences: 'list[repeaters.Licence]', sites: dict,
+                 cellKm: float=CELL_KM) -> None:
+        """Constructor for the index
+
+        Args:
+            licences (list[repeaters.Licence]): Licences to choose from
+            sites (dict): Sites indexed by name
+            cellKm (float, optional): Minimum size of the cells in km. Defaults to CELL_KM.
+        """
+        self.cellKm = cellKm
+        self.latCell = cellKm / KM_PER_DEGREE
+        self.bySite = {}
+        for licence in licences:
+            self.bySite.setdefault(licence.site, []).append(licence)
+        self.sites = [sites[name] for name in sorted(self.bySite)]
+        maxLat = max([abs(site.coordinates.lat) for site in self.sites] + [0.0]) + self.latCell
+        lonCell = self.latCell / math.cos(math.radians(min(maxLat, 89.0)))
+        # A whole number of cells around the world so the cells wrap at
+        # 180 degrees, eg for the Chatham Islands, as in conflicts.SiteGrid
+        self.lonCells = max(1, int(360.0 / lonCell))
+        self.lonCell = 360.0 / self.lonCells
+        self.cells = {}
+        for site in self.sites:
+            self.cells.setdefault(self.cell(site.coordinates.lat, site.coordinates.lon), []).append(site)
+        # Rows of cells holding sites
+        rows = [lat for lat, lon in self.cells] or [0]
+        self.rows = (min(rows), max(rows))
+
+    def cell(self, lat: float, lon: float) -> tuple:
+        """Returns the cell of a position
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+
+        Returns:
+            tuple: Cell
+        """
+        return (math.floor(lat / self.latCell),
+                math.floor((lon + 180.0) / self.lonCell) % self.lonCells)
+
+    def searched(self, cell: tuple, radius: int) -> bool:
+        """Returns True if the cells up to a given number of cells from a
+        cell include every cell holding sites
+
+        Args:
+            cell (tuple): Centre cell
+            radius (int): Number of cells out from the centre
+
+        Returns:
+            bool: True if every site has been found
+        """
+        return (cell[0] - radius <= self.rows[0] and cell[0] + radius >= self.rows[1] and
+                2 * radius + 1 >= self.lonCells)
+
+    def ring(self, cell: tuple, radius: int) -> 'list[repeaters.Site]':
+        """Returns the sites in the cells a given number of cells from a cell
+
+        Args:
+            cell (tuple): Centre cell
+            radius (int): Number of cells out from the centre
+
+        Returns:
+            list[repeaters.Site]: Sites
+        """
+        lat, lon = cell
+        # Columns around the world at the radius, and up to it for the top
+        # and bottom rows of the ring, each column only once when they wrap
+        if 2 * radius + 1 >= self.lonCells:
+            edge = range(self.lonCells)
+        else:
+            edge = [(lon + dLon) % self.lonCells for dLon in range(-radius, radius + 1)]
+        if 2 * radius > self.lonCells:
+            sides = []
+        else:
+            sides = sorted(set(((lon - radius) % self.lonCells, (lon + radius) % self.lonCells)))
+        found = []
+        for row in range(max(lat - radius, self.rows[0]), min(lat + radius, self.rows[1]) + 1):
+            for column in (edge if abs(row - lat) == radius else sides):
+                found += self.cells.get((row, column), ())
+        return found
+
+    def nearest(self, locations: 'list[Location]', count: int,
+                maxDistance: float=None) -> 'list[list]':
+        """Returns the nearest licences to each of the locations, which
+        should all be in the same cell
+
+        Args:
+            locations (list[Location]): Locations in one cell
+            count (int): Number of licences for each location
+            maxDistance (float, optional): Only include licences within this distance in km. Defaults to None.
+
+        Returns:
+            list[list]: (distance, licence) of the nearest licences, nearest first, for each location
+        """
+        cell = self.cell(locations[0].lat, locations[0].lon)
+        limit = math.inf if maxDistance is None else maxDistance
+        candidates = []
+        found = 0
+        radius = 0
+        # Every site outside the rings searched is at least the number of
+        # rings times the narrowest cell from any location in the centre
+        # cell, the cells are narrowest furthest from the equator
+        while True:
+            for site in self.ring(cell, radius):
+                candidates.append(site)
+                found += len(self.bySite[site.name])
+            poleward = max(abs(cell[0] - radius - 1), abs(cell[0] + radius + 2)) * self.latCell
+            width = min(self.latCell, self.lonCell * math.cos(math.radians(min(poleward, 89.0))))
+            covered = radius * width * KM_PER_DEGREE
+            if covered >= limit or self.searched(cell, radius):
+                break
+            if found >= count:
+                furthest = max(self.furthest(location, candidates, count) for location in locations)
+                if covered >= furthest:
+                    break
+            radius += 1
+
+        results = []
+        for location in locations:
+            choices = []
+            for site in candidates:
+                d = distance(site.coordinates, location.lat, location.lon)
+                if d <= limit:
+                    choices += [(d, licence) for licence in self.bySite[site.name]]
+            choices.sort(key=lambda choice: (choice[0], choice[1].frequency, choice[1].number))
+            results.append(choices[:count])
+        return results
+
+    def furthest(self, location: Location, candidates: 'list[repeaters.Site]',
+                 count: int) -> float:
+        """Returns the distance to the last of the nearest licences among the
+        candidate sites
+
+        Args:
+            location (Location): Location
+            candidates (list[repeaters.Site]): Candidate sites
+            count (int): Number of licences
+
+        Returns:
+            float: Distance in km
+        """
+        distances = sorted((distance(site.coordinates, location.lat, location.lon), len(self.bySite[site.name]))
+                           for site in candidates)
+        total = 0
+        for d, licences in distances:
+            total += licences
+            if total >= count:
+                return d
+        return math.inf
+
+    def scan(self, location: Location, count: int, maxDistance: float=None) -> list:
+        """Returns the nearest licences to a location by measuring the
+        distance to every site, to check nearest()
+
+        Args:
+            location (Location): Location
+            count (int): Number of licences
+            maxDistance (float, optional): Only include licences within this distance in km. Defaults to None.
+
+        Returns:
+            list: (distance, licence) of the nearest licences, nearest first
+        """
+        limit = math.inf if maxDistance is None else maxDistance
+        choices = []
+        for site in self.sites:
+            d = distance(site.coordinates, location.lat, location.lon)
+            if d <= limit:
+                choices += [(d, licence) for licence in self.bySite[site.name]]
+        choices.sort(key=lambda choice: (choice[0], choice[1].frequency, choice[1].number))
+        return choices[:count]
+
+def nearestRepeaters(index: SiteIndex, locations: 'list[Location]', count: int,
+                     maxDistance: float=None) -> dict:
+    """Finds the nearest licences to each location, a cell of locations at
+    a time
+
+    Args:
+        index (SiteIndex): Index of the sites
+        locations (list[Location]): Locations
+        count (int): Number of licences for each location
+        maxDistance (float, optional): Only include licences within this distance in km. Defaults to None.
+
+    Returns:
+        dict: (distance, licence) of the nearest licences indexed by location name
+    """
+    byCell = {}
+    for location in locations:
+        byCell.setdefault(index.cell(location.lat, location.lon), []).append(location)
+    nearest = {}
+    for cellLocations in byCell.values():
+        for location, choices in zip(cellLocations, index.nearest(cellLocations, count, maxDistance)):
+            nearest[location.name] = choices
+    return nearest
+
+def chirpRow(channel: int, licence: repeaters.Licence, d: float) -> list:
+    """Returns a CHIRP CSV row for a licence
+
+    Args:
+        channel (int): Channel number
+        licence (repeaters.Licence): Licence
+        d (float): Distance from the location in km
+
+    Returns:
+        list: Values for CHIRP_COLUMNS
+    """
+    offset = licence.offset or 0.0
+    if offset == 0.0:
+        duplex, offsetValue = '', 0.0
+    elif not any(band.name == licence.band() and band.fIsIn(licence.inputFrequency)
+                 for band in repeaters.bands):
+        # The radio transmits on a separate frequency for cross band repeaters
+        duplex, offsetValue = 'split', licence.inputFrequency
+    else:
+        duplex, offsetValue = '+' if offset > 0 else '-', abs(offset)
+    if licence.ctcss is not None:
+        tone, toneFreq = 'Tone', licence.ctcss.freq
+    else:
+        tone, toneFreq = '', CHIRP_DEFAULT_TONE
+    name = licence.callsign if licence.callsign else licence.name
+    comment = '%s at %s, %0.1f km' % (licence.formatName(), licence.site, d)
+    return [channel, name, '%0.6f' % licence.frequency, duplex, '%0.6f' % offsetValue, tone,
+            '%0.1f' % toneFreq, '%0.1f' % toneFreq, '023', 'NN', '023', 'Tone->Tone',
+            'FM', '5.00', '', comment, '', '', '', '']
+
+def generateCodeplug(fileName: str, choices: list) -> None:
+    """Generates a CHIRP CSV file of the given licences
+
+    Args:
+        fileName (str): CSV file name
+        choices (list): (distance, licence) of the licences in channel order
+    """
+    with atomicFile(fileName) as tempName:
+        with open(tempName, 'w', newline='') as f:
+            writer = csv.writer(f, dialect='excel')
+            writer.writerow(CHIRP_COLUMNS)
+            for channel, (d, licence) in enumerate(choices, 1):
+                writer.writerow(chirpRow(channel, licence, d))
+
+def main(argv: list=None) -> None:
+    """Main for rpt codeplug
+
+    Args:
+        argv (list, optional): Command line arguments after codeplug. Defaults to sys.argv[1:].
+    """
+    parser = optparse.OptionParser(usage='%prog codeplug [options] locations.csv')
+    parser.add_option('-n','--count', action='store', type='int', dest='count',
+                      default=DEFAULT_COUNT, help='Number of repeaters for each location, default %i' % DEFAULT_COUNT)
+    parser.add_option('--bands', action='store', type='string', dest='bands',
+                      default=DEFAULT_BANDS, help='Bands to include separated by commas, default "%s"' % DEFAULT_BANDS)
+    parser.add_option('--distance', action='store', type='float', dest='distance',
+                      default=None, help='Only include repeaters within DISTANCE km of the location')
+    parser.add_option('--dmr', action='store_true', dest='dmr',
+                      default=False, help='Include DMR repeaters, which analogue radios cannot use')
+    parser.add_option('-o','--output', action='store', type='string', dest='output',
+                      default=DEFAULT_FOLDER, help='Folder for the codeplugs, default %s' % DEFAULT_FOLDER)
+    repeaters.addDataOptions(parser)
+    (options, args) = parser.parse_args(argv)
+
+    if len(args) != 1:
+        parser.error('A locations file must be given')
+    if options.count < 1:
+        parser.error('The number of repeaters must be at least 1')
+    if options.distance is not None and options.distance <= 0:
+        parser.error('The distance must be greater than 0')
+    bandNames = {band.name.lower(): band.name for band in repeaters.bands}
+    selectedBands = set()
+    for name in options.bands.split(','):
+        if name.strip().lower() not in bandNames:
+            parser.error('Unknown band %s, the bands are %s' % (
+                name.strip(), ', '.join(band.name for band in repeaters.bands)))
+        selectedBands.add(bandNames[name.strip().lower()])
+    try:
+        locations = readLocations(args[0])
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not locations:
+        parser.error('No locations found in %s' % args[0])
+    fileNames = set()
+    for location in locations:
+        if location.fileName in fileNames:
+            parser.error('More than one location is named %s' % location.name)
+        fileNames.add(location.fileName)
+    dataDir = repeaters.applyDataOptions(parser, options)
+
+    filters = (None, None, False, False, True, False, None, None, None, options.noskip)
+    sites, licences, licensees, links = repeaters.loadLicences(dataDir, filters, options.snapshot,
+                                                               options.snapshotAge)
+
+    chosen = [licence for licence in licences.values()
+              if licence.licType == T_REPEATER and licence.band() in selectedBands and
+              (options.dmr or licence.licSubType != 'DMR')]
+    index = SiteIndex(chosen, sites)
+    nearest = nearestRepeaters(index, locations, options.count, options.distance)
+    os.makedirs(options.output, exist_ok=True)
+    for location in locations:
+        generateCodeplug(os.path.join(options.output, location.fileName), nearest[location.name])
+    logging.info('%i codeplugs written to %s from %i repeaters' % (
+        len(locations), options.output, len(chosen)))
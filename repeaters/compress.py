@@ -0,0 +1,170 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Precompressed copies of the output files.
+
+A .gz copy, and a .br copy when the brotli module is installed, is written
+alongside each text output so a static web server can send the compressed
+variant directly (eg nginx gzip_static/brotli_static) without compressing
+on every request. The copies are compressed in a thread pool while the
+remaining outputs are generated; zlib and brotli release the GIL so the
+compression runs in parallel with the build.
+
+Each copy is given the modification time of its output, so an output that
+was left unchanged by publish() keeps its existing compressed copies.
+"""
+
+import concurrent.futures
+import logging
+import os
+
+from repeaters.publish import atomicFile
+
+# Formats that are already compressed gain nothing from a compressed copy
+COMPRESS_EXTENSIONS = ('.csv', '.html', '.js', '.json', '.ndjson', '.kml')
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+def brotliModule():
+    """Returns the brotli module if it is installed
+
+    Returns:
+        module: brotli module or None
+    """
+    try:
+        import brotli
+    except ModuleNotFoundError:
+        return None
+    return brotli
+
+def compressible(fileName: str) -> bool:
+    """Returns True if a compressed copy should be written for the file
+
+    Args:
+        fileName (str): Output file name
+
+    Returns:
+        bool: True if the file is a text format
+    """
+    return os.path.splitext(fileName)[1].lower() in COMPRESS_EXTENSIONS
+
+def isCurrent(fileName: str, sibling: str) -> bool:
+    """Returns True if the compressed copy was written from the current
+    version of the file
+
+    Args:
+        fileName (str): Output file name
+        sibling (str): Compressed copy file name
+
+    Returns:
+        bool: True if the copy is up to date
+    """
+    return (os.path.isfile(sibling) and
+            os.stat(sibling).st_mtime_ns == os.stat(fileName).st_mtime_ns)
+
+def writeSibling(fileName: str, sibling: str, compress) -> None:
+    """Writes a compressed copy of the file with the modification time of the file
+
+    Args:
+        fileName (str): Output file name
+        sibling (str): Compressed copy file name
+        compress (function): Function compressing bytes
+    """
+    with open(fileName, 'rb') as f:
+        data = compress(f.read())
+    with atomicFile(sibling) as tempName:
+        with open(tempName, 'wb') as f:
+            f.write(data)
+        stat = os.stat(fileName)
+        os.utime(tempName, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+def compressFile(fileName: str, force: bool=False) -> 'list[tuple[str, bool]]':
+    """Writes the .gz and .br (if brotli is installed) copies of a file
+
+    Args:
+        fileName (str): Output file name
+        force (bool, optional): Rewrite the copies even if they are up to date. Defaults to False.
+
+    Returns:
+        list[tuple[str, bool]]: Compressed copies with True if the copy was rewritten
+    """
+    import gzip
+    # mtime=0 so the gzip header does not change between runs
+    compressors = [('.gz', lambda data: gzip.compress(data, GZIP_LEVEL, mtime=0))]
+    brotli = brotliModule()
+    if brotli is not None:
+        compressors.append(('.br', lambda data: brotli.compress(data, quality=BROTLI_QUALITY)))
+    elif os.path.isfile(fileName + '.br') and not isCurrent(fileName, fileName + '.br'):
+        # A stale copy would be served in place of the new output
+        logging.warning('brotli is not installed, removing the out of date %s.br' % fileName)
+        os.unlink(fileName + '.br')
+
+    siblings = []
+    for extension, compress in compressors:
+        sibling = fileName + extension
+        changed = force or not isCurrent(fileName, sibling)
+        if changed:
+            writeSibling(fileName, sibling, compress)
+        siblings.append((sibling, changed))
+    return siblings
+
+class Compressor:
+    '''
+    Thread pool writing the compressed copies of the outputs
+    '''
+    def __init__(self, force: bool=False, workers: int=None) -> None:
+        """Constructor for the compressor
+
+        Args:
+            force (bool, optional): Rewrite the copies even if they are up to date. Defaults to False.
+            workers (int, optional): Number of threads. Defaults to the executor default.
+        """
+        self.force = force
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers, 'compress')
+        self.futures = []
+        if brotliModule() is None:
+            logging.info('brotli is not installed, only writing .gz copies')
+
+    def submit(self, fileName: str) -> None:
+        """Queues the compression of an output, formats that are already
+        compressed are ignored
+
+        Args:
+            fileName (str): Output file name
+        """
+        if compressible(fileName):
+            self.futures.append(self.executor.submit(compressFile, fileName, self.force))
+
+    def wait(self) -> 'list[tuple[str, bool]]':
+        """Waits for the queued compression to finish
+
+        Returns:
+            list[tuple[str, bool]]: Compressed copies with True if the copy was rewritten
+        """
+        siblings = []
+        try:
+            for future in self.futures:
+                siblings.extend(future.result())
+        finally:
+            self.executor.shutdown()
+            self.futures = []
+        return siblings
@@ -0,0 +1,424 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Co-channel and adjacent channel analysis.
+
+Finds pairs of licences within a distance of each other whose output or
+input frequencies are the same or within a separation of each other, eg two
+repeaters on the same output 60 km apart, or a repeater input next to a
+beacon. The input of a repeater is its output plus its offset, repeaters
+without an offset (simplex) only have an output. The pairs are written as
+CSV, JSON or as KML lines between the sites:
+
+    rpt conflicts -r --distance 80 --separation 0.025 -k conflicts.kml
+
+The pairs are found by sweeping through the frequencies in order. The
+frequencies within the separation below the current one are held in a grid
+of cells at least the distance across, so the current frequency is only
+compared with those in its own and the neighbouring cells and the distance
+is only calculated for pairs that are already close in frequency and
+roughly close in position. The work grows with the number of nearby pairs
+rather than the square of the number of licences, so the whole spectrum
+can be checked at once.
+"""
+
+import collections
+import csv
+import datetime
+import html
+import json
+import logging
+import math
+import optparse
+import sys
+
+from repeaters import repeaters
+from repeaters.publish import atomicFile
+from repeaters.repeaters import EARTH_RADIUS_KM, kmlFooter, kmlHeader, distance
+
+DEFAULT_DISTANCE_KM = 100.0
+DEFAULT_SEPARATION_MHZ = 0.0125
+# Frequencies closer than this are on the same channel
+CO_CHANNEL_MHZ = 0.0001
+# Allowance for rounding in the frequency differences
+TOLERANCE_MHZ = 1e-6
+KM_PER_DEGREE = math.radians(1) * EARTH_RADIUS_KM
+
+OUTPUT = 'output'
+INPUT = 'input'
+CO_CHANNEL = 'co-channel'
+ADJACENT = 'adjacent'
+COLUMNS = ('Kind', 'Separation (kHz)', 'Distance (km)',
+           'Number 1', 'Name 1', 'Callsign 1', 'Site 1', 'Channel 1', 'Frequency 1',
+           'Number 2', 'Name 2', 'Callsign 2', 'Site 2', 'Channel 2', 'Frequency 2')
+# KML line colours (aabbggrr) by kind
+KML_COLOURS = {CO_CHANNEL: 'ff0000ff', ADJACENT: 'ff00a5ff'}
+
+class Channel:
+    '''
+    Output or input frequency of a licence
+    '''
+    def __init__(self, frequency: float, role: str, licence: repeaters.Licence,
+                 site: repeaters.Site) -> None:
+        """Constructor for a channel
+
+        Args:
+            frequency (float): Frequency in MHz
+            role (str): OUTPUT or INPUT
+            licence (repeaters.Licence): Licence using the frequency
+            site (repeaters.Site): Site of the licence
+        """
+        self.frequency = frequency
+        self.role = role
+        self.licence = licence
+        self.site = site
+
+class Conflict:
+    '''
+    Pair of channels close in frequency at nearby sites
+    '''
+    def __init__(self, channel1: Channel, channel2: Channel, distance: float) -> None:
+        """Constructor for a conflict
+
+        Args:
+            channel1 (Channel): Lower frequency channel
+            channel2 (Channel): Higher frequency channel
+            distance (float): Distance between the sites in km
+        """
+        self.channel1 = channel1
+        self.channel2 = channel2
+        self.distance = distance
+        self.separation = abs(channel2.frequency - channel1.frequency)
+        self.kind = CO_CHANNEL if self.separation < CO_CHANNEL_MHZ else ADJACENT
+
+    def sortKey(self) -> tuple:
+        """Returns the key to order the conflicts, closest in frequency then
+        distance first
+
+        Returns:
+            tuple: Sort key
+        """
+        return (round(self.separation, 6), self.distance,
+                self.channel1.licence.number, self.channel2.licence.number)
+
+    def row(self) -> list:
+        """Returns the conflict as a CSV row
+
+        Returns:
+            list: Values for COLUMNS
+        """
+        row = [self.kind, '%0.1f' % (self.separation * 1000), '%0.1f' % self.distance]
+        for channel in (self.channel1, self.channel2):
+            row += [channel.licence.number, channel.licence.name, channel.licence.callsign,
+                    channel.site.name, channel.role, '%0.4f' % channel.frequency]
+        return row
+
+    def record(self) -> dict:
+        """Returns the conflict as a dictionary for JSON output
+
+        Returns:
+            dict: Conflict record
+        """
+        def channelRecord(channel):
+            return {'number': channel.licence.number,
+                    'name': channel.licence.name,
+                    'callsign': channel.licence.callsign,
+                    'type': channel.licence.licType,
+                    'site': channel.site.name,
+                    'channel': channel.role,
+                    'frequency': round(channel.frequency, 6)}
+        return {'kind': self.kind,
+                'separation': round(self.separation, 6),
+                'distance': round(self.distance, 3),
+                'licences': [channelRecord(self.channel1), channelRecord(self.channel2)]}
+
+    def kmlPlacemark(self) -> str:
+        """Returns a KML placemark with a line between the two sites
+
+        Returns:
+            str: KML placemark
+        """
+        name = '%s / %s' % (self.channel1.licence.formatName(), self.channel2.licence.formatName())
+        description = '%s %0.1f kHz apart, %0.1f km<br>' % (self.kind, self.separation * 1000, self.distance)
+        for channel in (self.channel1, self.channel2):
+            description += '%s %s %s %0.4f MHz at %s<br>' % (
+                channel.licence.number, channel.licence.formatName(), channel.role,
+                channel.frequency, channel.site.name)
+        placemark = '    <Placemark>\n'
+        placemark += '      <name>%s</name>\n' % html.escape(name)
+        placemark += '      <description>%s</description>\n' % html.escape(description)
+        placemark += '      <styleUrl>#%s</styleUrl>\n' % self.kind
+        placemark += '      <LineString>\n'
+        placemark += '        <tessellate>1</tessellate>\n'
+        placemark += '        <altitudeMode>clampToGround</altitudeMode>\n'
+        placemark += '        <coordinates> %s %s</coordinates>\n' % (
+            self.channel1.site.coordinates.kml(), self.channel2.site.coordinates.kml())
+        placemark += '      </LineString>\n'
+        placemark += '    </Placemark>\n'
+        return placemark
+
+def channels(licences: dict, sites: dict) -> 'list[Channel]':
+    """Returns the output and input frequencies of the licences in
+    frequency order
+
+    Args:
+        licences (dict): Licences
+        sites (dict): Sites indexed by name
+
+    Returns:
+        list[Channel]: Channels sorted by frequency
+    """
+    result = []
+    for licence in licences.values():
+        site = sites[licence.site]
+        result.append(Channel(licence.frequency, OUTPUT, licence, site))
+        if licence.offset:
+            result.append(Channel(licence.inputFrequency, INPUT, licence, site))
+    result.sort(key=lambda channel: channel.frequency)
+    return result
+
+class SiteGrid:
+    '''
+    Grid of cells at least the distance across in both directions, so all
+    the sites within the distance of a site are in its cell or one of the
+    eight around it
+    '''
+    def __init__(self, sites: 'list[repeaters.Site]', maxDistance: float) -> None:
+        """Constructor for the grid
+
+        Args:
+            sites (list[repeaters.Site]): Sites to be placed in the grid
+            maxDistance (float): Distance in km
+        """
+        self.latCell = maxDistance / KM_PER_DEGREE
+        # A degree of longitude is shortest furthest from the equator, a
+        # great circle between two sites may bulge poleward by up to a cell
+        maxLat = max([abs(site.coordinates.lat) for site in sites] + [0.0]) + self.latCell
+        lonCell = self.latCell / math.cos(math.radians(min(maxLat, 89.0)))
+        # A whole number of cells around the world so the cells wrap
+        self.lonCells = max(1, int(360.0 / lonCell))
+        self.lonCell = 360.0 / self.lonCells
+
+    def cell(self, site: repeaters.Site) -> tuple:
+        """Returns the cell of a site
+
+        Args:
+            site (repeaters.Site): Site
+
+        Returns:
+            tuple: Cell
+        """
+        return (math.floor(site.coordinates.lat / self.latCell),
+                math.floor((site.coordinates.lon + 180.0) / self.lonCell) % self.lonCells)
+
+    def neighbours(self, cell: tuple) -> set:
+        """Returns the cell and the cells around it
+
+        Args:
+            cell (tuple): Cell
+
+        Returns:
+            set: Cells
+        """
+        lat, lon = cell
+        return set((lat + dLat, (lon + dLon) % self.lonCells)
+                   for dLat in (-1, 0, 1) for dLon in (-1, 0, 1))
+
+def findConflicts(licences: dict, sites: dict, maxDistance: float=DEFAULT_DISTANCE_KM,
+                  separation: float=DEFAULT_SEPARATION_MHZ) -> 'list[Conflict]':
+    """Finds the pairs of licences with channels within the separation of
+    each other at sites within the distance of each other. Channels of the
+    same licence number are not compared.
+
+    Args:
+        licences (dict): Licences
+        sites (dict): Sites indexed by name
+        maxDistance (float, optional): Distance in km. Defaults to DEFAULT_DISTANCE_KM.
+        separation (float, optional): Frequency separation in MHz. Defaults to DEFAULT_SEPARATION_MHZ.
+
+    Returns:
+        list[Conflict]: Conflicts, closest in frequency then distance first
+    """
+    grid = SiteGrid(list(sites.values()), maxDistance)
+    window = collections.deque()
+    cells = {}
+    conflicts = []
+    for channel in channels(licences, sites):
+        # Drop the channels too far below this one, they were added in
+        # frequency order so they are first in the window and their cells
+        while window and window[0][0].frequency < channel.frequency - separation - TOLERANCE_MHZ:
+            old, oldCell = window.popleft()
+            cells[oldCell].popleft()
+            if not cells[oldCell]:
+                del cells[oldCell]
+        cell = grid.cell(channel.site)
+        coordinates = channel.site.coordinates
+        for neighbour in grid.neighbours(cell):
+            for other in cells.get(neighbour, ()):
+                if other.licence.number == channel.licence.number:
+                    continue
+                d = distance(other.site.coordinates, coordinates.lat, coordinates.lon)
+                if d <= maxDistance:
+                    conflicts.append(Conflict(other, channel, d))
+        window.append((channel, cell))
+        cells.setdefault(cell, collections.deque()).append(channel)
+    conflicts.sort(key=Conflict.sortKey)
+    return conflicts
+
+def writeCsv(f, conflicts: 'list[Conflict]') -> None:
+    """Writes the conflicts as CSV
+
+    Args:
+        f (file): File to write to
+        conflicts (list[Conflict]): Conflicts
+    """
+    writer = csv.writer(f, dialect='excel')
+    writer.writerow(COLUMNS)
+    for conflict in conflicts:
+        writer.writerow(conflict.row())
+
+def generateCsv(fileName: str, conflicts: 'list[Conflict]') -> None:
+    """Generates a CSV file of the conflicts
+
+    Args:
+        fileName (str): CSV file name
+        conflicts (list[Conflict]): Conflicts
+    """
+    with atomicFile(fileName) as tempName:
+        with open(tempName, 'w', newline='') as f:
+            writeCsv(f, conflicts)
+
+def generateJson(fileName: str, conflicts: 'list[Conflict]', maxDistance: float,
+                 separation: float, indent: int=None) -> None:
+    """Generates a JSON file of the conflicts
+
+    Args:
+        fileName (str): JSON file name
+        conflicts (list[Conflict]): Conflicts
+        maxDistance (float): Distance in km used
+        separation (float): Frequency separation in MHz used
+        indent (int, optional): Indentation. Defaults to None.
+    """
+    with atomicFile(fileName) as tempName:
+        with open(tempName, 'w') as f:
+            json.dump({'generated': datetime.datetime.now().isoformat(),
+                       'distance': maxDistance,
+                       'separation': separation,
+                       'conflicts': [conflict.record() for conflict in conflicts]},
+                      f, indent=indent)
+
+def generateKml(fileName: str, conflicts: 'list[Conflict]', maxDistance: float,
+                separation: float) -> None:
+    """Generates a KML file with a line between the sites of each conflict
+
+    Args:
+        fileName (str): KML file name
+        conflicts (list[Conflict]): Conflicts
+        maxDistance (float): Distance in km used
+        separation (float): Frequency separation in MHz used
+    """
+    kml = kmlHeader()
+    for kind, colour in KML_COLOURS.items():
+        kml += '  <Style id="%s"><LineStyle><color>%s</color><width>3</width></LineStyle></Style>\n' % (kind, colour)
+    kml += '    <name>Channel conflicts within %g km and %g kHz</name><open>1</open>\n' % (
+        maxDistance, separation * 1000)
+    for kind in KML_COLOURS:
+        kml += '    <Folder><name>%s</name><open>0</open>\n' % kind.capitalize()
+        for conflict in conflicts:
+            if conflict.kind == kind:
+                kml += conflict.kmlPlacemark()
+        kml += '    </Folder>\n'
+    kml += kmlFooter()
+    with atomicFile(fileName) as tempName:
+        with open(tempName, 'w') as f:
+            f.write(kml)
+
+def main(argv: list=None) -> None:
+    """Main for rpt conflicts
+
+    Args:
+        argv (list, optional): Command line arguments after conflicts. Defaults to sys.argv[1:].
+    """
+    parser = optparse.OptionParser(usage='%prog conflicts [options]')
+    parser.add_option('--distance', action='store', type='float', dest='distance',
+                      default=DEFAULT_DISTANCE_KM, help='Report licences with sites within DISTANCE km of each other')
+    parser.add_option('--separation', action='store', type='float', dest='separation',
+                      default=DEFAULT_SEPARATION_MHZ, help='Report channels within SEPARATION MHz of each other, 0 for co-channel only')
+    parser.add_option('-c','--csv', action='store', type='string', dest='csvfilename',
+                      default=None, help='Output the conflicts to a csv file, the default is csv to the standard output')
+    parser.add_option('-J','--json', action='store', type='string', dest='jsonfilename',
+                      default=None, help='Output the conflicts to a JSON file')
+    parser.add_option('-k','--kml', action='store', type='string', dest='kmlfilename',
+                      default=None, help='Output the conflicts as lines between the sites to a kml file')
+    parser.add_option('--indent', action='store', type='int', dest='indent',
+                      default=None, help='Indentation for the JSON file')
+    parser.add_option('-b','--beacon', action='store_true', dest='beacon',
+                      default=False, help='Include beacons')
+    parser.add_option('-d','--digi', action='store_true', dest='digi',
+                      default=False, help='Include digipeaters')
+    parser.add_option('-r','--repeater', action='store_true', dest='repeater',
+                      default=False, help='Include repeaters, the default if no types are given')
+    parser.add_option('-t','--tv', action='store_true', dest='tv',
+                      default=False, help='Include TV repeaters')
+    parser.add_option('-a','--all', action='store_true', dest='allTypes',
+                      default=False, help='Include all types')
+    parser.add_option('-f','--minfreq', action='store', type='float', dest='minFreq',
+                      default=None, help='Filter out all below the specified frequency')
+    parser.add_option('-F','--maxfreq', action='store', type='float', dest='maxFreq',
+                      default=None, help='Filter out all above the specified frequency')
+    parser.add_option('-B','--branch', action='store', type='string', dest='branch',
+                      default=None, help='Filter licences to only include those from the selected branch')
+    repeaters.addDataOptions(parser)
+    (options, args) = parser.parse_args(argv)
+
+    if args:
+        parser.error('Unexpected arguments %s' % ' '.join(args))
+    if options.distance <= 0:
+        parser.error('The distance must be greater than 0')
+    if options.separation < 0:
+        parser.error('The separation must not be negative')
+    if not (options.minFreq == None or options.maxFreq == None):
+        if options.minFreq > options.maxFreq:
+            parser.error('The maximum frequency must be greater than the minimum frequency.')
+    if options.allTypes:
+        options.beacon = options.digi = options.repeater = options.tv = True
+    if not (options.beacon or options.digi or options.repeater or options.tv):
+        options.repeater = True
+    dataDir = repeaters.applyDataOptions(parser, options)
+
+    filters = (options.minFreq, options.maxFreq,
+               options.beacon, options.digi, options.repeater, options.tv,
+               None, None, options.branch, options.noskip)
+    sites, licences, licensees, links = repeaters.loadLicences(dataDir, filters, options.snapshot,
+                                                               options.snapshotAge)
+
+    conflicts = findConflicts(licences, sites, options.distance, options.separation)
+    logging.info('%i conflicts found between %i licences' % (len(conflicts), len(licences)))
+    if options.csvfilename != None:
+        generateCsv(options.csvfilename, conflicts)
+    if options.jsonfilename != None:
+        generateJson(options.jsonfilename, conflicts, options.distance, options.separation,
+                     options.indent)
+    if options.kmlfilename != None:
+        generateKml(options.kmlfilename, conflicts, options.distance, options.separation)
+    if options.csvfilename == None and options.jsonfilename == None and options.kmlfilename == None:
+        writeCsv(sys.stdout, conflicts)
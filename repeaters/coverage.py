@@ -0,0 +1,450 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Terrain aware coverage prediction from a digital elevation model.
+
+The coverage of each site is predicted from a locally supplied elevation
+raster in NZTM (EPSG:2193), which may be:
+
+    .asc            ESRI ASCII grid
+    .flt            ESRI binary grid, with the header in a .hdr file
+    .tif, .tiff     GeoTIFF (requires rasterio)
+
+The terrain is sampled along radial profiles from the site out to the range
+at the resolution of the raster, all the radials of a site at once as NumPy
+arrays. A point is covered if a receiver above it can see the antenna over
+the terrain between them, allowing for the curvature of the earth with the
+usual 4/3 effective earth radius for radio paths, so the radio horizon is
+included. The antenna is above the height of the site from the RSM, or the
+terrain at the site if that is higher. This is a line of sight prediction,
+it does not model diffraction or the link budget.
+
+The coverage of each site is rendered as a PNG image in an NZTM aligned
+square around the site, which is placed in the KML/KMZ outputs as a ground
+overlay with its corners given in latitude and longitude. The sites are
+computed in a process pool, and the results are kept in memory so watch
+mode does not recompute them for each build.
+"""
+
+import concurrent.futures
+import hashlib
+import html
+import math
+import os
+import re
+import struct
+import sys
+import zlib
+
+import numpy
+
+from mapping.nztm import geod_nztm, nztm_geod
+from repeaters.repeaters import DEFAULT_ANTENNA_HEIGHT, DEFAULT_COVERAGE_RANGE
+
+RECEIVER_HEIGHT = 2.0
+# Size of the coverage image pixels in metres
+RESOLUTION = 200.0
+# Effective earth radius for radio paths
+EFFECTIVE_EARTH_RADIUS = 6371000.0 * 4 / 3
+# Colour and alpha of the covered area in the images
+COVERAGE_COLOUR = (0, 192, 0)
+COVERAGE_ALPHA = 110
+KML_GX = 'http://www.google.com/kml/ext/2.2'
+
+# Elevation model of each worker process
+_dem = None
+# Coverage already computed indexed by the elevation model and site parameters
+_cache = {}
+
+class Dem:
+    '''
+    Elevation raster on an NZTM grid, with the rows from north to south
+    '''
+    def __init__(self, heights, west: float, north: float, cellSize: float) -> None:
+        """Constructor for an elevation model
+
+        Args:
+            heights (numpy.ndarray): Heights in metres, NaN where there is no data
+            west (float): Easting of the west edge of the raster
+            north (float): Northing of the north edge of the raster
+            cellSize (float): Size of the cells in metres
+        """
+        # Areas without data (the sea around the land) are at sea level
+        self.heights = numpy.nan_to_num(numpy.asarray(heights, dtype=numpy.float32), nan=0.0)
+        self.west = west
+        self.north = north
+        self.cellSize = cellSize
+
+    def sample(self, easting, northing):
+        """Returns the heights at the given points, 0 outside the raster
+
+        Args:
+            easting (numpy.ndarray): Eastings
+            northing (numpy.ndarray): Northings
+
+        Returns:
+            numpy.ndarray: Heights in metres
+        """
+        rows, cols = self.heights.shape
+        row = numpy.floor((self.north - northing) / self.cellSize).astype(numpy.int64)
+        col = numpy.floor((easting - self.west) / self.cellSize).astype(numpy.int64)
+        inside = (row >= 0) & (row < rows) & (col >= 0) & (col < cols)
+        heights = numpy.zeros(numpy.shape(row), dtype=numpy.float32)
+        heights[inside] = self.heights[row[inside], col[inside]]
+        return heights
+
+def readHeader(lines: 'list[str]') -> dict:
+    """Reads the keys and values of an ESRI grid header
+
+    Args:
+        lines (list[str]): Header lines
+
+    Returns:
+        dict: Values indexed by lower case key
+    """
+    header = {}
+    for line in lines:
+        key, value = line.split()[:2]
+        header[key.lower()] = value
+    return header
+
+def gridOrigin(header: dict, rows: int) -> tuple:
+    """Returns the west and north edges of an ESRI grid from its header
+
+    Args:
+        header (dict): Header values
+        rows (int): Number of rows
+
+    Returns:
+        tuple: west, north and cell size
+    """
+    cellSize = float(header['cellsize'])
+    if 'xllcenter' in header:
+        west = float(header['xllcenter']) - cellSize / 2
+        south = float(header['yllcenter']) - cellSize / 2
+    else:
+        west = float(header['xllcorner'])
+        south = float(header['yllcorner'])
+    return west, south + rows * cellSize, cellSize
+
+def readAsciiGrid(fileName: str) -> Dem:
+    """Reads an ESRI ASCII grid
+
+    Args:
+        fileName (str): Grid file name
+
+    Returns:
+        Dem: Elevation model
+    """
+    with open(fileName) as f:
+        lines = []
+        while len(lines) < 6:
+            position = f.tell()
+            line = f.readline()
+            if not line[:1].isalpha():
+                f.seek(position)
+                break
+            lines.append(line)
+        header = readHeader(lines)
+        rows, cols = int(header['nrows']), int(header['ncols'])
+        heights = numpy.array(f.read().split(), dtype=numpy.float32).reshape(rows, cols)
+    if 'nodata_value' in header:
+        heights[heights == float(header['nodata_value'])] = numpy.nan
+    return Dem(heights, *gridOrigin(header, rows))
+
+def readBinaryGrid(fileName: str) -> Dem:
+    """Reads an ESRI binary grid, 32 bit floats with the header in a .hdr
+    file of the same name
+
+    Args:
+        fileName (str): Grid file name
+
+    Returns:
+        Dem: Elevation model
+    """
+    with open(os.path.splitext(fileName)[0] + '.hdr') as f:
+        header = readHeader([line for line in f if line.strip()])
+    rows, cols = int(header['nrows']), int(header['ncols'])
+    byteOrder = '>' if header.get('byteorder', 'lsbfirst').lower() == 'msbfirst' else '<'
+    heights = numpy.fromfile(fileName, dtype=byteOrder + 'f4').reshape(rows, cols)
+    if 'nodata_value' in header:
+        heights = numpy.where(heights == float(header['nodata_value']), numpy.nan, heights)
+    return Dem(heights, *gridOrigin(header, rows))
+
+def readGeoTiff(fileName: str) -> Dem:
+    """Reads a north up GeoTIFF in NZTM
+
+    Args:
+        fileName (str): GeoTIFF file name
+
+    Returns:
+        Dem: Elevation model
+    """
+    try:
+        import rasterio
+    except ModuleNotFoundError:
+        print('The rasterio module is not installed please convert the elevation',
+              'model to an ESRI grid or install the rasterio package.')
+        sys.exit(1)
+    with rasterio.open(fileName) as src:
+        transform = src.transform
+        if transform.b != 0 or transform.d != 0 or transform.a != -transform.e:
+            raise ValueError('%s is not a north up raster with square cells' % fileName)
+        if src.crs is not None and src.crs.to_epsg() != 2193:
+            raise ValueError('%s is not in NZTM (EPSG:2193)' % fileName)
+        heights = src.read(1, masked=True).astype(numpy.float32).filled(numpy.nan)
+        return Dem(heights, transform.c, transform.f, transform.a)
+
+def loadDem(fileName: str) -> Dem:
+    """Reads an elevation model, the format is selected by the file extension
+
+    Args:
+        fileName (str): Elevation model file name
+
+    Returns:
+        Dem: Elevation model
+    """
+    extension = os.path.splitext(fileName)[1].lower()
+    if extension in ('.tif', '.tiff'):
+        return readGeoTiff(fileName)
+    if extension == '.flt':
+        return readBinaryGrid(fileName)
+    return readAsciiGrid(fileName)
+
+def writeBinaryGrid(fileName: str, dem: Dem) -> None:
+    """Writes an ESRI binary grid and its .hdr file
+
+    Args:
+        fileName (str): Grid file name
+        dem (Dem): Elevation model
+    """
+    rows, cols = dem.heights.shape
+    with open(os.path.splitext(fileName)[0] + '.hdr', 'w') as f:
+        f.write('ncols %i\nnrows %i\nxllcorner %r\nyllcorner %r\ncellsize %r\n'
+                'nodata_value -9999\nbyteorder LSBFIRST\n' % (
+                cols, rows, dem.west, dem.north - rows * dem.cellSize, dem.cellSize))
+    dem.heights.astype('<f4').tofile(fileName)
+
+def siteCoverage(dem: Dem, easting: float, northing: float, height: float,
+                 antennaHeight: float=DEFAULT_ANTENNA_HEIGHT,
+                 maxRange: float=DEFAULT_COVERAGE_RANGE * 1000,
+                 resolution: float=RESOLUTION):
+    """Predicts the line of sight coverage of a site
+
+    Args:
+        dem (Dem): Elevation model
+        easting (float): NZTM easting of the site
+        northing (float): NZTM northing of the site
+        height (float): Height of the site above sea level in metres
+        antennaHeight (float, optional): Height of the antenna above the site in metres. Defaults to DEFAULT_ANTENNA_HEIGHT.
+        maxRange (float, optional): Range in metres. Defaults to DEFAULT_COVERAGE_RANGE km.
+        resolution (float, optional): Size of the coverage pixels in metres. Defaults to RESOLUTION.
+
+    Returns:
+        numpy.ndarray: Covered pixels in a square centred on the site, rows from north to south
+    """
+    ground = max(float(height), float(dem.sample(numpy.array([easting]), numpy.array([northing]))[0]))
+    antenna = ground + antennaHeight
+
+    # Radial profiles, enough radials to be a pixel apart at the range
+    step = dem.cellSize
+    samples = max(1, int(math.ceil(maxRange / step)))
+    radials = max(8, int(math.ceil(2 * math.pi * maxRange / resolution)))
+    distances = step * numpy.arange(1, samples + 1)
+    bearings = 2 * math.pi * numpy.arange(radials) / radials
+    terrain = dem.sample(easting + numpy.outer(numpy.sin(bearings), distances),
+                         northing + numpy.outer(numpy.cos(bearings), distances))
+    terrain = terrain - distances ** 2 / (2 * EFFECTIVE_EARTH_RADIUS)
+
+    # Elevation of the terrain and of a receiver at each point as seen from
+    # the antenna, a receiver is visible if it is above the highest terrain
+    # closer to the antenna
+    terrainAngle = (terrain - antenna) / distances
+    receiverAngle = (terrain + RECEIVER_HEIGHT - antenna) / distances
+    horizon = numpy.maximum.accumulate(terrainAngle, axis=1)
+    horizon = numpy.hstack([numpy.full((radials, 1), -numpy.inf), horizon[:, :-1]])
+    visible = receiverAngle >= horizon
+
+    # Look up the radial sample closest to each pixel
+    pixels = 2 * int(math.ceil(maxRange / resolution))
+    offsets = (numpy.arange(pixels) + 0.5) * resolution - pixels * resolution / 2
+    dx, dy = numpy.meshgrid(offsets, -offsets)
+    radius = numpy.hypot(dx, dy)
+    radial = numpy.rint(numpy.arctan2(dx, dy) % (2 * math.pi) / (2 * math.pi / radials)).astype(numpy.int64) % radials
+    sample = numpy.clip(numpy.rint(radius / step).astype(numpy.int64) - 1, 0, samples - 1)
+    return (radius <= maxRange) & (visible[radial, sample] | (radius < step))
+
+def pngImage(mask, colour: tuple=COVERAGE_COLOUR, alpha: int=COVERAGE_ALPHA) -> bytes:
+    """Returns a two colour PNG image of a mask, transparent where it is
+    False and the colour where it is True
+
+    Args:
+        mask (numpy.ndarray): Mask
+        colour (tuple, optional): Red, green and blue. Defaults to COVERAGE_COLOUR.
+        alpha (int, optional): Opacity of the colour. Defaults to COVERAGE_ALPHA.
+
+    Returns:
+        bytes: PNG image
+    """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    rows, cols = mask.shape
+    # One bit per pixel, each row starting with filter type 0
+    packed = numpy.packbits(mask.astype(numpy.uint8), axis=1)
+    scanlines = numpy.hstack([numpy.zeros((rows, 1), dtype=numpy.uint8), packed])
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', cols, rows, 1, 3, 0, 0, 0)) +
+            chunk(b'PLTE', bytes((0, 0, 0) + tuple(colour))) +
+            chunk(b'tRNS', bytes((0, alpha))) +
+            chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 9)) +
+            chunk(b'IEND', b''))
+
+class Coverage:
+    '''
+    Coverage image of a site with the position of its corners
+    '''
+    def __init__(self, siteName: str, image: bytes, corners: list) -> None:
+        """Constructor for the coverage of a site
+
+        Args:
+            siteName (str): Name of the site
+            image (bytes): PNG image
+            corners (list): Longitude and latitude of the lower left, lower right, upper right and upper left corners
+        """
+        self.siteName = siteName
+        self.image = image
+        self.corners = corners
+        # Site names differing only in punctuation or case give the same
+        # readable part, the hash of the name keeps the image names unique
+        self.imageName = '%s_%s.png' % (re.sub('[^a-z0-9]+', '_', siteName.lower()).strip('_'),
+                                        hashlib.sha1(siteName.encode('utf-8')).hexdigest()[:8])
+
+    def kmlOverlay(self, prefix: str) -> str:
+        """Returns a KML ground overlay of the coverage image
+
+        Args:
+            prefix (str): Path of the folder holding the images relative to the KML file
+
+        Returns:
+            str: KML ground overlay
+        """
+        overlay = '    <GroundOverlay xmlns:gx="%s">\n' % KML_GX
+        overlay += '      <name>%s</name>\n' % html.escape(self.siteName)
+        overlay += '      <visibility>0</visibility>\n'
+        overlay += '      <Icon><href>%s</href></Icon>\n' % html.escape(prefix + self.imageName)
+        overlay += '      <gx:LatLonQuad><coordinates>%s</coordinates></gx:LatLonQuad>\n' % ' '.join(
+            '%f,%f' % corner for corner in self.corners)
+        overlay += '    </GroundOverlay>\n'
+        return overlay
+
+def coverageTask(siteName: str, lat: float, lon: float, height: int,
+                 antennaHeight: float, maxRange: float) -> Coverage:
+    """Computes the coverage of a site with the elevation model of the
+    process
+
+    Args:
+        siteName (str): Name of the site
+        lat (float): Latitude of the site
+        lon (float): Longitude of the site
+        height (int): Height of the site above sea level in metres
+        antennaHeight (float): Height of the antenna above the site in metres
+        maxRange (float): Range in metres
+
+    Returns:
+        Coverage: Coverage of the site
+    """
+    easting, northing = geod_nztm(math.radians(lat), math.radians(lon))
+    mask = siteCoverage(_dem, easting, northing, height, antennaHeight, maxRange)
+    half = mask.shape[0] * RESOLUTION / 2
+    corners = []
+    for e, n in ((-half, -half), (half, -half), (half, half), (-half, half)):
+        cornerLat, cornerLon = nztm_geod(easting + e, northing + n)
+        corners.append((math.degrees(cornerLon), math.degrees(cornerLat)))
+    return Coverage(siteName, pngImage(mask), corners)
+
+def initWorker(demFile: str) -> None:
+    """Loads the elevation model in a worker process
+
+    Args:
+        demFile (str): Elevation model file name
+    """
+    global _dem
+    _dem = loadDem(demFile)
+
+def computeCoverage(demFile: str, sites: list, rangeKm: float=DEFAULT_COVERAGE_RANGE,
+                    antennaHeight: float=DEFAULT_ANTENNA_HEIGHT,
+                    workers: int=None) -> 'list[Coverage]':
+    """Computes the coverage of the sites in a process pool, coverage
+    computed earlier with the same elevation model and parameters is reused
+
+    Args:
+        demFile (str): Elevation model file name
+        sites (list): Sites
+        rangeKm (float, optional): Range in km. Defaults to DEFAULT_COVERAGE_RANGE.
+        antennaHeight (float, optional): Height of the antenna above the site in metres. Defaults to DEFAULT_ANTENNA_HEIGHT.
+        workers (int, optional): Number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        list[Coverage]: Coverage of each site in site name order
+    """
+    demKey = (os.path.abspath(demFile), os.stat(demFile).st_mtime_ns)
+    tasks = {}
+    for site in sorted(sites, key=lambda site: site.name):
+        key = (demKey, site.name, site.coordinates.lat, site.coordinates.lon, site.height,
+               antennaHeight, rangeKm)
+        if key not in _cache:
+            tasks[key] = (site.name, site.coordinates.lat, site.coordinates.lon, site.height,
+                          antennaHeight, rangeKm * 1000)
+
+    if len(tasks) == 1 or workers == 1:
+        initWorker(demFile)
+        for key, task in tasks.items():
+            _cache[key] = coverageTask(*task)
+    elif tasks:
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=initWorker,
+                                                    initargs=(demFile,)) as pool:
+            futures = {key: pool.submit(coverageTask, *task) for key, task in tasks.items()}
+            for key, future in futures.items():
+                _cache[key] = future.result()
+
+    return [_cache[(demKey, site.name, site.coordinates.lat, site.coordinates.lon, site.height,
+                    antennaHeight, rangeKm)]
+            for site in sorted(sites, key=lambda site: site.name)]
+
+def kmlCoverage(coverage: 'list[Coverage]', prefix: str) -> str:
+    """Returns a KML folder of the coverage ground overlays, hidden until
+    selected
+
+    Args:
+        coverage (list[Coverage]): Coverage of the sites
+        prefix (str): Path of the folder holding the images relative to the KML file
+
+    Returns:
+        str: KML folder
+    """
+    kml = '    <Folder><name>Coverage</name><open>0</open><visibility>0</visibility>\n'
+    kml += '       <description>Predicted line of sight coverage of each site</description>\n'
+    for siteCoverage in coverage:
+        kml += siteCoverage.kmlOverlay(prefix)
+    kml += '    </Folder>\n'
+    return kml
@@ -6,6 +6,7 @@
 # Requirements:
 #    bash
 #    zip
+#    sha256sum
 
 # update the version marker file
 rm version
@@ -15,3 +16,9 @@ mv data.zip data.zip.bak
 
 zip -q data.zip *.csv ${DB_SQLITE}
 
+# checksum verified by rpt -u before extracting
+sha256sum data.zip > data.zip.sha256
+
+# For delta updates publish with the manifest and patches instead, eg
+#   python -m repeaters.update . /path/to/published/data
+
@@ -0,0 +1,204 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+"""Stage timing and profiling of a build.
+
+Stages are timed with the stage() context manager, which does nothing
+unless profiling has been started with startProfile(). Stages may be nested,
+eg the CSV reading within loading the licence information. The number of
+bytes written to each output is recorded with output().
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+_profile = None
+
+class Profile:
+    '''
+    Timings and counters collected during a build
+    '''
+    def __init__(self, memory: bool=True, stats: bool=False) -> None:
+        """Constructor for a profile
+
+        Args:
+            memory (bool, optional): Trace the peak memory use with tracemalloc. Defaults to True.
+            stats (bool, optional): Run cProfile for the whole build. Defaults to False.
+        """
+        self.start = time.perf_counter()
+        self.end = None
+        self.stages = []
+        self.depth = 0
+        self.counters = {}
+        self.outputs = {}
+        self.peakMemory = None
+        self.memory = memory
+        self.profiler = None
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+        if stats:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop(self) -> None:
+        """Stops collecting timings, memory use and cProfile statistics
+        """
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.memory:
+            import tracemalloc
+            self.peakMemory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def elapsed(self) -> float:
+        """Returns the total time of the build
+
+        Returns:
+            float: Time in seconds
+        """
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def summary(self) -> str:
+        """Returns a table of the stage times, counters, output sizes and peak memory
+
+        Returns:
+            str: Summary table
+        """
+        total = self.elapsed()
+        lines = ['%-36s %10s %6s' % ('Stage', 'Time (s)', '%')]
+        for name, depth, start, duration in self.stages:
+            lines.append('%-36s %10.3f %6.1f' % ('  ' * depth + name, duration,
+                                                 duration * 100 / total if total else 0.0))
+        lines.append('%-36s %10.3f %6.1f' % ('Total', total, 100.0))
+        if self.counters:
+            lines.append('')
+            lines.append('%-36s %10s' % ('Counter', 'Value'))
+            for name, value in self.counters.items():
+                if type(value) is float:
+                    lines.append('%-36s %10.3f' % (name, value))
+                else:
+                    lines.append('%-36s %10i' % (name, value))
+        if self.outputs:
+            lines.append('')
+            lines.append('%-36s %10s' % ('Output', 'Bytes'))
+            for name, size in self.outputs.items():
+                lines.append('%-36s %10i' % (name, size))
+        if self.peakMemory is not None:
+            lines.append('')
+            lines.append('%-36s %10.1f' % ('Peak memory (MiB)', self.peakMemory / 1048576))
+        return '\n'.join(lines)
+
+    def writeTrace(self, fileName: str) -> None:
+        """Writes the stage timings as a Chrome trace event file, which can
+        be loaded in chrome://tracing or https://ui.perfetto.dev
+
+        Args:
+            fileName (str): Trace file name
+        """
+        pid = os.getpid()
+        tid = threading.get_ident()
+        events = [{'name': name, 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': (start - self.start) * 1e6, 'dur': duration * 1e6}
+                  for name, depth, start, duration in self.stages]
+        events.append({'name': 'counters', 'ph': 'C', 'pid': pid, 'tid': tid,
+                       'ts': self.elapsed() * 1e6,
+                       'args': dict(self.counters, **self.outputs)})
+        with open(fileName, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def dumpStats(self, fileName: str) -> None:
+        """Writes the cProfile statistics, which can be read with pstats or
+        snakeviz
+
+        Args:
+            fileName (str): Statistics file name
+        """
+        if self.profiler is not None:
+            self.profiler.dump_stats(fileName)
+
+def startProfile(memory: bool=True, stats: bool=False) -> Profile:
+    """Starts profiling the build
+
+    Args:
+        memory (bool, optional): Trace the peak memory use with tracemalloc. Defaults to True.
+        stats (bool, optional): Run cProfile for the whole build. Defaults to False.
+
+    Returns:
+        Profile: The new profile
+    """
+    global _profile
+    _profile = Profile(memory, stats)
+    return _profile
+
+def currentProfile() -> Profile:
+    """Returns the current profile
+
+    Returns:
+        Profile: The current profile or None if not profiling
+    """
+    return _profile
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Context manager timing a stage of the build if profiling
+
+    Args:
+        name (str): Name of the stage
+    """
+    profile = _profile
+    if profile is None or profile.end is not None:
+        yield
+        return
+    entry = [name, profile.depth, time.perf_counter(), 0.0]
+    profile.stages.append(entry)
+    profile.depth += 1
+    try:
+        yield
+    finally:
+        profile.depth -= 1
+        entry[3] = time.perf_counter() - entry[2]
+
+def count(name: str, value=1) -> None:
+    """Adds to a counter if profiling
+
+    Args:
+        name (str): Name of the counter
+        value (optional): Amount to add. Defaults to 1.
+    """
+    if _profile is not None:
+        _profile.counters[name] = _profile.counters.get(name, 0) + value
+
+def output(fileName: str) -> None:
+    """Records the size of an output file if profiling
+
+    Args:
+        fileName (str): Output file name
+    """
+    if _profile is not None and os.path.isfile(fileName):
+        _profile.outputs[fileName] = os.path.getsize(fileName)
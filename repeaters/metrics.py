@@ -0,0 +1,214 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+"""Build metrics for monitoring unattended runs.
+
+The metrics are written as JSON, or in the Prometheus text exposition
+format when the file name ends in .prom so the file can be picked up by
+the node exporter textfile collector. Files are written to a temporary file
+and renamed so a collector never reads a partial file.
+"""
+
+import datetime
+import json
+
+from rsmapi import session as rsmSession
+
+from repeaters import instrument
+from repeaters.publish import atomicFile
+from repeaters.repeaters import Licence, Link, Site, STYLE_NAMES
+
+PREFIX = 'nzrepeaters_'
+SKIPPED_COUNTER = 'skipped: '
+QUANTILES = (0.5, 0.9, 0.99)
+
+def percentile(values: list, q: float) -> float:
+    """Returns the given percentile of the values using linear interpolation
+
+    Args:
+        values (list): Sorted values
+        q (float): Percentile as a fraction between 0 and 1
+
+    Returns:
+        float: Percentile or None if there are no values
+    """
+    if not values:
+        return None
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def stageTimes(profile: instrument.Profile) -> dict:
+    """Returns the stage times indexed by the path of the stage, eg
+    loadLicenceInfo/readCsv
+
+    Args:
+        profile (instrument.Profile): Profile of the build
+
+    Returns:
+        dict: Stage times in seconds
+    """
+    times = {}
+    path = []
+    for name, depth, start, duration in profile.stages:
+        path = path[:depth] + [name]
+        key = '/'.join(path)
+        times[key] = times.get(key, 0.0) + duration
+    return times
+
+def collectMetrics(profile: instrument.Profile, licences: Licence, sites: Site,
+                   links: Link) -> dict:
+    """Collects the metrics for a build
+
+    Args:
+        profile (instrument.Profile): Profile of the build
+        licences (Licence): licences included in the outputs
+        sites (Site): sites included in the outputs
+        links (Link): links included in the outputs
+
+    Returns:
+        dict: Metrics
+    """
+    latencies = sorted(rsmSession.latencies)
+    licenceTypes = {}
+    bands = {}
+    typeBands = {}
+    for licence in licences.values():
+        licType = STYLE_NAMES[licence.licType]
+        band = licence.band()
+        licenceTypes[licType] = licenceTypes.get(licType, 0) + 1
+        bands[band] = bands.get(band, 0) + 1
+        typeBands.setdefault(licType, {})
+        typeBands[licType][band] = typeBands[licType].get(band, 0) + 1
+    linkTypes = {}
+    for link in links:
+        subType = link.subType if link.subType else 'other'
+        linkTypes[subType] = linkTypes.get(subType, 0) + 1
+
+    return {'timestamp': datetime.datetime.now().timestamp(),
+            'duration': profile.elapsed(),
+            'stages': stageTimes(profile),
+            'api': {'requests': rsmSession.stats['requests'],
+                    'replayed': rsmSession.stats['replayed'],
+                    'bytes': rsmSession.stats['bytes'],
+                    'requestTime': rsmSession.stats['requestTime'],
+                    'delayTime': rsmSession.stats['delayTime'],
+                    'latency': {str(q): percentile(latencies, q) for q in QUANTILES}},
+            'licences': {'total': len(licences),
+                         'byType': licenceTypes,
+                         'byBand': bands,
+                         'byTypeBand': typeBands},
+            'sites': len(sites),
+            'links': {'total': len(links),
+                      'bySubType': linkTypes},
+            'skipped': {name[len(SKIPPED_COUNTER):]: value
+                        for name, value in profile.counters.items()
+                        if name.startswith(SKIPPED_COUNTER)},
+            'missingInfo': profile.counters.get('missing info record', 0),
+            'snapshot': {'hits': profile.counters.get('Snapshot hits', 0),
+                         'misses': profile.counters.get('Snapshot misses', 0)},
+            'outputs': dict(profile.outputs)}
+
+def escapeLabel(value: str) -> str:
+    """Escapes a Prometheus label value
+
+    Args:
+        value (str): Label value
+
+    Returns:
+        str: Escaped label value
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def formatPrometheus(metrics: dict) -> str:
+    """Formats the metrics in the Prometheus text exposition format
+
+    Args:
+        metrics (dict): Metrics from collectMetrics()
+
+    Returns:
+        str: Metrics text
+    """
+    lines = []
+    def metric(name, kind, help, samples):
+        lines.append('# HELP %s%s %s' % (PREFIX, name, help))
+        lines.append('# TYPE %s%s %s' % (PREFIX, name, kind))
+        for labels, value, suffix in samples:
+            if value is None:
+                continue
+            labelText = ','.join('%s="%s"' % (k, escapeLabel(v)) for k, v in labels)
+            lines.append('%s%s%s%s %s' % (PREFIX, name, suffix,
+                                          '{%s}' % labelText if labelText else '',
+                                          repr(float(value)) if type(value) is float else value))
+
+    api = metrics['api']
+    metric('build_timestamp_seconds', 'gauge', 'Time the build finished',
+           [((), metrics['timestamp'], '')])
+    metric('build_duration_seconds', 'gauge', 'Wall time of the build',
+           [((), metrics['duration'], '')])
+    metric('stage_duration_seconds', 'gauge', 'Wall time of each stage of the build',
+           [((('stage', stage),), elapsed, '') for stage, elapsed in metrics['stages'].items()])
+    metric('api_requests', 'gauge', 'RSM API requests made or replayed',
+           [((('source', 'network'),), api['requests'], ''),
+            ((('source', 'replay'),), api['replayed'], '')])
+    metric('api_received_bytes', 'gauge', 'Bytes received from the RSM API',
+           [((), api['bytes'], '')])
+    metric('api_delay_seconds', 'gauge', 'Time spent in the RSM API rate limit delay',
+           [((), api['delayTime'], '')])
+    metric('api_request_latency_seconds', 'summary', 'RSM API request latency',
+           [((('quantile', q),), value, '') for q, value in api['latency'].items()] +
+           [((), api['requestTime'], '_sum'), ((), api['requests'], '_count')])
+    metric('licences', 'gauge', 'Licences by type and band',
+           [((('type', licType), ('band', band)), count, '')
+            for licType, bands in metrics['licences']['byTypeBand'].items()
+            for band, count in bands.items()])
+    metric('sites', 'gauge', 'Sites with licences',
+           [((), metrics['sites'], '')])
+    metric('links', 'gauge', 'Links by sub type',
+           [((('subtype', subType),), count, '')
+            for subType, count in metrics['links']['bySubType'].items()])
+    metric('skipped_licences', 'gauge', 'Licences skipped by reason',
+           [((('reason', reason),), count, '') for reason, count in metrics['skipped'].items()])
+    metric('missing_info_licences', 'gauge', 'Licences without an info record',
+           [((), metrics['missingInfo'], '')])
+    metric('snapshot_loads', 'gauge', 'Snapshot loads by result',
+           [((('result', 'hit'),), metrics['snapshot']['hits'], ''),
+            ((('result', 'miss'),), metrics['snapshot']['misses'], '')])
+    metric('output_bytes', 'gauge', 'Size of each output file',
+           [((('file', fileName),), size, '') for fileName, size in metrics['outputs'].items()])
+    return '\n'.join(lines) + '\n'
+
+def writeMetrics(fileName: str, metrics: dict) -> None:
+    """Writes the metrics to the given file, in the Prometheus text format if
+    the file name ends in .prom otherwise as JSON
+
+    Args:
+        fileName (str): Metrics file name
+        metrics (dict): Metrics from collectMetrics()
+    """
+    if fileName.endswith('.prom'):
+        text = formatPrometheus(metrics)
+    else:
+        text = json.dumps(metrics, indent=2)
+    with atomicFile(fileName) as tempName:
+        with open(tempName, 'w') as f:
+            f.write(text)
@@ -0,0 +1,322 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Linked repeater networks.
+
+The links from links.csv join licences into networks, eg the National
+System. The links are held as a graph with adjacency lists keyed by licence
+number, from which the connected networks, the licences
+reachable from a licence and the shortest path (fewest links) between two
+licences are found with breadth first searches, so each takes time linear
+in the number of licences and links. The networks are written as JSON or
+as KML with a folder of sites and links for each network:
+
+    rpt networks -k networks.kml -J networks.json
+    rpt networks --from 177300 -k reachable.kml
+    rpt networks --path 177300,177299
+"""
+
+import collections
+import datetime
+import html
+import json
+import logging
+import optparse
+
+from repeaters import repeaters
+from repeaters.publish import atomicFile
+from repeaters.repeaters import distance, kmlFooter, kmlHeader, kmlStyleLinks, kmlStylesSites
+
+class Network:
+    '''
+    Licences connected to each other by links
+    '''
+    def __init__(self, graph: 'LinkGraph', numbers: 'list[int]') -> None:
+        """Constructor for a network
+
+        Args:
+            graph (LinkGraph): Graph the network is part of
+            numbers (list[int]): Licence numbers in the network
+        """
+        self.numbers = sorted(numbers)
+        self.links = []
+        degree = {}
+        for number in self.numbers:
+            degree[number] = len(graph.adjacency[number])
+            for neighbour, link in graph.adjacency[number]:
+                if number < neighbour or (number == neighbour and link not in self.links):
+                    self.links.append(link)
+        self.sites = sorted(set(graph.byNumber[number].site for number in self.numbers))
+        # The licence with the most links, the lowest number if there is a tie
+        self.hub = graph.byNumber[max(self.numbers, key=lambda number: (degree[number], -number))]
+        subTypes = collections.Counter(link.subType for link in self.links)
+        self.subType = subTypes.most_common(1)[0][0] if self.links else ''
+        self.name = self.hub.name + (' (%s)' % self.subType if self.subType else '')
+        self.length = sum(distance(link.end1, link.end2.lat, link.end2.lon) for link in self.links)
+        self.bands = sorted(set(graph.byNumber[number].band() for number in self.numbers))
+        self.licences = [graph.byNumber[number] for number in self.numbers]
+
+    def record(self) -> dict:
+        """Returns a dictionary of the network for JSON output
+
+        Returns:
+            dict: Network record
+        """
+        return {'name': self.name,
+                'subType': self.subType,
+                'hub': self.hub.number,
+                'lengthKm': round(self.length, 1),
+                'bands': self.bands,
+                'sites': self.sites,
+                'licences': [{'number': licence.number,
+                              'name': licence.name,
+                              'callsign': licence.callsign,
+                              'frequency': licence.frequency,
+                              'site': licence.site}
+                             for licence in self.licences],
+                'links': [dict(link.jsonRecord(), licences=list(link.numbers))
+                          for link in self.links]}
+
+    def summary(self) -> str:
+        """Returns a one line summary of the network
+
+        Returns:
+            str: Summary
+        """
+        return '%s: %i licences at %i sites, %i links, %.0f km, hub %i %s' % (
+            self.name, len(self.licences), len(self.sites), len(self.links),
+            self.length, self.hub.number, self.hub.name)
+
+    def kmlFolder(self, sites: dict) -> str:
+        """Returns a KML folder of the sites and links of the network
+
+        Args:
+            sites (dict): Sites indexed by name
+
+        Returns:
+            str: KML folder
+        """
+        kml = '    <Folder><name>%s</name><open>0</open>\n' % html.escape(self.name)
+        kml += '       <description>%s</description>\n' % html.escape(self.summary())
+        for site in self.sites:
+            kml += sites[site].kmlPlacemark()
+        for link in self.links:
+            kml += link.kmlPlacemark()
+        kml += '    </Folder>\n'
+        return kml
+
+class LinkGraph:
+    '''
+    Graph of the licences joined by links
+    '''
+    def __init__(self, links: 'list[repeaters.Link]', licences: dict) -> None:
+        """Constructor for the graph
+
+        Args:
+            links (list[repeaters.Link]): Links between licences
+            licences (dict): Licences indexed by licence number and frequency
+        """
+        self.byNumber = {}
+        for licence in licences.values():
+            self.byNumber.setdefault(licence.number, licence)
+        self.adjacency = {}
+        for link in links:
+            end1, end2 = link.numbers
+            if end1 not in self.byNumber or end2 not in self.byNumber:
+                continue
+            self.adjacency.setdefault(end1, []).append((end2, link))
+            self.adjacency.setdefault(end2, []).append((end1, link))
+
+    def search(self, start: int) -> dict:
+        """Breadth first search from a licence
+
+        Args:
+            start (int): Licence number
+
+        Returns:
+            dict: Licence number each reachable licence was reached from indexed by licence number, None for the start
+        """
+        parents = {start: None}
+        queue = collections.deque([start])
+        while queue:
+            number = queue.popleft()
+            for neighbour, link in self.adjacency.get(number, ()):
+                if neighbour not in parents:
+                    parents[neighbour] = number
+                    queue.append(neighbour)
+        return parents
+
+    def reachable(self, number: int) -> 'set[int]':
+        """Returns the licences reachable from a licence, including itself
+
+        Args:
+            number (int): Licence number
+
+        Returns:
+            set[int]: Licence numbers
+        """
+        return set(self.search(number))
+
+    def path(self, start: int, end: int) -> 'list[int]':
+        """Returns the path with the fewest links between two licences
+
+        Args:
+            start (int): Licence number to start from
+            end (int): Licence number to finish at
+
+        Returns:
+            list[int]: Licence numbers along the path including both ends, None if they are not connected
+        """
+        parents = self.search(start)
+        if end not in parents:
+            return None
+        path = [end]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+        return path[::-1]
+
+    def networks(self) -> 'list[Network]':
+        """Returns the connected networks, largest first
+
+        Returns:
+            list[Network]: Networks
+        """
+        seen = set()
+        networks = []
+        for number in sorted(self.adjacency):
+            if number not in seen:
+                component = self.search(number)
+                seen.update(component)
+                networks.append(Network(self, component))
+        networks.sort(key=lambda network: (-len(network.numbers), network.name))
+        return networks
+
+def generateJson(fileName: str, networks: 'list[Network]', indent: int=None) -> None:
+    """Generates a JSON file of the networks
+
+    Args:
+        fileName (str): JSON file name
+        networks (list[Network]): Networks
+        indent (int, optional): Indentation. Defaults to None.
+    """
+    with atomicFile(fileName) as tempName:
+        with open(tempName, 'w') as f:
+            json.dump({'generated': datetime.datetime.now().isoformat(),
+                       'networks': [network.record() for network in networks]}, f, indent=indent)
+
+def generateKml(fileName: str, networks: 'list[Network]', sites: dict) -> None:
+    """Generates a KML file with a folder for each network
+
+    Args:
+        fileName (str): KML file name
+        networks (list[Network]): Networks
+        sites (dict): Sites indexed by name
+    """
+    kml = kmlHeader()
+    kml += kmlStylesSites()
+    kml += kmlStyleLinks() + '\n'
+    kml += '    <name>Linked networks</name><open>1</open>\n'
+    for network in networks:
+        kml += network.kmlFolder(sites)
+    kml += kmlFooter()
+    with atomicFile(fileName) as tempName:
+        with open(tempName, 'w') as f:
+            f.write(kml)
+
+def licenceNumber(parser: optparse.OptionParser, graph: LinkGraph, value: str) -> int:
+    """Returns the licence number given as an option, exiting with an error
+    if it is not a linked licence
+
+    Args:
+        parser (optparse.OptionParser): Option parser for reporting errors
+        graph (LinkGraph): Graph of the links
+        value (str): Option value
+
+    Returns:
+        int: Licence number
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        parser.error('%s is not a licence number' % value)
+    if number not in graph.byNumber:
+        parser.error('Licence %i is not in the selected licences' % number)
+    return number
+
+def main(argv: list=None) -> None:
+    """Main for rpt networks
+
+    Args:
+        argv (list, optional): Command line arguments after networks. Defaults to sys.argv[1:].
+    """
+    parser = optparse.OptionParser(usage='%prog networks [options]')
+    parser.add_option('--from', action='store', type='string', dest='start',
+                      default=None, help='Only output the network containing the given licence number')
+    parser.add_option('--path', action='store', type='string', dest='path',
+                      default=None, help='Print the path with the fewest links between two licence numbers separated by a comma')
+    parser.add_option('-J','--json', action='store', type='string', dest='jsonfilename',
+                      default=None, help='Output the networks to a JSON file')
+    parser.add_option('-k','--kml', action='store', type='string', dest='kmlfilename',
+                      default=None, help='Output the networks to a kml file with a folder for each network')
+    parser.add_option('--indent', action='store', type='int', dest='indent',
+                      default=None, help='Indentation for the JSON file')
+    repeaters.addDataOptions(parser)
+    (options, args) = parser.parse_args(argv)
+
+    if args:
+        parser.error('Unexpected arguments %s' % ' '.join(args))
+    dataDir = repeaters.applyDataOptions(parser, options)
+
+    # Links may join any type of licence so all types are loaded
+    filters = (None, None, True, True, True, True, None, None, None, options.noskip)
+    sites, licences, licensees, links = repeaters.loadLicences(dataDir, filters, options.snapshot,
+                                                               options.snapshotAge)
+
+    graph = LinkGraph(links, licences)
+    if options.path is not None:
+        ends = options.path.split(',')
+        if len(ends) != 2:
+            parser.error('The path must be two licence numbers separated by a comma')
+        start, end = (licenceNumber(parser, graph, value) for value in ends)
+        path = graph.path(start, end)
+        if path is None:
+            print('Licences %i and %i are not linked' % (start, end))
+        else:
+            for number in path:
+                licence = graph.byNumber[number]
+                print('%i %s %0.4f MHz %s' % (number, licence.name, licence.frequency, licence.site))
+
+    if options.start is not None:
+        start = licenceNumber(parser, graph, options.start)
+        if start not in graph.adjacency:
+            parser.error('Licence %i is not linked to any other licence' % start)
+        networks = [Network(graph, graph.reachable(start))]
+    else:
+        networks = graph.networks()
+    logging.info('%i networks found from %i links' % (len(networks), len(links)))
+    if options.jsonfilename != None:
+        generateJson(options.jsonfilename, networks, options.indent)
+    if options.kmlfilename != None:
+        generateKml(options.kmlfilename, networks, sites)
+    if options.path is None and options.jsonfilename == None and options.kmlfilename == None:
+        for network in networks:
+            print(network.summary())
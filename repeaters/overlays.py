@@ -0,0 +1,310 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Loading of the data files overlaid on the RSM licence information.
+
+The callsign, CTCSS, info, skip, links, band plan and offset files are read
+with one loader
+which checks each row against the schema of the file: the number of columns
+and the type of each column. Comment rows (starting with #) and blank rows
+are ignored in every file. Rows that do not match the schema are left out
+and collected with their file and line number, along with rows repeating the
+licence number of an earlier row with different values (the later row is
+used), so all the problems in the data files are reported together rather
+than one log line at a time.
+
+The parsed files are cached in the data folder. A file is only parsed again
+when its size or modification time has changed and its SHA-256 hash no
+longer matches the cached copy, so builds where the data files have not
+changed skip the parsing completely.
+"""
+
+import csv
+import hashlib
+import logging
+import os
+import pickle
+
+from repeaters import instrument
+from repeaters.publish import atomicFile
+from repeaters.repeaters import Ctcss, dataFile
+
+CACHE_FILE = '.overlays.cache'
+# Increase when the parsed form of the files changes to discard old caches
+CACHE_VERSION = 2
+
+# Columns of each data file as (name, type) and whether extra columns are
+# ignored (True) or make the row malformed (False)
+SCHEMAS = {'bandplan.csv': ((('minimum', float), ('maximum', float), ('offset', float),
+                             ('name', str)), True),
+           'callsigns.csv': ((('licence', int), ('callsign', str)), True),
+           'ctcss.csv': ((('licence', int), ('frequency', float), ('note', str)), True),
+           'info.csv': ((('licence', int), ('name', str), ('branch', str),
+                         ('trustee1', str), ('trustee2', str), ('note', str)), False),
+           'skip.csv': ((('licence', int), ('frequency', float), ('note', str)), False),
+           'links.csv': ((('end1', int), ('end2', int), ('name', str)), True),
+           'offsets.csv': ((('licence', int), ('offset', float), ('note', str)), True)}
+# Overlays attribute holding each data file
+ATTRIBUTES = {'bandplan.csv': 'bandPlan',
+              'callsigns.csv': 'callsigns',
+              'ctcss.csv': 'ctcss',
+              'info.csv': 'info',
+              'skip.csv': 'skip',
+              'links.csv': 'links',
+              'offsets.csv': 'offsets'}
+# Data files that are treated as empty if neither the data folder nor the
+# program has a copy
+OPTIONAL_FILES = ('offsets.csv',)
+
+def parseRows(fileName: str, schema: tuple) -> tuple:
+    """Reads a data file and converts the rows to the types in the schema
+
+    Args:
+        fileName (str): Data file name
+        schema (tuple): Columns and whether extra columns are allowed
+
+    Returns:
+        tuple: List of (line number, values) and list of (line number, reason, row) problems
+    """
+    columns, extra = schema
+    rows = []
+    problems = []
+    with open(fileName, newline='') as f:
+        reader = csv.reader(f)
+        for row in reader:
+            line = reader.line_num
+            if not ''.join(row).strip() or row[0].lstrip().startswith('#'):
+                continue
+            if len(row) < len(columns) or (len(row) > len(columns) and not extra):
+                problems.append((line, 'expected %i columns, found %i' % (len(columns), len(row)), row))
+                continue
+            values = []
+            for (name, kind), value in zip(columns, row):
+                try:
+                    values.append(kind(value))
+                except ValueError:
+                    problems.append((line, '%s "%s" is not a valid %s' % (name, value, kind.__name__), row))
+                    break
+            else:
+                rows.append((line, values))
+    return rows, problems
+
+def indexRows(name: str, rows: list, problems: list):
+    """Indexes the rows of a data file, rows repeating the key of an
+    earlier row with different values replace it and are noted as problems
+
+    Args:
+        name (str): Data file name
+        rows (list): Rows from parseRows()
+        problems (list): Problems to add to
+
+    Returns:
+        The index, a list for the links and band plan files otherwise a dictionary
+    """
+    if name == 'links.csv':
+        return [tuple(values[:3]) for line, values in rows]
+    if name == 'bandplan.csv':
+        bandPlan = []
+        for line, values in rows:
+            if values[0] > values[1]:
+                problems.append((line, 'minimum %g is above the maximum %g' % (values[0], values[1]), None))
+            else:
+                bandPlan.append(tuple(values[:4]))
+        return bandPlan
+
+    index = {}
+    lines = {}
+    for line, values in rows:
+        if name == 'ctcss.csv':
+            key, value = values[0], Ctcss(values[1], values[2])
+        elif name == 'skip.csv':
+            key, value = (values[0], values[1]), values[2]
+        elif name == 'info.csv':
+            key, value = values[0], values[1:]
+        elif name == 'offsets.csv':
+            key, value = values[0], values[1]
+        else:
+            key, value = values[0], values[1]
+        if key in index and entryValue(index[key]) != entryValue(value):
+            problems.append((line, 'replaces the entry for %s on line %i' % (key, lines[key]), None))
+        index[key] = value
+        lines[key] = line
+    return index
+
+def entryValue(value):
+    """Returns a comparable value for an overlay entry
+
+    Args:
+        value: Overlay entry
+
+    Returns:
+        Comparable value
+    """
+    if isinstance(value, Ctcss):
+        return (value.freq, value.note)
+    return value
+
+def fileHash(fileName: str) -> str:
+    """Returns the SHA-256 hash of a data file
+
+    Args:
+        fileName (str): File name
+
+    Returns:
+        str: Hex digest
+    """
+    with open(fileName, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def loadCache(fileName: str) -> dict:
+    """Loads the cache of parsed files
+
+    Args:
+        fileName (str): Cache file name
+
+    Returns:
+        dict: Cached files indexed by file name, empty if there is no usable cache
+    """
+    try:
+        with open(fileName, 'rb') as f:
+            cache = pickle.load(f)
+        if cache.get('version') == CACHE_VERSION:
+            return cache['files']
+        logging.debug('Discarding the overlay cache from an older version')
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.debug('Unable to read the overlay cache %s (%s)' % (fileName, e))
+    return {}
+
+def saveCache(fileName: str, files: dict) -> None:
+    """Saves the cache of parsed files, a data folder that cannot be written
+    to only means the files are parsed on every run
+
+    Args:
+        fileName (str): Cache file name
+        files (dict): Cached files indexed by file name
+    """
+    try:
+        with atomicFile(fileName) as tempName:
+            with open(tempName, 'wb') as f:
+                pickle.dump({'version': CACHE_VERSION, 'files': files}, f,
+                            pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        logging.debug('Unable to save the overlay cache %s (%s)' % (fileName, e))
+
+class Overlays:
+    '''
+    Parsed data files with lookups by licence number
+    '''
+    def __init__(self, files: dict) -> None:
+        """Constructor for the overlays
+
+        Args:
+            files (dict): Parsed files indexed by file name
+        """
+        self.callsigns = files['callsigns.csv']['index']
+        self.ctcss = files['ctcss.csv']['index']
+        self.info = files['info.csv']['index']
+        self.skip = files['skip.csv']['index']
+        self.links = files['links.csv']['index']
+        self.bandPlan = files['bandplan.csv']['index']
+        self.offsets = files['offsets.csv']['index']
+        self.problems = [(name, line, reason, row)
+                         for name in SCHEMAS
+                         for line, reason, row in files[name]['problems']]
+
+    def report(self) -> str:
+        """Returns a report of the malformed rows
+
+        Returns:
+            str: Report with a line for each problem, empty if there are none
+        """
+        return '\n'.join('  %s line %i: %s%s' % (name, line, reason,
+                                                 '' if row is None else ' ' + str(row))
+                         for name, line, reason, row in self.problems)
+
+def missingFiles(dataDir: str) -> 'list[str]':
+    """Returns the data files that can not be found
+
+    Args:
+        dataDir (str): Folder containing the data files
+
+    Returns:
+        list[str]: Names of the missing data files
+    """
+    return [name for name in SCHEMAS
+            if name not in OPTIONAL_FILES and not os.path.isfile(dataFile(dataDir, name))]
+
+def loadOverlays(dataDir: str, cache: bool=True) -> Overlays:
+    """Loads the data files from the data folder, using the cached copies of
+    the files that have not changed. The band plan and offsets files are
+    taken from the program's data folder if the data folder does not have
+    them, see repeaters.dataFile()
+
+    Args:
+        dataDir (str): Folder containing the data files
+        cache (bool, optional): Use and update the cache. Defaults to True.
+
+    Returns:
+        Overlays: The parsed data files
+    """
+    cacheName = os.path.join(dataDir, CACHE_FILE)
+    cached = loadCache(cacheName) if cache else {}
+    files = {}
+    modified = False
+    for name, schema in SCHEMAS.items():
+        fileName = dataFile(dataDir, name)
+        if name in OPTIONAL_FILES and not os.path.isfile(fileName):
+            files[name] = {'index': indexRows(name, [], []), 'problems': [], 'sha256': None,
+                           'path': None, 'mtime': None, 'size': None}
+            continue
+        stat = os.stat(fileName)
+        entry = cached.get(name)
+        if entry is not None and (entry.get('path'), entry['mtime'], entry['size']) == \
+                (fileName, stat.st_mtime_ns, stat.st_size):
+            instrument.count('Overlay cache hits')
+            files[name] = entry
+            continue
+        digest = fileHash(fileName)
+        if entry is None or entry['sha256'] != digest:
+            if cache:
+                instrument.count('Overlay cache misses')
+            rows, problems = parseRows(fileName, schema)
+            entry = {'index': indexRows(name, rows, problems), 'problems': problems,
+                     'sha256': digest}
+        else:
+            instrument.count('Overlay cache hits')
+        entry['path'] = fileName
+        entry['mtime'] = stat.st_mtime_ns
+        entry['size'] = stat.st_size
+        files[name] = entry
+        modified = True
+    if cache and modified:
+        saveCache(cacheName, files)
+
+    overlays = Overlays(files)
+    if overlays.problems:
+        logging.warning('%i problems found in the data files:\n%s' % (
+            len(overlays.problems), overlays.report()))
+        instrument.count('malformed data rows', len(overlays.problems))
+    return overlays
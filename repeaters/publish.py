@@ -0,0 +1,219 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+"""Atomic publishing of output files.
+
+Each output is generated into a temporary file in the same folder and then
+renamed over the output, so readers never see a partial file. If the
+content of the new file is the same as the existing output the temporary
+file is discarded instead, leaving the existing file and its modification
+time untouched so deploys only copy outputs that have changed.
+
+The content hash ignores the parts of a file that change on every run
+without the data changing: the generation date embedded in the outputs
+(passed in as volatile strings) and the timestamps of the members of zip
+based formats (KMZ, XLSX and NumPy archives) along with the XLSX document
+properties.
+
+A manifest of the outputs with their SHA-256 hashes, sizes and whether they
+changed in the last run can be kept for deploy scripts.
+"""
+
+import contextlib
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+ZIP_EXTENSIONS = ('.kmz', '.xlsx', '.npz')
+# Zip members that only contain metadata such as creation times
+VOLATILE_MEMBERS = ('docProps/core.xml',)
+BLOCK_SIZE = 1 << 20
+
+def fileHash(fileName: str) -> str:
+    """Returns the SHA-256 hash of a file
+
+    Args:
+        fileName (str): File name
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(fileName, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def contentHash(fileName: str, volatile: 'list[str]'=()) -> str:
+    """Returns a hash of the content of a file ignoring the volatile strings
+    and zip member metadata
+
+    Args:
+        fileName (str): File name
+        volatile (list[str], optional): Strings to ignore. Defaults to ().
+
+    Returns:
+        str: Hex digest
+    """
+    volatile = [v.encode('utf-8') for v in volatile]
+    def normalise(data):
+        for v in volatile:
+            data = data.replace(v, b'')
+        return data
+
+    digest = hashlib.sha256()
+    if os.path.splitext(fileName)[1].lower() in ZIP_EXTENSIONS:
+        import zipfile
+        with zipfile.ZipFile(fileName) as archive:
+            for info in archive.infolist():
+                if info.filename in VOLATILE_MEMBERS:
+                    continue
+                digest.update(info.filename.encode('utf-8') + b'\0')
+                digest.update(normalise(archive.read(info)))
+                digest.update(b'\0')
+    else:
+        with open(fileName, 'rb') as f:
+            digest.update(normalise(f.read()))
+    return digest.hexdigest()
+
+class Manifest:
+    '''
+    Manifest of the published outputs
+    '''
+    def __init__(self, fileName: str) -> None:
+        """Constructor for the manifest, loads the existing manifest if there is one
+
+        Args:
+            fileName (str): Manifest file name
+        """
+        self.fileName = fileName
+        self.folder = os.path.dirname(os.path.abspath(fileName))
+        self.files = {}
+        if os.path.isfile(fileName):
+            with open(fileName) as f:
+                self.files = json.load(f)['files']
+
+    def key(self, fileName: str) -> str:
+        """Returns the key for an output, its path relative to the manifest
+
+        Args:
+            fileName (str): Output file name
+
+        Returns:
+            str: Key
+        """
+        return os.path.relpath(os.path.abspath(fileName), self.folder).replace(os.sep, '/')
+
+    def update(self, fileName: str, changed: bool) -> None:
+        """Records an output in the manifest
+
+        Args:
+            fileName (str): Output file name
+            changed (bool): True if the output was rewritten
+        """
+        entry = self.files.get(self.key(fileName))
+        if changed or entry is None:
+            entry = {'sha256': fileHash(fileName),
+                     'size': os.path.getsize(fileName),
+                     'modified': datetime.datetime.fromtimestamp(os.path.getmtime(fileName)).isoformat()}
+        entry['changed'] = changed
+        self.files[self.key(fileName)] = entry
+
+    def save(self) -> None:
+        """Saves the manifest
+        """
+        with atomicFile(self.fileName) as tempName:
+            with open(tempName, 'w') as f:
+                json.dump({'generated': datetime.datetime.now().isoformat(),
+                           'files': dict(sorted(self.files.items()))}, f, indent=2)
+
+def temporaryName(fileName: str) -> str:
+    """Creates an empty temporary file in the same folder as the given file
+    with the same extension, so it can be renamed over the file
+
+    Args:
+        fileName (str): File name
+
+    Returns:
+        str: Temporary file name
+    """
+    folder, name = os.path.split(os.path.abspath(fileName))
+    fd, tempName = tempfile.mkstemp(dir=folder, prefix='.' + name + '.',
+                                    suffix=os.path.splitext(name)[1])
+    os.close(fd)
+    # mkstemp creates the file readable only by the owner, use the same
+    # permissions as a normally created file
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tempName, 0o666 & ~umask)
+    return tempName
+
+@contextlib.contextmanager
+def atomicFile(fileName: str):
+    """Context manager giving a temporary file name in the same folder as the
+    given file, which is renamed to the file when the context exits
+    without an exception or removed otherwise
+
+    Args:
+        fileName (str): File name
+    """
+    tempName = temporaryName(fileName)
+    try:
+        yield tempName
+        os.replace(tempName, fileName)
+    finally:
+        if os.path.exists(tempName):
+            os.unlink(tempName)
+
+@contextlib.contextmanager
+def publish(fileName: str, volatile: 'list[str]'=(), force: bool=False,
+            manifest: Manifest=None):
+    """Context manager giving a temporary file name to generate an output
+    into, which then replaces the output if its content has changed
+
+    Args:
+        fileName (str): Output file name
+        volatile (list[str], optional): Strings to ignore when comparing the content. Defaults to ().
+        force (bool, optional): Replace the output even if it is unchanged. Defaults to False.
+        manifest (Manifest, optional): Manifest to record the output in. Defaults to None.
+    """
+    tempName = temporaryName(fileName)
+    try:
+        yield tempName
+        changed = force or not os.path.isfile(fileName)
+        if not changed:
+            try:
+                changed = contentHash(tempName, volatile) != contentHash(fileName, volatile)
+            except Exception as e:
+                logging.info('Unable to read the existing %s (%s), replacing it' % (fileName, e))
+                changed = True
+        if changed:
+            os.replace(tempName, fileName)
+        else:
+            logging.info('%s is unchanged, keeping the existing file' % fileName)
+        if manifest is not None:
+            manifest.update(fileName, changed)
+    finally:
+        if os.path.exists(tempName):
+            os.unlink(tempName)
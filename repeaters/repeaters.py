@@ -27,19 +27,20 @@ __version__ = '0.3.0'
 import html
 import csv
 import datetime
+import importlib.util
 import json
 import time
 import logging
+import math
 import optparse
 import os
-import shutil
-import sqlite3
 import sys
-import tempfile
-import urllib.request, urllib.error, urllib.parse
-import zipfile
 
-from mapping.nz_coords import nztmToTopo50
+from typing import Callable
+
+from repeaters import instrument
+from repeaters.publish import Manifest, publish
+from rsmapi import session as rsmSession
 from rsmapi.licences import getLicence, getLicenceList
 
 #import topo50
@@ -73,6 +74,14 @@ STYLE_NAMES = {T_BEACON:'beacon',
                T_REPEATER:'repeater',
                T_TV:'tv_repeater'}
 
+# Compact KML/KMZ schemas and the fields in them
+KML_LICENCE_SCHEMA = 'licence'
+KML_LICENCE_FIELDS = ['frequency', 'input', 'ctcss', 'callsign', 'branch',
+                      'trustees', 'note', 'site', 'mapRef', 'coordinates',
+                      'height', 'number', 'licensee']
+KML_SITE_SCHEMA = 'site'
+KML_SITE_FIELDS = ['mapRef', 'coordinates', 'height', 'licences']
+
 # Highlighted Marker Colours
 LICENCE_COLOUR_HI = {T_BEACON:'55DAFF',
                      T_DIGI:'FF71FF',
@@ -90,6 +99,16 @@ LICENCE_COLOUR = {T_BEACON:'5588FF',
 # Licence Iccon
 LICENCE_ICON = 'radio-station'
 
+# Mean radius of the earth for distances between sites
+EARTH_RADIUS_KM = 6371.0
+
+# Default distance either side of a route in km
+DEFAULT_CORRIDOR_KM = 20
+
+# Coverage prediction defaults and the folder for the coverage images
+DEFAULT_COVERAGE_RANGE = 50
+DEFAULT_ANTENNA_HEIGHT = 10
+COVERAGE_FOLDER = 'coverage'
 
 # Site Marker Colours & Icon
 SITE_COLOUR_HI = '333333'
@@ -102,28 +121,53 @@ I_BRANCH = 1
 I_TRUSTEE1 = 2
 I_TRUSTEE2 = 3
 I_NOTE = 4
-# Columns in skip array
-S_FREQ = 0
-S_NOTE = 1
-# Columns in links csv file
+# Columns in links rows
 L_END1 = 0
 L_END2 = 1
 L_NAME = 2
-# Columns on CTCSS csv file
-C_LICENCE = 0
-C_FREQ = 1
-C_NOTE = 2
 
 COLUMN_HEADERS = "Name","Number","Type","Callsign","Frequency","Offset",\
                  "Branch", "Trustees","Notes","Licensee",\
                  "CTCSS Tone","CTCSS Note","Site Name","Map reference",\
                  "Latitude","Longitude","Height"
 
+# Columns and their types for columnar output, in the same order as
+# COLUMN_HEADERS and Licence.dataRow()
+COLUMNAR_COLUMNS = (('name', 'str'),
+                    ('number', 'int'),
+                    ('type', 'dict'),
+                    ('callsign', 'str'),
+                    ('frequency', 'float'),
+                    ('offset', 'float'),
+                    ('branch', 'dict'),
+                    ('trustees', 'str'),
+                    ('notes', 'str'),
+                    ('licensee', 'dict'),
+                    ('ctcssTone', 'float'),
+                    ('ctcssNote', 'str'),
+                    ('site', 'dict'),
+                    ('mapRef', 'str'),
+                    ('latitude', 'float'),
+                    ('longitude', 'float'),
+                    ('height', 'int'))
+
 UPDATE_URL = 'http://www.wallace.gen.nz/maps/data/'
 
+# Files in the data folder that the generated output depends on
+DATA_FILES = ('bandplan.csv', 'callsigns.csv', 'ctcss.csv', 'info.csv', 'links.csv',
+              'offsets.csv', 'skip.csv', 'version')
+# Data files that are not in the published data from UPDATE_URL, the copies
+# in the program's data folder are used when a data folder does not have them
+PACKAGED_DATA_FILES = ('bandplan.csv', 'offsets.csv')
+
 USAGE = """%s [options]
+       %s serve [options]
+       %s conflicts [options]
+       %s networks [options]
+       %s codeplug [options] locations.csv
+       %s search [options] QUERY
 NZ Repeaters %s by Rob Wallace (C)2024, Licence GPLv3
-http://rnr.wallace.gen.nz/redmine/projects/nzrepeaters""" % ("%prog",__version__)
+http://rnr.wallace.gen.nz/redmine/projects/nzrepeaters""" % ("%prog","%prog","%prog","%prog","%prog","%prog",__version__)
 
 def calcBand(f: float) -> str:
     """Calculate the  Amateur Radio Band that a given frequency is in
@@ -224,6 +268,24 @@ class Coordinate:
         """
         return '%f,%f' % (self.lon, self.lat)
 
+def distance(coordinates: Coordinate, lat: float, lon: float) -> float:
+    """Returns the great circle distance between the coordinates and a point
+
+    Args:
+        coordinates (Coordinate): Coordinates
+        lat (float): Latitude of the point
+        lon (float): Longitude of the point
+
+    Returns:
+        float: Distance in km
+    """
+    lat1 = math.radians(coordinates.lat)
+    lat2 = math.radians(lat)
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) *
+         math.sin(math.radians(lon - coordinates.lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
 class Ctcss:
     """
     CTCSS
@@ -298,6 +360,17 @@ class Licence:
         self.note = note
         self.callsign = callsign
         self.ctcss = ctcss
+        self.offset = None
+        self.inputFrequency = None
+        self.setName(name)
+
+    def setName(self, name: str) -> None:
+        """Sets the name of the licence and the sub type given in the name
+
+        Args:
+            name (str): New name
+        """
+        self.name = name
         self.licSubType = ''
         for subType in LICENCE_SUB_TYPES:
             if subType in name:
@@ -327,66 +400,15 @@ class Licence:
         """
         return calcBand(self.frequency)
 
-    def calcOffset(self) -> float:
-        """Returns the input offset for the repeater.
+    def setOffset(self, offset: float) -> None:
+        """Sets the input offset of the repeater and the input frequency
+        calculated from it, see calcOffsets()
 
-        Returns:
-            float: Offset in MHz
-        """
-        # 6m
-        if 50.0 <= self.frequency <= 54.0:
-            offset = -1.0
-        # 2m
-        # Standard
-        elif 145.325 <= self.frequency <= 147.0:
-            offset = -0.6
-        elif 147.025 <= self.frequency <= 148.0:
-            offset = +0.6
-        # 70cm
-        # Standard
-        elif 438.0 <= self.frequency <440.0:
-            offset = -5.0
-        # Inverted
-        elif 433.0 <= self.frequency <435.0:
-            offset = 5.0
-        #33cm
-        elif 927.0 <= self.frequency <928.0:
-            offset = -12.0
-        # 23cm
-        # Standard
-        elif 1240.0 <= self.frequency <1300.0:
-            offset = -20.0
-        # Inverted
-        elif 1270.0 <= self.frequency < 1274.0:
-            offset = +20.0
-        # Simplex repeaters eg VoIP
-        elif 'simplex' in self.note.lower():
-            offset = 0.0
-
-        # Special cases
-        # Oeo Road
-        elif self.number == 213218:
-            offset = -0.6
-        # 12 Peckham Lane cross band
-        elif self.number == 131963:
-            offset = 433.8 - 144.935
-        # Rotorua Linear
-        elif self.number == 244752:
-            offset = +0.6
-
-        else:
-            logging.error('Error no offset calculation for No: %i %s %0.4fMHz' % (
-                           self.number, self.name, self.frequency))
-            offset = 0
-        return offset
-
-    def calcInput(self) -> float:
-        """Returns the input frequency for the repeater.
-
-        Returns:
-            float: Input frequency for the repeater
+        Args:
+            offset (float): Offset in MHz
         """
-        return self.frequency + self.calcOffset()
+        self.offset = offset
+        self.inputFrequency = self.frequency + offset
 
     def formatName (self) -> str:
         """Returns the formatted name including the frequency designator
@@ -418,7 +440,7 @@ class Licence:
             row += [self.callsign]
         row += [self.frequency]
         if self.licType =='Amateur Repeater':
-            row += [self.calcOffset()]
+            row += [self.offset]
         else:
             row += ['N/A']
         if self.branch == None:
@@ -467,7 +489,7 @@ class Licence:
         row += '<td>'+ html.escape(self.formatName())
         row += '</td><td>' +'%0.4f MHz' % self.frequency
         if self.licType == T_REPEATER:
-            row += '</td><td>' +'%0.4f MHz' % self.calcInput()
+            row += '</td><td>' +'%0.4f MHz' % self.inputFrequency
             row += '</td><td>' +'%s' % ctcss
         if site != None:
             row += '</td><td>' + html.escape(site.name)
@@ -488,11 +510,19 @@ class Licence:
         Returns:
             str: HTML formated link to branch page
         """
+        br = self.formatBranch()
+        return '<a href="https://nzart.org.nz/branch-details/?branch=%s">%s</a>' % (br, br)
+
+    def formatBranch(self) -> str:
+        """Returns the branch number formatted as two digits where possible
+
+        Returns:
+            str: Formatted branch number
+        """
         try:
-            br = '%02i' % int(self.branch)
+            return '%02i' % int(self.branch)
         except:
-            br = self.branch
-        return '<a href="https://nzart.org.nz/branch-details/?branch=%s">%s</a>' % (br, br)
+            return self.branch
 
     def htmlNote(self):
         """Returns an HTML formatted note including coverage link for digipeaters
@@ -518,7 +548,7 @@ class Licence:
         if self.licType in [T_REPEATER]:
             colSpan = 2
             description += '<tr><th align="left" rowspan=2><b>Frequency</th><td><b>Output</b></td><td>%0.4fMHz</td></tr>' % self.frequency
-            description += "<td><b>Input</b></td><td>%0.4f MHz</td></tr>" % self.calcInput()
+            description += "<td><b>Input</b></td><td>%0.4f MHz</td></tr>" % self.inputFrequency
             if self.ctcss != None:
                 description += '<tr><th align="left" colspan=%i>CTCSS</th><td>%s</td></tr>' % (colSpan, self.ctcss.html())
         else:
@@ -570,20 +600,97 @@ class Licence:
             self.formatName(),
             self.licType, html.escape(self.formatName()), self.htmlDescription(site))
 
-    def kmlPlacemark(self, site: 'Site') -> str:
+    def jsonRecord(self, licenceId: str) -> dict:
+        """Returns a dictionary of the licence for JSON output, the site is
+        referenced by its id rather than being included.
+
+        Args:
+            licenceId (str): Id of the licence
+
+        Returns:
+            dict: Licence record
+        """
+        if self.licType == T_REPEATER:
+            offset = self.offset
+        else:
+            offset = None
+        if self.ctcss is None:
+            ctcss = None
+        else:
+            ctcss = {'freq': self.ctcss.freq, 'note': self.ctcss.note}
+        return {'id': licenceId,
+                'number': self.number,
+                'type': self.licType,
+                'subType': self.licSubType,
+                'name': self.name,
+                'callsign': self.callsign,
+                'frequency': self.frequency,
+                'offset': offset,
+                'ctcss': ctcss,
+                'branch': self.branch,
+                'trustee1': self.trustee1,
+                'trustee2': self.trustee2,
+                'note': self.note,
+                'licensee': self.licensee,
+                'site': self.site}
+
+    def kmlExtendedData(self, site: 'Site') -> str:
+        """Returns the KML extended data for the licence, the values are
+        rendered by the balloon template in the shared licence styles.
+
+        Args:
+            site (Site): Site information to display with the licence
+
+        Returns:
+            str: KML ExtendedData element
+        """
+        values = [('frequency', '%0.4f' % self.frequency)]
+        if self.licType == T_REPEATER:
+            values.append(('input', '%0.4f' % self.inputFrequency))
+            if self.ctcss is None:
+                values.append(('ctcss', 'None'))
+            else:
+                values.append(('ctcss', self.ctcss.html()))
+        values += [('callsign', self.callsign),
+                   ('branch', self.formatBranch()),
+                   ('trustees', self.htmlTrustees()),
+                   ('note', self.htmlNote()),
+                   ('site', html.escape(self.site)),
+                   ('mapRef', site.mapRef),
+                   ('coordinates', '%f %f' % (site.coordinates.lat, site.coordinates.lon)),
+                   ('height', '%i' % site.height),
+                   ('number', str(self.number)),
+                   ('licensee', html.escape(self.licensee))]
+        return kmlExtendedData(KML_LICENCE_SCHEMA, values)
+
+    def kmlReference(self) -> str:
+        """Returns a short reference to the licence for the list of licences
+        in a compact site placemark, the details are in the licence placemark.
+
+        Returns:
+            str: Frequency, name and callsign as HTML
+        """
+        return '%0.4f MHz %s %s' % (self.frequency, html.escape(self.formatName()), self.callsign)
+
+    def kmlPlacemark(self, site: 'Site', compact: bool=False) -> str:
         """Returns a KML placemark for the licence.
 
         Args:
             site (Site): Site information to display with the licence
+            compact (bool, optional): If True output the licence details as
+                extended data rather than a HTML description. Defaults to False.
 
         Returns:
-            str: _description_
+            str: KML placemark
         """
         placemark = '    <Placemark>\n'
         placemark += '      <name>'+ html.escape(self.formatName())+'</name>\n'
-        placemark += '      <description><![CDATA['
-        placemark += self.htmlDescription(site)
-        placemark += ']]></description>\n'
+        if compact:
+            placemark += self.kmlExtendedData(site)
+        else:
+            placemark += '      <description><![CDATA['
+            placemark += self.htmlDescription(site)
+            placemark += ']]></description>\n'
         placemark += '      <styleUrl>#msn_' + STYLE_NAMES[self.licType] + '</styleUrl>\n'
         placemark += '      <Point>\n'
         placemark += '        <coordinates>'
@@ -614,13 +721,15 @@ class Link:
     '''
     def __init__(self, name: str="",
                  end1: Coordinate=Coordinate(0.0,0.0),
-                 end2: Coordinate=Coordinate(0.0,0.0)) -> None:
+                 end2: Coordinate=Coordinate(0.0,0.0),
+                 numbers: tuple=(0, 0)) -> None:
         """Link construtor
 
         Args:
             name (str, optional): name of the link. Defaults to "".
             end1 (Coordinate, optional): coordinates for the first end of the link. Defaults to Coordinate(0.0,0.0).
             end2 (Coordinate, optional): coordinates for the second end of the link. Defaults to Coordinate(0.0,0.0).
+            numbers (tuple, optional): licence numbers of the two ends of the link. Defaults to (0, 0).
         """
         assert type(name) == str
         assert isinstance(end1, Coordinate)
@@ -628,6 +737,7 @@ class Link:
         self.name = name
         self.end1 = end1
         self.end2 = end2
+        self.numbers = tuple(numbers)
         self.subType = ''
         for subType in LICENCE_SUB_TYPES:
             if subType in name:
@@ -652,6 +762,17 @@ class Link:
             self.end2.lat, self.end2.lon,
             html.escape(self.name))
 
+    def jsonRecord(self) -> dict:
+        """Returns a dictionary of the link for JSON output
+
+        Returns:
+            dict: Link record
+        """
+        return {'name': self.name,
+                'subType': self.subType,
+                'end1': [self.end1.lat, self.end1.lon],
+                'end2': [self.end2.lat, self.end2.lon]}
+
     def kmlPlacemark(self) -> str:
         """Returns a KML placemark (line) for the link
 
@@ -758,20 +879,59 @@ class Site:
             str: Site description
         """
         description = ""
-        if (len(self.beacons) > 0) or\
-           (len(self.digipeaters) > 0) or\
-           (len(self.repeaters) > 0) or\
-           (len(self.tvRepeaters) >0):
+        if self.hasLicences():
             logging.debug('Creating placemark for: %s' % html.escape(self.name))
             description += '<table>'
             description += '<tr><th align="left">Map Reference</th><td>%s</td></tr>' % self.mapRef
             description += '<tr><th align="left">Coordinates</th><td>%f %f</td></tr>' % (self.coordinates.lat, self.coordinates.lon)
             description += '<tr><th align="left">Height</th><td>%i m</td></tr>' % self.height
             description += '</table>'
-            description += self.htmlItemTable(self.beacons,'Beacon')
-            description += self.htmlItemTable(self.digipeaters, 'Digipeater')
-            description += self.htmlItemTable(self.repeaters, 'Repeater')
-            description += self.htmlItemTable(self.tvRepeaters, 'TV Repeater')
+            description += self.htmlItemTables()
+        return description
+
+    def hasLicences(self) -> bool:
+        """Returns if there are any licences associated with the site
+
+        Returns:
+            bool: True if the site has licences, False otherwise
+        """
+        return (len(self.beacons) > 0) or\
+               (len(self.digipeaters) > 0) or\
+               (len(self.repeaters) > 0) or\
+               (len(self.tvRepeaters) >0)
+
+    def htmlItemTables(self) -> str:
+        """Build and return the HTML tables of the licences at the site
+
+        Returns:
+            str: HTML tables for each licence type
+        """
+        return self.htmlItemTable(self.beacons,'Beacon') +\
+               self.htmlItemTable(self.digipeaters, 'Digipeater') +\
+               self.htmlItemTable(self.repeaters, 'Repeater') +\
+               self.htmlItemTable(self.tvRepeaters, 'TV Repeater')
+
+    def kmlItemLists(self) -> str:
+        """Build and return the lists of references to the licences at the
+        site for compact KML
+
+        Returns:
+            str: HTML lists for each licence type
+        """
+        return self.kmlItemList(self.beacons,'Beacon') +\
+               self.kmlItemList(self.digipeaters, 'Digipeater') +\
+               self.kmlItemList(self.repeaters, 'Repeater') +\
+               self.kmlItemList(self.tvRepeaters, 'TV Repeater')
+
+    def kmlItemList(self, items, text) -> str:
+        if len(items) == 0:
+            return ""
+        if len(items) == 1:
+            description = '<h3>' + text + '</h3>'
+        else:
+            description = '<h3>' + text + 's</h3>'
+        items.sort(key=lambda items: items.frequency)
+        description += '<br>'.join(item.kmlReference() for item in items)
         return description
 
     def htmlNameLink(self) -> str:
@@ -804,21 +964,56 @@ class Site:
             self.coordinates.lat, self.coordinates.lon,
             self.name, self.name, self.htmlDescription())
 
-    def kmlPlacemark(self) -> str:
+    def jsonRecord(self) -> dict:
+        """Returns a dictionary of the site for JSON output, the licences at
+        the site reference it by name so are not included.
+
+        Returns:
+            dict: Site record
+        """
+        return {'id': self.name,
+                'name': self.name,
+                'mapRef': self.mapRef,
+                'lat': self.coordinates.lat,
+                'lon': self.coordinates.lon,
+                'height': self.height}
+
+    def kmlExtendedData(self) -> str:
+        """Returns the KML extended data for the site, the values are
+        rendered by the balloon template in the shared site style. The
+        licences are listed by reference rather than in full, their details
+        are in the licence placemarks.
+
+        Returns:
+            str: KML ExtendedData element
+        """
+        return kmlExtendedData(KML_SITE_SCHEMA,
+                               [('mapRef', self.mapRef),
+                                ('coordinates', '%f %f' % (self.coordinates.lat, self.coordinates.lon)),
+                                ('height', '%i' % self.height),
+                                ('licences', self.kmlItemLists())])
+
+    def kmlPlacemark(self, compact: bool=False) -> str:
         """Returns a kml placemark for the site containing the requested
         information or an empty string if there are no licences to display
         in the requested information.
 
+        Args:
+            compact (bool, optional): If True output the site details as
+                extended data rather than a HTML description. Defaults to False.
+
         Returns:
             str: KML placemark
         """
-        desc = self.htmlDescription()
-        if len(desc) > 0:
+        if self.hasLicences():
             placemark = '    <Placemark>\n'
             placemark += '      <name>'+ html.escape(self.name) + '</name>\n'
-            placemark += '      <description><![CDATA['
-            placemark += desc
-            placemark += ']]></description>\n'
+            if compact:
+                placemark += self.kmlExtendedData()
+            else:
+                placemark += '      <description><![CDATA['
+                placemark += self.htmlDescription()
+                placemark += ']]></description>\n'
             placemark += '      <styleUrl>#msn_site</styleUrl>\n'
             placemark += '      <Point>\n'
             placemark += '        <coordinates>'
@@ -832,18 +1027,6 @@ class Site:
         return placemark
 
 
-def jsonDefault(o) -> dict:
-    """Returns a dictionary for the given object
-    This is used when serialising objects to a json file
-
-    Args:
-        o (object): _description_
-
-    Returns:
-        dict: Object serialised into a dictionary
-    """
-    return o.__dict__
-
 def we_are_frozen() -> bool:
     """Returns True if we are frozen via py2exe.
     This will affect how we find out where we are located.
@@ -865,64 +1048,153 @@ def module_path() -> str:
     else:
         return os.path.dirname(__file__)
 
-def readCtcss(fileName: str) -> dict:
-    """Reads the CTCSS information from the given csv file and returns
-    a dictionary of CTCSS information indexed by licence number
+def dataFolder(folder: str) -> str:
+    """Returns the path of the data folder, a relative folder is relative
+    to the program's directory
 
     Args:
-        fileName (str): Filename to use for CSV file
+        folder (str): Data folder option
 
     Returns:
-        dict: A dictionary of CTCSS information indexed by licence number
+        str: Path to the data folder
     """
-    ctcss = {}
+    if os.path.isabs(folder):
+        return folder
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), folder)
 
-    for row in csv.reader(open(fileName)):
-        if len(row) >= 3:
-            ctcss[int(row[C_LICENCE])]= Ctcss(float(row[C_FREQ]),row[C_NOTE])
-    return ctcss
+def dataFile(dataDir: str, name: str) -> str:
+    """Returns the path of a data file, the program's copy of the files in
+    PACKAGED_DATA_FILES is used if the data folder does not have them
 
-def readRowCsv(fileName: str, length: int) -> dict:
-    """Reads a rows from the from the given csv file and returns them as a
-    dictionary indexed by the licence number (first item) without the first
-    item in the array.
+    Args:
+        dataDir (str): Folder containing the data files
+        name (str): Data file name
+
+    Returns:
+        str: Path to the data file
+    """
+    fileName = os.path.join(dataDir, name)
+    if name in PACKAGED_DATA_FILES and not os.path.isfile(fileName):
+        return os.path.join(dataFolder('data'), name)
+    return fileName
+
+def addDataOptions(parser: optparse.OptionParser) -> None:
+    """Adds the options for the data folder, snapshots, replaying the RSM
+    API and logging shared by the subcommands, see applyDataOptions()
 
     Args:
-        fileName (str): Filename to use for CSV file
-        length (int): Expected number of items in each row
+        parser (optparse.OptionParser): Option parser of the subcommand
+    """
+    parser.add_option('-A','--datafolder', action='store', type='string', dest='datadir',
+                      default='data', help='Modify the data folder location from the default')
+    parser.add_option('-Z','--noskip', action='store_true', dest='noskip',
+                      default=False, help='Do not use the skip file and include all licences')
+    parser.add_option('--snapshot', action='store', type='string', dest='snapshot',
+                      default=None, help='Load the licence information from the given snapshot file if the data files and RSM API licence list are unchanged, otherwise create it. Changes only to the licence details, eg site heights, are not detected')
+    parser.add_option('--snapshot-age', action='store', type='float', dest='snapshotAge',
+                      default=0.0, help='Use the snapshot without checking the RSM API for changes if it is less than SNAPSHOTAGE hours old')
+    parser.add_option('--replay', action='store', type='string', dest='replay',
+                      default=None, help='Replay the RSM API responses recorded in the given folder instead of using the network')
+    parser.add_option('-v','--verbose', action='store_true', dest='verbose',
+                      help='Verbose logging')
+    parser.add_option('-D','--debug', action='store_true', dest='debug',
+                      help='Debug logging')
+
+def applyDataOptions(parser: optparse.OptionParser, options: optparse.Values) -> str:
+    """Sets up logging, checks the data folder and starts replaying the RSM
+    API if requested from the options added by addDataOptions()
+
+    Args:
+        parser (optparse.OptionParser): Option parser for reporting errors
+        options (optparse.Values): Parsed options
 
     Returns:
-        dict: Rows read from file
+        str: Path to the data folder
     """
-    ret = {}
-    for row in csv.reader(open(fileName)):
-        if len(row) == length:
-            ret[int(row[0])] = row[1:]
-        elif len(row) > 1:
-            logging.error('Row of bad length read' + str(row))
-            logging.error(row)
-    return ret
+    if options.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    elif options.verbose:
+        logging.basicConfig(level=logging.INFO)
+    else:
+        logging.basicConfig(level=logging.WARNING)
 
-def readTextCsv(fileName: str) -> dict:
-    """Reads a set of text values associated with licence numbers from the given csv
-    file and returns them as a dictionary indexed by the licence number.
+    dataDir = dataFolder(options.datadir)
+    if not os.path.isdir(dataDir):
+        parser.error('Chosen data folder %s does not exist' % dataDir)
+    if options.replay:
+        if not os.path.isfile(os.path.join(options.replay, rsmSession.ARCHIVE_NAME)):
+            parser.error('No recorded session found in %s' % options.replay)
+        rsmSession.startReplay(options.replay)
+    return dataDir
+
+def loadLicences(dataDir: str, filters: tuple, snapshot: str=None,
+                 snapshotAge: float=0.0) -> tuple:
+    """Loads the licence information from the snapshot if one is given and
+    it is up to date, otherwise from the data files and the RSM API
 
     Args:
-        fileName (str): Filename to use for CSV file
+        dataDir (str): Folder containing the data files
+        filters (tuple): Filter options passed to readLicenceInfo()
+        snapshot (str, optional): Snapshot file to load from or create. Defaults to None.
+        snapshotAge (float, optional): Age in hours below which the snapshot is used without checking the RSM API. Defaults to 0.0.
 
     Returns:
-        dict: Rows read from file
+        tuple: sites, licences, licensees and links
     """
-    ret = {}
-    for row in csv.reader(open(fileName)):
-        if len(row) >= 2:
-            ret[int(row[0])] = row[1]
-    return ret
+    if snapshot is None:
+        return readLicenceInfo(dataDir, *filters)
+    from repeaters.snapshot import cachedLicenceInfo
+    return cachedLicenceInfo(snapshot, snapshotAge, dataDir, filters)
+
+def dataSignature(dataDir: str) -> tuple:
+    """Returns the modification times and sizes of the data files, used to
+    detect when they have been changed
+
+    Args:
+        dataDir (str): Folder containing the data files
+
+    Returns:
+        tuple: Name, modification time and size of each data file
+    """
+    signature = []
+    for name in DATA_FILES:
+        try:
+            stat = os.stat(dataFile(dataDir, name))
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((name, None, None))
+    return tuple(signature)
+
+def getLicenceRecords(fMin: float, fMax: float,
+                      shBeacon: bool, shDigipeater: bool ,shRepeater: bool ,shTvRepeater: bool) -> list:
+    """Gets the list of basic licence records of the selected types and
+    frequencies from the RSM database API
+
+    Args:
+        fMin (float): minimum frequency to include
+        fMax (float): maximum frequency to include
+        shBeacon (bool): Include beacons ?
+        shDigipeater (bool): Include digis ?
+        shRepeater (bool): Include repeaters ?
+        shTvRepeater (bool): Include TV repeaters ?
+
+    Returns:
+        list: Basic licence records
+    """
+    licenceTypes = []
+    if shRepeater: licenceTypes.append('H1')
+    if shBeacon: licenceTypes.append('H2')
+    if shDigipeater: licenceTypes.append('H3')
+    if shTvRepeater: licenceTypes.append('H9')
+
+    with instrument.stage('getLicenceRecords'):
+        return getLicenceList(licenceType=licenceTypes, fromFrequency=fMin, toFrequency=fMax, sortBy='frequency', gridRefDefault='TOPO50_T')
 
 def getLicenceInfo(callsigns: dict, ctcss: dict, info: dict ,skip: dict,
                    fMin: float, fMax: float,
                    shBeacon: bool, shDigipeater: bool ,shRepeater: bool ,shTvRepeater: bool,
-                   include: str, exclude: str, branch: str, noskip: bool) -> list:
+                   include: str, exclude: str, branch: str, noskip: bool,
+                   records: list=None) -> list:
     """Gets the licence information from the RSM database API and returns
     the dictionaries below
 
@@ -930,7 +1202,7 @@ def getLicenceInfo(callsigns: dict, ctcss: dict, info: dict ,skip: dict,
         callsigns (dict): A dictionary of call signs indexed by Licnence number
         ctcss (dict): A dictionary of ctcss tones indexed by Licnense number
         info (dict): A dictionary of additional info indexed by Linense number
-        skip (dict): A dictionary of licences to skip by Linense number
+        skip (dict): A dictionary of reasons to skip licences indexed by Linense number and frequency, 0 for all frequencies
         fMin (float): minimum frequency to include
         fMax (float): maximum frequency to include
         shBeacon (bool): Include beacons ?
@@ -941,6 +1213,7 @@ def getLicenceInfo(callsigns: dict, ctcss: dict, info: dict ,skip: dict,
         exclude (str): Filter licences to exclude those that have this in their name
         branch (str): Filter licences to only include those allocated to this branch
         noskip (bool): If True do not skip any licences
+        records (list, optional): Basic licence records if they have already been fetched. Defaults to None.
 
     Returns:
         list: sites     - A list of sites and their associated licences
@@ -951,13 +1224,8 @@ def getLicenceInfo(callsigns: dict, ctcss: dict, info: dict ,skip: dict,
     licences = {}
     licensees = {}
 
-    licenceTypes = []
-    if shRepeater: licenceTypes.append('H1')
-    if shBeacon: licenceTypes.append('H2')
-    if shDigipeater: licenceTypes.append('H3')
-    if shTvRepeater: licenceTypes.append('H9')
-
-    records = getLicenceList(licenceType=licenceTypes, fromFrequency=fMin, toFrequency=fMax, sortBy='frequency', gridRefDefault='TOPO50_T')
+    if records is None:
+        records = getLicenceRecords(fMin, fMax, shBeacon, shDigipeater, shRepeater, shTvRepeater)
     for basicInfo  in records:
         licenceNumber = basicInfo['licenceNumber']
         licenceLocation = basicInfo['location']
@@ -967,12 +1235,13 @@ def getLicenceInfo(callsigns: dict, ctcss: dict, info: dict ,skip: dict,
         if licenceLocation == 'ALL NEW ZEALAND':
             logging.info('Skipping Licensee No: %d because it has the location "ALL NEW ZEALAND"' % licenceNumber)
             skipping = True
+            instrument.count('skipped: all New Zealand')
         elif not noskip:
-            if licenceNumber in list(skip.keys()):
-                skipFreq = float(skip[licenceNumber][S_FREQ])
-                if skipFreq == 0.0 or skipFreq == licenceFrequency:
-                    skipping = True
-                    logging.info('Skipping Licensee No: %d, frequency %0.4f at location %s for reason "%s"' % (licenceNumber, licenceFrequency, licenceLocation, skip[licenceNumber][S_NOTE]))
+            skipReason = skip.get((licenceNumber, licenceFrequency), skip.get((licenceNumber, 0.0)))
+            if skipReason is not None:
+                skipping = True
+                instrument.count('skipped: skip file')
+                logging.info('Skipping Licensee No: %d, frequency %0.4f at location %s for reason "%s"' % (licenceNumber, licenceFrequency, licenceLocation, skipReason))
 
         licenceName = licenceLocation.title()
         licenceBranch = ''
@@ -980,7 +1249,7 @@ def getLicenceInfo(callsigns: dict, ctcss: dict, info: dict ,skip: dict,
         licenceTrustee2 = ''
         licenceNote = 'No info record available'
         if not skipping:
-            if licenceNumber in list(info.keys()):
+            if licenceNumber in info:
                     licenceName = info[licenceNumber][I_NAME]
                     licenceBranch = info[licenceNumber][I_BRANCH]
                     licenceTrustee1 = info[licenceNumber][I_TRUSTEE1]
@@ -988,14 +1257,18 @@ def getLicenceInfo(callsigns: dict, ctcss: dict, info: dict ,skip: dict,
                     licenceNote = info[licenceNumber][I_NOTE]
             else:
                 logging.error('Licence No: %i on frequency %0.4fMHz at location "%s" does not have an info record' % (licenceNumber,licenceFrequency,licenceLocation))
+                instrument.count('missing info record')
 
-        if include != None:
-            skipping = skipping or (include not in licenceName)
-        if exclude != None:
-            skipping = skipping or (exclude in licenceName)
+        if include != None and not skipping and include not in licenceName:
+            skipping = True
+            instrument.count('skipped: include filter')
+        if exclude != None and not skipping and exclude in licenceName:
+            skipping = True
+            instrument.count('skipped: exclude filter')
 
-        if branch != None:
-            skipping = skipping or (branch != licenceBranch)
+        if branch != None and not skipping and branch != licenceBranch:
+            skipping = True
+            instrument.count('skipped: branch filter')
 
         if not skipping:
             txDetail = getLicence(basicInfo['licenceID'],gridRefDefault='LAT_LONG_NZGD2000_D2000')
@@ -1006,7 +1279,7 @@ def getLicenceInfo(callsigns: dict, ctcss: dict, info: dict ,skip: dict,
                 licensees[basicInfo['licensee']] = Licensee(basicInfo['licensee'], [x.strip() for x in txDetail['clientDetails']['physicalAddress'].split(',')])
 
 
-            if licenceNumber in list(callsigns.keys()):
+            if licenceNumber in callsigns:
                 if licenceCallsign != callsigns[licenceNumber]:
                     logging.info('Licence No: %i callsign %s from the DB does not match the callsign %s from the CSV file' % (licenceNumber, licenceCallsign, callsigns[licenceNumber]))
                     licenceCallsign = callsigns[licenceNumber]
@@ -1036,7 +1309,7 @@ def getLicenceInfo(callsigns: dict, ctcss: dict, info: dict ,skip: dict,
                               licenceTrustee2,
                               licenceNote,
                               licenceCallsign)
-            if licenceNumber in list(ctcss.keys()):
+            if licenceNumber in ctcss:
                 licence.setCtcss(ctcss[licenceNumber])
             if licType == T_BEACON and shBeacon:
                 site.addBeacon(licence)
@@ -1050,35 +1323,124 @@ def getLicenceInfo(callsigns: dict, ctcss: dict, info: dict ,skip: dict,
             elif licType == T_TV and shTvRepeater:
                 site.addTvRepeater(licence)
                 licences[f'{licenceNumber}_{licenceFrequency:0.4f}'] = (licence)
+            else:
+                instrument.count('skipped: licence type')
     return sites, licences, licensees
 
 
-def readLinks(fileName: str, licences: dict, sites: dict) -> list:
-    """Reads the link information from the given csv file and returns
-    a list of the link
+def repeaterOffset(licence: Licence, bandPlan: list, overrides: dict) -> float:
+    """Returns the input offset for a repeater, from the overrides for the
+    licence, otherwise the first range in the band plan containing its
+    frequency, otherwise 0 for simplex repeaters (eg VoIP)
+
+    Args:
+        licence (Licence): Repeater licence
+        bandPlan (list): Ranges as (minimum, maximum, offset, name) in MHz
+        overrides (dict): Offsets indexed by licence number
+
+    Returns:
+        float: Offset in MHz or None if there is no offset for the repeater
+    """
+    offset = overrides.get(licence.number)
+    if offset is not None:
+        return offset
+    for minF, maxF, offset, name in bandPlan:
+        if minF <= licence.frequency <= maxF:
+            return offset
+    if 'simplex' in licence.note.lower():
+        return 0.0
+    return None
+
+def calcOffsets(licences: 'list[Licence]', bandPlan: list, overrides: dict) -> None:
+    """Calculates the input offset and frequency of the repeaters once, so
+    the outputs read them from the licences
+
+    Args:
+        licences (list[Licence]): Licences to calculate the offsets for
+        bandPlan (list): Ranges as (minimum, maximum, offset, name) in MHz
+        overrides (dict): Offsets indexed by licence number
+    """
+    for licence in licences:
+        if licence.licType != T_REPEATER:
+            continue
+        offset = repeaterOffset(licence, bandPlan, overrides)
+        if offset is None:
+            logging.error('Error no offset calculation for No: %i %s %0.4fMHz' % (
+                          licence.number, licence.name, licence.frequency))
+            instrument.count('no offset')
+            offset = 0.0
+        licence.setOffset(offset)
+
+def readLicenceInfo(dataDir: str, fMin: float, fMax: float,
+                    shBeacon: bool, shDigipeater: bool ,shRepeater: bool ,shTvRepeater: bool,
+                    include: str, exclude: str, branch: str, noskip: bool,
+                    records: list=None) -> tuple:
+    """Reads the data files from the data folder and gets the licence
+    information from the RSM database API
+
+    Args:
+        dataDir (str): Folder containing the data files
+        fMin (float): minimum frequency to include
+        fMax (float): maximum frequency to include
+        shBeacon (bool): Include beacons ?
+        shDigipeater (bool): Include digis ?
+        shRepeater (bool): Include repeaters ?
+        shTvRepeater (bool): Include TV repeaters ?
+        include (str): Filter licences to only include those that have this in their name
+        exclude (str): Filter licences to exclude those that have this in their name
+        branch (str): Filter licences to only include those allocated to this branch
+        noskip (bool): If True do not skip any licences
+        records (list, optional): Basic licence records if they have already been fetched. Defaults to None.
+
+    Returns:
+        tuple: sites, licences, licensees and links
+    """
+    from repeaters.overlays import loadOverlays
+    with instrument.stage('readCsv'):
+        overlays = loadOverlays(dataDir)
+    with instrument.stage('getLicenceInfo'):
+        sites, licences, licensees = getLicenceInfo(overlays.callsigns, overlays.ctcss,
+                                                    overlays.info, overlays.skip,
+                                                    fMin, fMax,
+                                                    shBeacon, shDigipeater,
+                                                    shRepeater, shTvRepeater,
+                                                    include, exclude, branch,
+                                                    noskip, records)
+    with instrument.stage('calcOffsets'):
+        calcOffsets(licences.values(), overlays.bandPlan, overlays.offsets)
+    with instrument.stage('readLinks'):
+        links = readLinks(overlays.links, licences, sites)
+    return sites, licences, licensees, links
+
+def readLinks(rows: list, licences: dict, sites: dict) -> list:
+    """Reads the link information from the rows of the links file and
+    returns a list of the link
 
     Args:
-        fileName (str): Filename to use for CSV file
-        licences (dict): A dictionary of licences indexed by Linense number
+        rows (list): Rows of the links file as (end1, end2, name)
+        licences (dict): A dictionary of licences indexed by Linense number and frequency
         sites (dict): A dictionary of sites indexed by site name
 
     Returns:
         list: A list of links
     """
     links = []
-
-    for row in csv.reader(open(fileName)):
-        if len(row) >= 3:
-            name = row[L_NAME]
-            end1 = int(row[L_END1])
-            end2 = int(row[L_END2])
-            if (end1 in list(licences.keys())) and (end2 in list(licences.keys())):
-                links.append(Link(name,
-                                  sites[licences[end1].site].coordinates,
-                                  sites[licences[end2].site].coordinates))
-            else:
-                logging.info('Skipping link %s end licence numbers  %i and %i as one or more licences is missing' % (
-                                name, end1, end2))
+    byNumber = {}
+    for licence in licences.values():
+        byNumber.setdefault(licence.number, licence)
+
+    for row in rows:
+        name = row[L_NAME]
+        end1 = row[L_END1]
+        end2 = row[L_END2]
+        if (end1 in byNumber) and (end2 in byNumber):
+            links.append(Link(name,
+                              sites[byNumber[end1].site].coordinates,
+                              sites[byNumber[end2].site].coordinates,
+                              (end1, end2)))
+        else:
+            logging.info('Skipping link %s end licence numbers  %i and %i as one or more licences is missing' % (
+                            name, end1, end2))
     return links
 
 def generateCsv(filename: str,licences: Licence, sites: Site) -> None:
@@ -1108,7 +1470,11 @@ def as_text(value: any) -> str:
         return str(value)
 
 def generateXlsx(filename: str,licences: Licence, sites: Site) -> None:
-    """Generate a XLSX file of the given licences
+    """Generate a XLSX file of the given licences, the worksheet is written
+    in write only mode so the cells are streamed to the file rather than held
+    in memory. The rows are generated twice, once to find the column widths
+    which must be set before the first row is written and again as they are
+    written.
 
     Args:
         filename (str): filename to save the XLSX file to
@@ -1118,16 +1484,17 @@ def generateXlsx(filename: str,licences: Licence, sites: Site) -> None:
     # TODO Add number formatting for Frequency and offset
     # Check if openpyxl is missing and termintae if it is missing
     try:
-        import openpyxl
         from openpyxl import Workbook
         from openpyxl.formatting.rule import Rule
         from openpyxl.styles import PatternFill
         from openpyxl.styles.differential import DifferentialStyle
-        from openpyxl.worksheet.table import Table, TableStyleInfo
+        from openpyxl.utils import get_column_letter
+        from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
     except ModuleNotFoundError:
         print('The openpyxl module is not installed please try another output',
               'format or install the openpyxl package.')
         sys.exit(1)
+    import warnings
 
     def sortKey(item):
         return (licences[item].name, licences[item].frequency)
@@ -1137,18 +1504,29 @@ def generateXlsx(filename: str,licences: Licence, sites: Site) -> None:
     tableRange = 'A1:Q' + str(len(licences)+1)
     tableName = 'TABLE_LICENCES'
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Licences"
+    def rows():
+        for licence in licenceNos:
+            yield licences[licence].dataRow(sites[licences[licence].site])
+
+    # Find the column widths without keeping the rows, write only sheets
+    # need the column widths set before the first row is written
+    widths = [len(as_text(value)) for value in COLUMN_HEADERS]
+    for row in rows():
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], len(as_text(value)))
 
-    # Insert header
-    ws.append(COLUMN_HEADERS)
-    # Insert Licences
-    for licence in licenceNos:
-        ws.append(licences[licence].dataRow(sites[licences[licence].site]))
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Licences")
+
+    # Adjust the columns to fit the text
+    for i, width in enumerate(widths):
+        ws.column_dimensions[get_column_letter(i + 1)].width = width
 
     # Convert licences entries into a table
     tab = Table(displayName=tableName, ref=tableRange)
+    # Write only sheets can not read the column names back from the header
+    tab.tableColumns = [TableColumn(id=i + 1, name=header)
+                        for i, header in enumerate(COLUMN_HEADERS)]
     # Add a default style with striped rows and banded columns
     style = TableStyleInfo(name="TableStyleMedium9",
                            showFirstColumn=False,
@@ -1156,20 +1534,129 @@ def generateXlsx(filename: str,licences: Licence, sites: Site) -> None:
                            showRowStripes=True,
                            showColumnStripes=False)
     tab.tableStyleInfo = style
-    ws.add_table(tab)
+    with warnings.catch_warnings():
+        # The table columns have been added above
+        warnings.simplefilter('ignore', UserWarning)
+        ws.add_table(tab)
     # Freeze the top row
     ws.freeze_panes = 'A2'
-    # Adjust the columns to fit the text
-    if float(openpyxl.__version__[0:3]) >= 2.6:
-        for column_cells in ws.columns:
-            length = max(len(as_text(cell.value)) for cell in column_cells)
-            ws.column_dimensions[column_cells[0].column_letter].width = length
-    else:
-        for column_cells in ws.columns:
-            length = max(len(as_text(cell.value)) for cell in column_cells)
-            ws.column_dimensions[column_cells[0].column].width = length
+
+    # Insert header and licences
+    ws.append(COLUMN_HEADERS)
+    for row in rows():
+        ws.append(row)
     wb.save(filename)
 
+def columnarData(licences: Licence, sites: Site) -> dict:
+    """Builds typed columns of the given licences from the same rows as the
+    CSV and XLSX output, missing numeric values are represented by NaN.
+
+    Args:
+        licences (Licence): licences to generate columns for
+        sites (Site): sites to get site information from
+
+    Returns:
+        dict: Lists of values indexed by column name
+    """
+    def sortKey(item):
+        return (licences[item].name, licences[item].frequency)
+
+    columns = {}
+    for name, kind in COLUMNAR_COLUMNS:
+        columns[name] = []
+    for licence in sorted(list(licences.keys()), key=sortKey):
+        row = licences[licence].dataRow(sites[licences[licence].site])
+        for (name, kind), value in zip(COLUMNAR_COLUMNS, row):
+            if kind == 'float':
+                try:
+                    value = float(value)
+                except ValueError:
+                    value = float('nan')
+            elif kind == 'int':
+                value = int(value)
+            else:
+                value = as_text(value)
+            columns[name].append(value)
+    return columns
+
+def columnarFilename(filename: str) -> str:
+    """Returns the filename the columnar file will be written to, which has
+    the extension changed to .npz if pyarrow is not installed
+
+    Args:
+        filename (str): requested filename
+
+    Returns:
+        str: filename to write to
+    """
+    if os.path.splitext(filename)[1].lower() != '.npz' and importlib.util.find_spec('pyarrow') is None:
+        filename = os.path.splitext(filename)[0] + '.npz'
+        logging.warning('The pyarrow module is not installed, writing %s instead' % filename)
+    return filename
+
+def generateColumnar(filename: str, licences: Licence, sites: Site) -> None:
+    """Generate a columnar file of the given licences for analysis, the
+    format is selected by the file extension:
+        .parquet          Apache Parquet (requires pyarrow)
+        .feather, .arrow  Arrow IPC / Feather (requires pyarrow)
+        .npz              NumPy archive (requires numpy)
+
+    If pyarrow is not installed a NumPy archive is written instead with the
+    extension changed to .npz. With pyarrow the licensee, branch, site and
+    type columns are dictionary encoded, in a NumPy archive they are stored
+    as integer codes in the column with the values in <column>_dictionary.
+
+    Args:
+        filename (str): filename to save the columnar file to
+        licences (Licence): licences to generate the file for
+        sites (Site): sites to get site information from
+    """
+    columns = columnarData(licences, sites)
+    filename = columnarFilename(filename)
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension == '.npz':
+        try:
+            import numpy
+        except ModuleNotFoundError:
+            print('The numpy module is not installed please try another output',
+                  'format or install the numpy or pyarrow package.')
+            sys.exit(1)
+        arrays = {}
+        for name, kind in COLUMNAR_COLUMNS:
+            if kind == 'float':
+                arrays[name] = numpy.array(columns[name], dtype=numpy.float64)
+            elif kind == 'int':
+                arrays[name] = numpy.array(columns[name], dtype=numpy.int64)
+            elif kind == 'dict':
+                dictionary, codes = numpy.unique(numpy.array(columns[name], dtype=numpy.str_),
+                                                 return_inverse=True)
+                arrays[name] = codes.astype(numpy.int32)
+                arrays[name + '_dictionary'] = dictionary
+            else:
+                arrays[name] = numpy.array(columns[name], dtype=numpy.str_)
+        numpy.savez(filename, **arrays)
+        return
+
+    import pyarrow
+    types = {'float': pyarrow.float64(),
+             'int': pyarrow.int64(),
+             'str': pyarrow.string(),
+             'dict': pyarrow.string()}
+    arrays = []
+    for name, kind in COLUMNAR_COLUMNS:
+        array = pyarrow.array(columns[name], type=types[kind])
+        if kind == 'dict':
+            array = array.dictionary_encode()
+        arrays.append(array)
+    table = pyarrow.Table.from_arrays(arrays, names=[name for name, kind in COLUMNAR_COLUMNS])
+    if extension == '.parquet':
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(table, filename)
+    else:
+        import pyarrow.feather
+        pyarrow.feather.write_feather(table, filename)
+
 def generateHtml(filename: str, licences: Licence, sites: Site, links: Link,
                  byLicence: bool, bySite: bool, dataDate: datetime) -> None:
     """Generate HTML file from the given licences and sites
@@ -1534,9 +2021,50 @@ def generateJsLinksTree(splitSubType: bool, expand: bool) -> str:
             js += "    tmpNode = new YAHOO.widget.TextNode('%s', typeNode, false);\n" % s
     return js
 
+def jsonSections(licences: Licence, sites: Site, links: Link) -> list:
+    """Returns the sections of the normalised JSON output for the given
+    licences, sites and links. The records in each section are generated as
+    they are iterated over, licences reference their site by id.
+
+    Args:
+        licences (Licence): Licences to output
+        sites (Site): Sites to output
+        links (Link): Links to output
+
+    Returns:
+        list: Section name, record type and record generator for each section
+    """
+    def sortKey(item):
+        return (licences[item].name, licences[item].frequency)
+
+    return [('sites', 'site',
+             (sites[site].jsonRecord() for site in sorted(sites.keys()))),
+            ('licences', 'licence',
+             (licences[licence].jsonRecord(licence) for licence in sorted(list(licences.keys()), key=sortKey))),
+            ('links', 'link',
+             (link.jsonRecord() for link in links))]
+
+def jsonDumps() -> Callable[[dict], str]:
+    """Returns the fastest available function for serialising a record to
+    compact JSON text, orjson is used if it is installed.
+
+    Returns:
+        Callable[[dict], str]: Function taking a record and returning JSON text
+    """
+    try:
+        import orjson
+    except ModuleNotFoundError:
+        return lambda record: json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+    return lambda record: orjson.dumps(record).decode('utf-8')
+
 def generateJson(filename: str, indent: int, licences: Licence, sites: Site,
-                 links: Link, dataDate: datetime) -> None:
-    """Generates JSON file from the given licences, sites and links
+                 links: Link, dataDate: datetime, ndjson: bool=False) -> None:
+    """Generates a normalised JSON file from the given licences, sites and
+    links, each record is serialised and written as it is generated.
+
+    The JSON document contains the dataDate and lists of sites, licences and
+    links. If ndjson is set a newline delimited file is written instead with
+    one record per line and a "record" key giving the type of the record.
 
     Args:
         filename (str): File to output JSON data to
@@ -1545,17 +2073,45 @@ def generateJson(filename: str, indent: int, licences: Licence, sites: Site,
         sites (Site): Sites to output
         links (Link): links to output
         dataDate (datetime): Date data file was created
+        ndjson (bool, optional): Output newline delimited JSON. Defaults to False.
     """
-    f = open(filename,mode='w')
-    f.write("var dataDate = %s\n" % dataDate.strftime("%d/%m/%Y"))
-    f.write("var sites = " + json.dumps(sites,default=jsonDefault, indent=indent) + '\n')
-    f.write("var links = " + json.dumps(links,default=jsonDefault, indent=indent) + '\n')
-    f.close()
+    date = dataDate.strftime("%Y-%m-%d")
+    if indent is None or ndjson:
+        dumps = jsonDumps()
+        newline = ''
+        pad = ''
+        colon = ':'
+    else:
+        dumps = lambda record: json.dumps(record, ensure_ascii=False, indent=indent)
+        newline = '\n'
+        pad = ' ' * indent
+        colon = ': '
+
+    with open(filename, mode='w', encoding='utf-8') as f:
+        if ndjson:
+            f.write(dumps({'record': 'dataDate', 'dataDate': date}) + '\n')
+            for section, recordType, records in jsonSections(licences, sites, links):
+                for record in records:
+                    f.write(dumps({'record': recordType, **record}) + '\n')
+            return
+
+        f.write('{' + newline + pad + '"dataDate"' + colon + dumps(date))
+        for section, recordType, records in jsonSections(licences, sites, links):
+            f.write(',' + newline + pad + '"%s"%s[' % (section, colon))
+            separator = newline
+            for record in records:
+                f.write(separator + pad * 2 + dumps(record).replace('\n', '\n' + pad * 2))
+                separator = ',' + newline
+            if separator != newline:
+                f.write(newline + pad)
+            f.write(']')
+        f.write(newline + '}\n')
 
 
 def generateKml(filename: str, licences: Licence, sites: Site, links: Link,
                  byLicence: bool, bySite: bool, dataDate: bool,
-                 outputKmz: bool=False) -> None:
+                 outputKmz: bool=False, compact: bool=False,
+                 coverage: list=None, coveragePrefix: str='') -> None:
     """_summary_
 
     Args:
@@ -1567,23 +2123,30 @@ def generateKml(filename: str, licences: Licence, sites: Site, links: Link,
         bySite (bool):  include listing of licences by site only
         dataDate (bool): creation date for data file
         outputKmz (bool, optional): If true this file is to be included in a KMZ file. Defaults to False.
+        compact (bool, optional): If true use extended data and shared balloon styles. Defaults to False.
+        coverage (list, optional): Coverage of the sites to include as ground overlays. Defaults to None.
+        coveragePrefix (str, optional): Path of the coverage images relative to the KML file. Defaults to ''.
     """
     if bySite:
         logging.debug('exporting kmlfile %s by site' % filename)
-        kml = generateKmlSite(sites, dataDate, outputKmz)
+        kml = generateKmlSite(sites, dataDate, outputKmz, compact)
     elif byLicence:
         logging.debug('exporting kmlfile %s by licence' % filename)
-        kml = generateKmlLicence(licences, sites, links, dataDate, 1, outputKmz=outputKmz)
+        kml = generateKmlLicence(licences, sites, links, dataDate, 1, outputKmz=outputKmz, compact=compact)
     else:
         logging.debug('exporting kmlfile %s by site and licence' % filename)
-        kml = generateKmlAll(licences, sites, links, dataDate, outputKmz)
+        kml = generateKmlAll(licences, sites, links, dataDate, outputKmz, compact)
+    if coverage:
+        from repeaters.coverage import kmlCoverage
+        kml = kml[:-len(kmlFooter())] + kmlCoverage(coverage, coveragePrefix) + kmlFooter()
 
     f = open(filename,mode='w')
     f.write(kml)
     f.close()
 
 def generateKmlAll(licences: Licence, sites: Site, links: Link,
-                   dataDate: datetime,  outputKmz: bool) -> str:
+                   dataDate: datetime,  outputKmz: bool,
+                   compact: bool=False) -> str:
     """Generatre KML for licences, links and sites
 
     Args:
@@ -1592,23 +2155,24 @@ def generateKmlAll(licences: Licence, sites: Site, links: Link,
         links (Link): Links to generate KML for
         dataDate (datetime): Data update date
         outputKmz (bool): True if this is for a KMZ file
+        compact (bool, optional): True if extended data is to be used. Defaults to False.
 
     Returns:
         str: Generated KML for licences, links and sites
     """
     kml = kmlHeader()
-    kml += kmlStylesLicences(outputKmz)
-    kml += kmlStylesSites(outputKmz)
+    kml += kmlStylesLicences(outputKmz, compact)
+    kml += kmlStylesSites(outputKmz, compact)
     kml += '    <name>Amateur Licences and Sites (data extracted %s)</name><open>1</open>\n' % dataDate.strftime("%d/%m/%Y")
     kml += '       <description>Data updated on %s</description>\n' % dataDate.strftime("%d/%m/%Y")
     kml += '    <Folder><name>Licences</name><open>1</open>\n'
     kml += '       <description>Data updated on %s</description>\n' % dataDate.strftime("%d/%m/%Y")
-    kml += generateKmlLicenceBody(licences,sites,links,0,True)
+    kml += generateKmlLicenceBody(licences,sites,links,0,True,compact)
     kml += '    </Folder>\n'
     kml += generateKmlLinksBody(links,True)
     kml += '    <Folder><name>Sites</name><open>0</open>\n'
     kml += '       <description>Data updated on %s</description>\n' % dataDate.strftime("%d/%m/%Y")
-    kml += generateKmlSiteBody(sites)
+    kml += generateKmlSiteBody(sites, compact)
     kml += '    </Folder>\n'
     kml += kmlFooter()
     return kml
@@ -1616,7 +2180,8 @@ def generateKmlAll(licences: Licence, sites: Site, links: Link,
 def generateKmlLicence(licences: Licence, sites: Site, links: Link,
                        dataDate: datetime, expand: int=1,
                        splitSubType: bool=False,
-                       outputKmz: bool= False) -> str:
+                       outputKmz: bool= False,
+                       compact: bool=False) -> str:
     """Generate KML for the given licences
 
     Args:
@@ -1627,21 +2192,23 @@ def generateKmlLicence(licences: Licence, sites: Site, links: Link,
         expand (int, optional): If 1 all items should be expanded. Defaults to 1.
         splitSubType (bool, optional): True if licence subtypes should be split for each band. Defaults to False.
         outputKmz (bool, optional): True if this is for a KMZ file. Defaults to False.
+        compact (bool, optional): True if extended data is to be used. Defaults to False.
 
     Returns:
         str: Generated KML for licences
     """
     kml = kmlHeader()
-    kml += kmlStylesLicences(outputKmz)
+    kml += kmlStylesLicences(outputKmz, compact)
     kml += '    <name>Amateur Licences</name><open>1</open>\n'
     kml += '       <description>Data updated on %s</description>\n' % dataDate.strftime("%d/%m/%Y")
-    kml += generateKmlLicenceBody(licences,sites,links,expand,splitSubType)
+    kml += generateKmlLicenceBody(licences,sites,links,expand,splitSubType,compact)
     kml += generateKmlLinksBody(links,splitSubType)
     kml += kmlFooter()
     return kml
 
 def generateKmlLicenceBody(licences: Licence, sites: Site, links: Link,
-                           expand: bool ,splitSubType: bool) -> str:
+                           expand: bool ,splitSubType: bool,
+                           compact: bool=False) -> str:
     """Generate KML for the supplied licences
 
     Args:
@@ -1650,6 +2217,7 @@ def generateKmlLicenceBody(licences: Licence, sites: Site, links: Link,
         links (Link): links to include information from
         expand (int): If 1 all items should be expanded
         splitSubType (bool): True if licence subtypes should be split for each band
+        compact (bool, optional): True if extended data is to be used. Defaults to False.
 
     Returns:
         str: _description_
@@ -1672,7 +2240,7 @@ def generateKmlLicenceBody(licences: Licence, sites: Site, links: Link,
                     b = b + ' ' +s
         if b not in list(kmlByType[t].keys()):
             kmlByType[t][b] = ""
-        kmlByType[t][b] += licences[licence].kmlPlacemark(sites[licences[licence].site])
+        kmlByType[t][b] += licences[licence].kmlPlacemark(sites[licences[licence].site], compact)
     for t in LICENCE_TYPES:
         if len(kmlByType[t]) > 0:
             kml += '    <Folder><name>%ss</name><open>%i</open>\n' % (t,expand)
@@ -1731,30 +2299,33 @@ def generateKmlLinksBody(links: Link, splitSubType: bool) -> str:
             kml += '    </Folder>\n'
     return kml
 
-def generateKmlSite(sites: Site, dataDate: datetime, outputKmz: bool) -> str:
+def generateKmlSite(sites: Site, dataDate: datetime, outputKmz: bool,
+                    compact: bool=False) -> str:
     """Generate KML for the given sites
 
     Args:
         sites (Site): _description_
         dataDate (datetime): _description_
         outputKmz (bool): True if this is for a KMZ file
+        compact (bool, optional): True if extended data is to be used. Defaults to False.
 
     Returns:
         str: KML by site
     """
     kml = kmlHeader()
-    kml += kmlStylesSites(outputKmz)
+    kml += kmlStylesSites(outputKmz, compact)
     kml += '    <name>Amateur Sites</name><open>1</open>\n'
     kml += '       <description>Data updated on %s</description>\n' % dataDate.strftime("%d/%m/%Y")
-    kml += generateKmlSiteBody(sites)
+    kml += generateKmlSiteBody(sites, compact)
     kml += kmlFooter()
     return kml
 
-def generateKmlSiteBody(sites: Site) -> str:
+def generateKmlSiteBody(sites: Site, compact: bool=False) -> str:
     """Generate KML for the suplied sites
 
     Args:
         sites (Site): Sites to build KML information for
+        compact (bool, optional): True if extended data is to be used. Defaults to False.
 
     Returns:
         str: Generated KML for sites
@@ -1763,11 +2334,12 @@ def generateKmlSiteBody(sites: Site) -> str:
     siteNames = list(sites.keys())
     siteNames.sort()
     for site in siteNames:
-        kml += sites[site].kmlPlacemark()
+        kml += sites[site].kmlPlacemark(compact)
     return kml
 
 def generateKmz(filename: str, licences: Licence, sites: Site, links: Link,
-                byLicence: bool, bySite: bool, dataDate: datetime) -> None:
+                byLicence: bool, bySite: bool, dataDate: datetime,
+                compact: bool=False, coverage: list=None) -> None:
     """Generates a KMZ (Google Earth) file of the selected licences, links & sites
 
     Args:
@@ -1778,11 +2350,18 @@ def generateKmz(filename: str, licences: Licence, sites: Site, links: Link,
         byLicence (bool): include listing of licences by licence type only
         bySite (bool): include listing of licences by site only
         dataDate (datetime): creation date for data file
+        compact (bool, optional): True if extended data is to be used. Defaults to False.
+        coverage (list, optional): Coverage of the sites to include as ground overlays. Defaults to None.
     """
+    import shutil
+    import tempfile
+    import zipfile
+
     logging.debug('exporting kmlfile %s' % filename)
     tempDir = tempfile.mkdtemp()
     kmlFilename = os.path.join(tempDir,'doc.kml')
-    generateKml(kmlFilename, licences, sites, links, byLicence ,bySite, dataDate, True)
+    generateKml(kmlFilename, licences, sites, links, byLicence ,bySite, dataDate, True, compact,
+                coverage, COVERAGE_FOLDER + '/')
     archive = zipfile.ZipFile(filename,
                               mode='w',
                               compression=zipfile.ZIP_DEFLATED)
@@ -1806,6 +2385,8 @@ def generateKmz(filename: str, licences: Licence, sites: Site, links: Link,
         srcFile  = os.path.join('html', 'images', SITE_ICON + '-' + SITE_COLOUR_HI +'.png')
         destFile = 'images/' + os.path.basename(srcFile)
         archive.write(srcFile, destFile)
+    for siteCoverage in coverage or []:
+        archive.writestr(COVERAGE_FOLDER + '/' + siteCoverage.imageName, siteCoverage.image)
     archive.close()
     shutil.rmtree(tempDir)
 
@@ -1863,7 +2444,7 @@ def htmlTableHeader(full=False, licType=T_REPEATER) -> str:
 
 def kmlStyle(styleName: str, styleIcon: str,
              styleColour: str, styleColourHl: str,
-             outputKmz: bool=False):
+             outputKmz: bool=False, balloonText: str=None):
     """Generate a KML style
 
     Args:
@@ -1872,9 +2453,15 @@ def kmlStyle(styleName: str, styleIcon: str,
         styleColour (str): Icon colour
         styleColourHl (str): Icon colour when highlighted
         outputKmz (bool, optional): True if this is for a KMZ file. Defaults to False.
+        balloonText (str, optional): Balloon template for placemarks using the style,
+            only included in the normal style as it is not needed twice. Defaults to None.
     """
     if outputKmz: styleUrl=''
     else: styleUrl='https://vhf.nz/maps/'
+    if balloonText is None:
+        balloonStyle = ''
+    else:
+        balloonStyle = '\n    <BalloonStyle>\n      <text><![CDATA[%s]]></text>\n    </BalloonStyle>' % balloonText
     return f'''
 <StyleMap id="msn_{styleName}">
     <Pair>
@@ -1898,7 +2485,7 @@ def kmlStyle(styleName: str, styleIcon: str,
     <ItemIcon>
       <href>{styleUrl}images/{styleIcon}-{styleColour}.png</href>
     </ItemIcon>
-  </ListStyle>
+  </ListStyle>{balloonStyle}
   </Style>
   <Style id="sh_{styleName}">
     <IconStyle>
@@ -1915,6 +2502,94 @@ def kmlStyle(styleName: str, styleIcon: str,
     </ListStyle>
   </Style>'''
 
+def kmlSchema(schemaName: str, fields: 'list[str]') -> str:
+    """Generate a KML schema for the extended data in compact placemarks
+
+    Args:
+        schemaName (str): Name and id of the schema
+        fields (list[str]): Names of the fields in the schema
+
+    Returns:
+        str: KML schema
+    """
+    schema = '\n  <Schema name="%s" id="%s">\n' % (schemaName, schemaName)
+    for field in fields:
+        schema += '    <SimpleField type="string" name="%s"></SimpleField>\n' % field
+    schema += '  </Schema>'
+    return schema
+
+def kmlExtendedData(schemaName: str, values: 'list[tuple[str, str]]') -> str:
+    """Generate KML extended data for a compact placemark, values containing
+    HTML tags are wrapped in CDATA rather than escaped to keep the file small.
+
+    Args:
+        schemaName (str): Name of the schema the data conforms to
+        values (list[tuple[str, str]]): Field name and HTML value pairs
+
+    Returns:
+        str: KML ExtendedData element
+    """
+    data = '      <ExtendedData><SchemaData schemaUrl="#%s">' % schemaName
+    for name, value in values:
+        if '<' in value and ']]>' not in value:
+            value = '<![CDATA[%s]]>' % value
+        else:
+            value = html.escape(value)
+        data += '<SimpleData name="%s">%s</SimpleData>' % (name, value)
+    data += '</SchemaData></ExtendedData>\n'
+    return data
+
+def kmlBalloonLicence(licType: str) -> str:
+    """Generate the shared balloon template for a licence type, this is the
+    compact equivalent of Licence.htmlDescription()
+
+    Args:
+        licType (str): Type of licence to generate the template for
+
+    Returns:
+        str: Balloon text template
+    """
+    def field(name):
+        return '$[%s/%s]' % (KML_LICENCE_SCHEMA, name)
+
+    description = '<h3>$[name]</h3><table>'
+    if licType == T_REPEATER:
+        colSpan = 2
+        description += '<tr><th align="left" rowspan=2><b>Frequency</th><td><b>Output</b></td><td>%sMHz</td></tr>' % field('frequency')
+        description += "<td><b>Input</b></td><td>%s MHz</td></tr>" % field('input')
+        description += '<tr><th align="left" colspan=%i>CTCSS</th><td>%s</td></tr>' % (colSpan, field('ctcss'))
+    else:
+        colSpan = 1
+        description += '<tr><th align="left">Frequency</th><td>%s MHz</td></tr>' % field('frequency')
+    description += '<tr><th align="left" colspan=%i>Callsign</th><td>%s</td></tr>' % (colSpan, field('callsign'))
+    description += '<tr><th align="left" colspan=%i>Type</th><td>%s</td></tr>' % (colSpan, licType)
+    description += '<tr><th align="left" colspan=%i>Branch</th><td><a href="https://nzart.org.nz/branch-details/?branch=%s">%s</a></td></tr>' % (colSpan, field('branch'), field('branch'))
+    description += '<tr><th align="left" colspan=%i>Trustees</th><td>%s</td></tr>' % (colSpan, field('trustees'))
+    description += '<tr><th align="left" colspan=%i>Notes</th><td>%s</td></tr>' % (colSpan, field('note'))
+    description += '<tr><th align="left" colspan=%i>Site Name</th><td>%s</td></tr>' % (colSpan, field('site'))
+    description += '<tr><th align="left" colspan=%i>Map Reference</th><td>%s</td></tr>' % (colSpan, field('mapRef'))
+    description += '<tr><th align="left" colspan=%i>Coordinates</th><td>%s</td></tr>' % (colSpan, field('coordinates'))
+    description += '<tr><th align="left" colspan=%i>Height</th><td>%s m</td></tr>' % (colSpan, field('height'))
+    description += '<tr><th align="left" colspan=%i>Licence Number</th><td>%s</td></tr>' % (colSpan, field('number'))
+    description += '<tr><th align="left" colspan=%i>Licensee</th><td>%s</td></tr>' % (colSpan, field('licensee'))
+    description += '</table>'
+    return description
+
+def kmlBalloonSite() -> str:
+    """Generate the shared balloon template for sites, this is the compact
+    equivalent of Site.htmlDescription()
+
+    Returns:
+        str: Balloon text template
+    """
+    description = '<h3>$[name]</h3><table>'
+    description += '<tr><th align="left">Map Reference</th><td>$[%s/mapRef]</td></tr>' % KML_SITE_SCHEMA
+    description += '<tr><th align="left">Coordinates</th><td>$[%s/coordinates]</td></tr>' % KML_SITE_SCHEMA
+    description += '<tr><th align="left">Height</th><td>$[%s/height] m</td></tr>' % KML_SITE_SCHEMA
+    description += '</table>'
+    description += '$[%s/licences]' % KML_SITE_SCHEMA
+    return description
+
 def kmlHeader() -> str:
     """Generate KML file header
 
@@ -1926,40 +2601,58 @@ def kmlHeader() -> str:
     header += '<Document>\n'
     return header
 
-def kmlStylesLicences(OutputKmz: bool=False) -> str:
+def kmlStylesLicences(OutputKmz: bool=False, compact: bool=False) -> str:
     """Generate KML styles for a licences
 
     Args:
         outputKmz (bool, optional): True if this is for a KMZ file. Defaults to False.
+        compact (bool, optional): True if the schema and balloon templates are to be included. Defaults to False.
 
     Returns:
         str: Styles for KML licences
     """
     styleText = ''
+    if compact:
+        styleText += kmlSchema(KML_LICENCE_SCHEMA, KML_LICENCE_FIELDS)
     for lt in LICENCE_TYPES:
+        if compact: balloonText = kmlBalloonLicence(lt)
+        else: balloonText = None
         styleText += kmlStyle(STYLE_NAMES[lt],
                            LICENCE_ICON,
                            LICENCE_COLOUR[lt],
                            LICENCE_COLOUR_HI[lt],
-                           OutputKmz)
-    styleText += '''
+                           OutputKmz,
+                           balloonText)
+    styleText += kmlStyleLinks()
+    return styleText
+
+def kmlStyleLinks() -> str:
+    """Generate KML style for links
+
+    Returns:
+        str: Style for KML links
+    """
+    return '''
   <Style id="repeaterLink">
     <LineStyle>
       <color>FF5AFD82</color>
       <width>4</width>
     </LineStyle>
   </Style>'''
-    return styleText
 
-def kmlStylesSites (outputKmz: bool=False) -> str:
+def kmlStylesSites (outputKmz: bool=False, compact: bool=False) -> str:
     """Generate KML style for a site
 
     Args:
         outputKmz (bool, optional): True if this is for a KMZ file. Defaults to False.
+        compact (bool, optional): True if the schema and balloon template are to be included. Defaults to False.
 
     Returns:
         str: Style for KML site
     """
+    if compact:
+        return kmlSchema(KML_SITE_SCHEMA, KML_SITE_FIELDS) +\
+               kmlStyle('site',SITE_ICON, SITE_COLOUR, SITE_COLOUR_HI, outputKmz, kmlBalloonSite())
     return kmlStyle('site',SITE_ICON, SITE_COLOUR, SITE_COLOUR_HI, outputKmz)
 
 def kmlFooter() -> str:
@@ -1975,6 +2668,27 @@ def kmlFooter() -> str:
 def main() -> None:
     """Main
     """
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        from repeaters.serve import main as serveMain
+        serveMain(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'conflicts':
+        from repeaters.conflicts import main as conflictsMain
+        conflictsMain(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'networks':
+        from repeaters.network import main as networksMain
+        networksMain(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'codeplug':
+        from repeaters.codeplug import main as codeplugMain
+        codeplugMain(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'search':
+        from repeaters.search import main as searchMain
+        searchMain(sys.argv[2:])
+        return
+
     parser = optparse.OptionParser(usage=USAGE, version=("NZ Repeaters "+__version__))
     parser.add_option('-v','--verbose',action='store_true',dest='verbose',
                             help="Verbose logging")
@@ -2012,6 +2726,12 @@ def main() -> None:
                       default=None,
                       help='Output to JSON file, may be in addition to other output types')
 
+    parser.add_option('--ndjson',
+                      action='store_true',
+                      dest='ndjson',
+                      default=False,
+                      help='Output the JSON file as newline delimited JSON records')
+
     parser.add_option('-k','--kml',
                       action='store',
                       type='string',
@@ -2026,6 +2746,33 @@ def main() -> None:
                       default=None,
                       help='Output to kmz file, may be in addition to other output types')
 
+    parser.add_option('--compact',
+                      action='store_true',
+                      dest='compact',
+                      default=False,
+                      help='Use shared balloon styles and extended data to reduce the size of kml and kmz files, sites list their licences by frequency, name and callsign')
+
+    parser.add_option('--dem',
+                      action='store',
+                      type='string',
+                      dest='dem',
+                      default=None,
+                      help='Add the predicted coverage of each site to the kml and kmz files using the given NZTM elevation model (.asc, .flt or .tif)')
+
+    parser.add_option('--coverage-range',
+                      action='store',
+                      type='float',
+                      dest='coverageRange',
+                      default=DEFAULT_COVERAGE_RANGE,
+                      help='Range of the coverage prediction in km, default %i' % DEFAULT_COVERAGE_RANGE)
+
+    parser.add_option('--antenna-height',
+                      action='store',
+                      type='float',
+                      dest='antennaHeight',
+                      default=DEFAULT_ANTENNA_HEIGHT,
+                      help='Height of the antennas above the sites in metres for the coverage prediction, default %i' % DEFAULT_ANTENNA_HEIGHT)
+
     parser.add_option('-c','--csv',
                       action='store',
                       type='string',
@@ -2040,6 +2787,20 @@ def main() -> None:
                       default=None,
                       help='Output to xlsx file, may be in addition to other output types')
 
+    parser.add_option('-P','--columnar',
+                      action='store',
+                      type='string',
+                      dest='columnarfilename',
+                      default=None,
+                      help='Output to a columnar (.parquet, .feather or .npz) file, may be in addition to other output types')
+
+    parser.add_option('--search-index',
+                      action='store',
+                      type='string',
+                      dest='searchfilename',
+                      default=None,
+                      help='Output a JSON search index of the licences for the web map, may be in addition to other output types')
+
     parser.add_option('-s','--site',
                       action='store_true',
                       dest='site',
@@ -2116,11 +2877,31 @@ def main() -> None:
                       default=None,
                       help='Filter licences to only include those from the selected branch')
 
+    parser.add_option('--route',
+                      action='store',
+                      type='string',
+                      dest='route',
+                      default=None,
+                      help='Only include licences within the corridor of the route in the given GPX file, listed in order along the route')
+
+    parser.add_option('--corridor',
+                      action='store',
+                      type='string',
+                      dest='corridor',
+                      default='%gkm' % DEFAULT_CORRIDOR_KM,
+                      help='Distance either side of the route in km, default %gkm' % DEFAULT_CORRIDOR_KM)
+
     parser.add_option('-u','--update',
                       action='store_true',
                       dest='update',
                       default=False,
                       help='Update data files from the Internet')
+    parser.add_option('--update-url',
+                      action='store',
+                      type='string',
+                      dest='updateUrl',
+                      default=UPDATE_URL,
+                      help='URL of the folder to update the data files from')
     parser.add_option('-A','--datafolder',
                       action='store',
                       type='string',
@@ -2132,6 +2913,74 @@ def main() -> None:
                       dest='noskip',
                       default=False,
                       help='Do not use the skip file and include all licences')
+    parser.add_option('--snapshot',
+                      action='store',
+                      type='string',
+                      dest='snapshot',
+                      default=None,
+                      help='Load the licence information from the given snapshot file if the data files and RSM API licence list are unchanged, otherwise create it. Changes only to the licence details, eg site heights, are not detected')
+    parser.add_option('--snapshot-age',
+                      action='store',
+                      type='float',
+                      dest='snapshotAge',
+                      default=0.0,
+                      help='Use the snapshot without checking the RSM API for changes if it is less than SNAPSHOTAGE hours old')
+    parser.add_option('--record',
+                      action='store',
+                      type='string',
+                      dest='record',
+                      default=None,
+                      help='Record the RSM API requests and responses to the given folder')
+    parser.add_option('--replay',
+                      action='store',
+                      type='string',
+                      dest='replay',
+                      default=None,
+                      help='Replay the RSM API responses recorded in the given folder instead of using the network')
+    parser.add_option('--force-write',
+                      action='store_true',
+                      dest='forceWrite',
+                      default=False,
+                      help='Replace output files even if their content has not changed')
+    parser.add_option('--manifest',
+                      action='store',
+                      type='string',
+                      dest='manifest',
+                      default=None,
+                      help='Record the output files with their hashes and whether they changed in the given manifest file')
+    parser.add_option('--compress',
+                      action='store_true',
+                      dest='compress',
+                      default=False,
+                      help='Write .gz (and .br if brotli is installed) copies of the text outputs for serving precompressed')
+    parser.add_option('--watch',
+                      action='store_true',
+                      dest='watch',
+                      default=False,
+                      help='After building watch the data folder and regenerate the outputs affected by changed data files')
+    parser.add_option('--profile',
+                      action='store_true',
+                      dest='profile',
+                      default=False,
+                      help='Print the time of each stage, API and cache counters, output sizes and peak memory')
+    parser.add_option('--profile-trace',
+                      action='store',
+                      type='string',
+                      dest='profileTrace',
+                      default=None,
+                      help='Profile and write the stage timings to the given Chrome trace event file')
+    parser.add_option('--profile-stats',
+                      action='store',
+                      type='string',
+                      dest='profileStats',
+                      default=None,
+                      help='Profile and write cProfile statistics to the given file')
+    parser.add_option('--metrics',
+                      action='store',
+                      type='string',
+                      dest='metrics',
+                      default=None,
+                      help='Write build metrics to the given file, in Prometheus text format if it ends in .prom otherwise JSON')
     (options, args) = parser.parse_args()
 
     if options.debug:
@@ -2143,10 +2992,12 @@ def main() -> None:
     else:
         logging.basicConfig(level=logging.WARNING)
 
-    if os.path.isabs(options.datadir):
-        data_dir = options.datadir
-    else:
-        data_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)),options.datadir)
+    profiling = options.profile or options.profileTrace or options.profileStats
+    if profiling or options.metrics:
+        instrument.startProfile(memory=bool(profiling),
+                                stats=options.profileStats is not None)
+
+    data_dir = dataFolder(options.datadir)
 
     if not os.path.isdir(data_dir):
         parser.error('Chosen data folder %s does not exist' % data_dir)
@@ -2160,7 +3011,9 @@ def main() -> None:
             parser.error('Can not determine data date for the chosen data folder %s' % data_dir)
 
     if options.update:
-        updateDate = updateData(data_dir, dataDate)
+        from repeaters.update import updateData
+        with instrument.stage('updateData'):
+            updateDate = updateData(data_dir, dataDate, options.updateUrl)
         if updateDate is None:
             logging.error('Unable to update data files')
         else:
@@ -2174,13 +3027,6 @@ def main() -> None:
 
     generationDate = datetime.datetime.now()
 
-    callsigns_file = os.path.join(data_dir,'callsigns.csv')
-    ctcss_file = os.path.join(data_dir,'ctcss.csv')
-    licences_file = os.path.join(data_dir,'prism.sqlite')
-    links_file = os.path.join(data_dir,'links.csv')
-    info_file = os.path.join(data_dir,'info.csv')
-    skip_file = os.path.join(data_dir,'skip.csv')
-
     if options.htmlfilename == None and\
        options.jsfilename == None and\
        options.jsonfilename == None and\
@@ -2188,6 +3034,8 @@ def main() -> None:
        options.kmzfilename == None and\
        options.csvfilename == None and\
        options.xlsxfilename == None and\
+       options.columnarfilename == None and\
+       options.searchfilename == None and\
        not options.update:
         parser.error('Atleast one output file type must be defined or no output will be generated')
 
@@ -2208,109 +3056,234 @@ def main() -> None:
         if options.minFreq > options.maxFreq:
             parser.error('The maximum frequency must be greater than the minimum frequency.')
 
+    if options.dem is not None:
+        if not os.path.isfile(options.dem):
+            parser.error('The elevation model %s does not exist' % options.dem)
+        if importlib.util.find_spec('numpy') is None:
+            parser.error('The numpy module is required for coverage prediction please install it')
+        if options.kmlfilename is None and options.kmzfilename is None:
+            parser.error('Coverage is only included in kml and kmz files')
+        if options.route is not None and options.kmzfilename is None:
+            parser.error('Coverage is only included in kmz files when a route is given')
+
+    if options.route is not None:
+        from repeaters.route import parseCorridor
+        if not os.path.isfile(options.route):
+            parser.error('The route %s does not exist' % options.route)
+        try:
+            options.corridor = parseCorridor(options.corridor)
+        except ValueError as e:
+            parser.error('Invalid corridor %s: %s' % (options.corridor, e))
+        if options.watch:
+            parser.error('Only one of route or watch may be specified')
+
     if options.licence and options.site:
         parser.error('Only one of site or licence may be specified')
     elif not (options.licence or options.site):
         print('Neither site or licence output specified creating output including licence and site')
 
-    callsigns = readTextCsv(callsigns_file)
-    ctcss = readCtcss(ctcss_file)
-    info = readRowCsv(info_file,6)
-    skip = readRowCsv(skip_file,3)
-    #sites, licences, licensees = readLicences(licences_file,callsigns,ctcss, TODO: Tidy up
-    sites, licences, licensees = getLicenceInfo(callsigns,ctcss,
-                                              info,skip,
-                                              options.minFreq,options.maxFreq,
-                                              options.beacon,options.digi,
-                                              options.repeater,options.tv,
-                                              options.include,options.exclude,
-                                              options.branch,
-                                              options.noskip)
-    links = readLinks(links_file,licences,sites)
-
+    if options.record and options.replay:
+        parser.error('Only one of record or replay may be specified')
+    elif options.record:
+        rsmSession.startRecording(options.record)
+    elif options.replay:
+        if not os.path.isfile(os.path.join(options.replay, rsmSession.ARCHIVE_NAME)):
+            parser.error('No recorded session found in %s' % options.replay)
+        rsmSession.startReplay(options.replay)
+    if options.watch:
+        rsmSession.startMemoryCache()
+
+    from repeaters.overlays import missingFiles
+    missing = missingFiles(data_dir)
+    if missing:
+        parser.error('The data folder %s is missing %s, please update using -u' % (data_dir, ', '.join(missing)))
+
+    filters = (options.minFreq, options.maxFreq,
+               options.beacon, options.digi, options.repeater, options.tv,
+               options.include, options.exclude, options.branch,
+               options.noskip)
+    with instrument.stage('loadLicenceInfo'):
+        sites, licences, licensees, links = loadLicences(data_dir, filters, options.snapshot,
+                                                         options.snapshotAge)
+
+    route = None
+    if options.route is not None:
+        from repeaters.route import loadRoute
+        with instrument.stage('route'):
+            try:
+                route = loadRoute(options.route, options.corridor, sites)
+            except (ValueError, SyntaxError) as e:
+                parser.error('Unable to read the route: %s' % e)
+            licences, sites, links = route.filter(licences, sites, links)
 
     if len(licences) == 0:
         parser.error('The selected options have excluded all licences, no output will be generated!')
 
-    if options.csvfilename != None:
-        generateCsv(options.csvfilename, licences, sites)
-
-    if options.xlsxfilename != None:
-        generateXlsx(options.xlsxfilename, licences, sites)
-
-    if options.htmlfilename != None:
-        generateHtml(options.htmlfilename, licences, sites, links, options.licence, options.site, generationDate)
-
-    if options.jsfilename != None:
-        generateJs(options.jsfilename, licences, sites, links, options.licence, options.site, generationDate)
-
-    if options.jsonfilename != None:
-        generateJson(options.jsonfilename, options.indent, licences, sites, links, generationDate)
-
-    if options.kmlfilename != None:
-        generateKml(options.kmlfilename, licences, sites, links, options.licence, options.site, generationDate)
-
-    if options.kmzfilename != None:
-        generateKmz(options.kmzfilename, licences, sites, links, options.licence, options.site, generationDate)
-
-def updateData(dataFolder: str, localDate: datetime):
-    """Updates the local data for the application from the internet if the files on
-    the internet are newer than the local copy.
+    if options.columnarfilename != None:
+        options.columnarfilename = columnarFilename(options.columnarfilename)
+
+    generateOutputs(options, licences, sites, links, generationDate, route=route)
+
+    profile = instrument.currentProfile()
+    if profile is not None:
+        profile.stop()
+        profile.counters['API requests'] = rsmSession.stats['requests']
+        profile.counters['API responses replayed'] = rsmSession.stats['replayed']
+        profile.counters['API bytes received'] = rsmSession.stats['bytes']
+        profile.counters['API request time (s)'] = rsmSession.stats['requestTime']
+        profile.counters['API rate limit delay (s)'] = rsmSession.stats['delayTime']
+        if options.snapshot is not None:
+            from repeaters import snapshot
+            profile.counters['Snapshot hits'] = snapshot.stats['hits']
+            profile.counters['Snapshot misses'] = snapshot.stats['misses']
+        if profiling:
+            print(profile.summary())
+        if options.profileTrace:
+            profile.writeTrace(options.profileTrace)
+        if options.profileStats:
+            profile.dumpStats(options.profileStats)
+        if options.metrics:
+            from repeaters.metrics import collectMetrics, writeMetrics
+            writeMetrics(options.metrics, collectMetrics(profile, licences, sites, links))
+
+    if options.watch:
+        from repeaters.watch import watch
+        watch(options, data_dir, filters, sites, licences, licensees, links)
+
+def writeCoverageImages(folder: str, coverage: list, publishOutput) -> None:
+    """Writes the coverage images referenced by a KML file to the given
+    folder, removing images of sites no longer in the output
 
     Args:
-        dataFolder (str): folder to place downloaded data files in
-        localDate (datetime): date of the existing data files (or None if it does not exist)
-
-    Returns:
-        datetime: Date of updated datafiles or None if data update unsusesful
+        folder (str): Folder for the images
+        coverage (list): Coverage of the sites
+        publishOutput: Function returning the context manager to publish an output
     """
-    try:
-        f = urllib.request.urlopen(UPDATE_URL + 'version')
-        remoteDate = datetime.datetime(*time.strptime(f.read(10).decode('utf-8'), "%d/%m/%Y")[0:5])
-        if localDate >= remoteDate:
-            print('Data already up to date, continuing without downloading data')
-            return (localDate)
-        urlDownload(UPDATE_URL + 'data.zip', dataFolder)
-        z = zipfile.ZipFile(os.path.join(dataFolder,'data.zip'))
-        z.extractall(dataFolder)
-        f = open(os.path.join(dataFolder,'version'),'w')
-        f.write(remoteDate.strftime("%d/%m/%Y"))
-        f.close()
-        return(remoteDate)
-    except:
-        return(None)
-
-def urlDownload(url: str, folder: str=None, fileName: str=None) -> None:
-    """Download a file from the given URL and save to the given folder and file name.
-    If no filename is given use the filename from the url and if no folder is given use the current folder
+    os.makedirs(folder, exist_ok=True)
+    imageNames = set()
+    for siteCoverage in coverage:
+        imageNames.add(siteCoverage.imageName)
+        with publishOutput(os.path.join(folder, siteCoverage.imageName)) as fileName:
+            with open(fileName, 'wb') as f:
+                f.write(siteCoverage.image)
+    for name in os.listdir(folder):
+        if name.endswith('.png') and name not in imageNames:
+            os.unlink(os.path.join(folder, name))
+
+def generateOutputs(options: optparse.Values, licences: Licence, sites: Site,
+                    links: Link, generationDate: datetime,
+                    outputs: 'set[str]'=None, route=None) -> None:
+    """Generates the output files selected in the command line options, the
+    csv, html and kml files list the licences in order along the route if
+    one is given
 
     Args:
-        url (str): URL to download form
-        folder (str, optional): Folder to download to. Defaults to None.
-        fileName (str, optional): File to download to. Defaults to None.
-    """
-    if fileName == None:
-        fileName = url.split('/')[-1]
-    if folder != None:
-        fileName = os.path.join(folder, fileName)
-    u = urllib.request.urlopen(url)
-    f = open(fileName, 'wb')
-    fileSize = int(u.headers["Content-Length"])
-    print("Downloading: %s Bytes: %s" % (fileName, fileSize))
-
-    fileSizeDl = 0
-    blockSz = 8192
-    while True:
-        dlBuffer = u.read(blockSz)
-        if not dlBuffer:
-            break
-
-        fileSizeDl += blockSz
-        f.write(dlBuffer)
-        status = r"%10d  [%3.2f%%]" % (fileSizeDl, fileSizeDl * 100. / fileSize)
-        status = status + chr(8)*(len(status)+1)
-        print(status, end=' ')
-    f.close()
+        options (optparse.Values): Command line options
+        licences (Licence): licences to output
+        sites (Site): sites to output
+        links (Link): links to output
+        generationDate (datetime): Date shown in the outputs
+        outputs (set[str], optional): Outputs to generate (eg kml, csv), None for all. Defaults to None.
+        route (repeaters.route.Route, optional): Route the licences were selected along. Defaults to None.
+    """
+    selected = lambda name: outputs is None or name in outputs
+    manifest = Manifest(options.manifest) if options.manifest else None
+    volatile = [generationDate.strftime('%d/%m/%Y'), generationDate.strftime('%Y-%m-%d')]
+    publishOutput = lambda fileName: publish(fileName, volatile, options.forceWrite, manifest)
+    compressor = None
+    if options.compress:
+        from repeaters.compress import Compressor
+        compressor = Compressor(options.forceWrite)
+
+    def published(fileName):
+        instrument.output(fileName)
+        if compressor is not None:
+            compressor.submit(fileName)
+
+    if options.csvfilename != None and selected('csv'):
+        with instrument.stage('generateCsv'), publishOutput(options.csvfilename) as fileName:
+            if route is not None:
+                from repeaters.route import generateCsv as generateRouteCsv
+                generateRouteCsv(fileName, route, licences, sites)
+            else:
+                generateCsv(fileName, licences, sites)
+        published(options.csvfilename)
+
+    if options.xlsxfilename != None and selected('xlsx'):
+        with instrument.stage('generateXlsx'), publishOutput(options.xlsxfilename) as fileName:
+            generateXlsx(fileName, licences, sites)
+        published(options.xlsxfilename)
+
+    if options.columnarfilename != None and selected('columnar'):
+        with instrument.stage('generateColumnar'), publishOutput(options.columnarfilename) as fileName:
+            generateColumnar(fileName, licences, sites)
+        published(options.columnarfilename)
+
+    if options.htmlfilename != None and selected('html'):
+        with instrument.stage('generateHtml'), publishOutput(options.htmlfilename) as fileName:
+            if route is not None:
+                from repeaters.route import generateHtml as generateRouteHtml
+                generateRouteHtml(fileName, route, licences, sites, generationDate)
+            else:
+                generateHtml(fileName, licences, sites, links, options.licence, options.site, generationDate)
+        published(options.htmlfilename)
+
+    if options.jsfilename != None and selected('js'):
+        with instrument.stage('generateJs'), publishOutput(options.jsfilename) as fileName:
+            generateJs(fileName, licences, sites, links, options.licence, options.site, generationDate)
+        published(options.jsfilename)
+
+    if options.jsonfilename != None and selected('json'):
+        with instrument.stage('generateJson'), publishOutput(options.jsonfilename) as fileName:
+            generateJson(fileName, options.indent, licences, sites, links, generationDate, options.ndjson)
+        published(options.jsonfilename)
+
+    if options.searchfilename != None and selected('search'):
+        from repeaters.search import generateIndex
+        with instrument.stage('generateSearchIndex'), publishOutput(options.searchfilename) as fileName:
+            generateIndex(fileName, licences, sites, generationDate)
+        published(options.searchfilename)
+
+    # The route kml file lists the licences along the route without coverage
+    coverageKml = options.kmlfilename != None and selected('kml') and route is None
+    coverage = None
+    if options.dem is not None and (coverageKml or (options.kmzfilename != None and selected('kmz'))):
+        from repeaters.coverage import computeCoverage
+        with instrument.stage('coverage'):
+            coverage = computeCoverage(options.dem, sites.values(), options.coverageRange,
+                                       options.antennaHeight)
+
+    if options.kmlfilename != None and selected('kml'):
+        coveragePrefix = ''
+        if coverage is not None and coverageKml:
+            coveragePrefix = os.path.splitext(os.path.basename(options.kmlfilename))[0] + '_' + COVERAGE_FOLDER + '/'
+            with instrument.stage('writeCoverage'):
+                writeCoverageImages(os.path.join(os.path.dirname(options.kmlfilename), coveragePrefix),
+                                    coverage, publishOutput)
+        with instrument.stage('generateKml'), publishOutput(options.kmlfilename) as fileName:
+            if route is not None:
+                from repeaters.route import generateKml as generateRouteKml
+                generateRouteKml(fileName, route, licences, sites, generationDate, options.compact)
+            else:
+                generateKml(fileName, licences, sites, links, options.licence, options.site, generationDate,
+                            compact=options.compact, coverage=coverage, coveragePrefix=coveragePrefix)
+        published(options.kmlfilename)
+
+    if options.kmzfilename != None and selected('kmz'):
+        with instrument.stage('generateKmz'), publishOutput(options.kmzfilename) as fileName:
+            generateKmz(fileName, licences, sites, links, options.licence, options.site, generationDate,
+                        options.compact, coverage)
+        published(options.kmzfilename)
+
+    if compressor is not None:
+        with instrument.stage('compress'):
+            for sibling, changed in compressor.wait():
+                instrument.output(sibling)
+                if manifest is not None:
+                    manifest.update(sibling, changed)
+
+    if manifest is not None:
+        manifest.save()
 
 if __name__ == "__main__":
     main()
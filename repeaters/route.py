@@ -0,0 +1,320 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Licences along a travel route.
+
+Finds the sites within a corridor either side of a route from a GPX file,
+with the distance of each along the route and from it, so the repeaters
+can be listed in the order they are reached:
+
+    rpt -r --route route.gpx --corridor 20km -c route.csv -H route.html -k route.kml
+
+The route and the sites are projected to NZTM once, so distances are
+measured in metres on the plane. Each segment of the route is placed in
+the cells of a grid, at least the corridor width across, that its bounding
+box covers when widened by the corridor. A site is then only measured
+against the segments in its own cell, so long routes with thousands of
+points are handled without comparing every site with every segment.
+"""
+
+import csv
+import html
+import math
+import os
+import xml.etree.ElementTree as ElementTree
+
+from mapping.nztm import geod_nztm
+from repeaters.repeaters import COLUMN_HEADERS, Coordinate, LICENCE_TYPES, \
+    htmlFooter, htmlHeader, htmlTableHeader, kmlFooter, kmlHeader, \
+    kmlStylesLicences, T_REPEATER
+
+ROUTE_COLUMNS = ('Along route (km)', 'From route (km)')
+# KML line colour (aabbggrr) of the route
+ROUTE_COLOUR = 'ffff7f00'
+
+def parseCorridor(value: str) -> float:
+    """Returns the corridor width from an option value, a number of km with
+    an optional km suffix eg 20km
+
+    Args:
+        value (str): Option value
+
+    Returns:
+        float: Width in km
+    """
+    value = value.strip().lower()
+    if value.endswith('km'):
+        value = value[:-2]
+    width = float(value)
+    if width <= 0:
+        raise ValueError('The corridor must be wider than 0 km')
+    return width
+
+def readGpx(fileName: str) -> tuple:
+    """Reads the points of the tracks and routes in a GPX file, joined into
+    one route in the order they appear
+
+    Args:
+        fileName (str): GPX file name
+
+    Returns:
+        tuple: name of the route and list of (latitude, longitude) of its points
+    """
+    name = None
+    points = []
+    for element in ElementTree.parse(fileName).iter():
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag in ('trkpt', 'rtept'):
+            points.append((float(element.get('lat')), float(element.get('lon'))))
+        elif tag == 'name' and name is None and not points and element.text:
+            name = element.text.strip()
+    if name is None:
+        name = os.path.splitext(os.path.basename(fileName))[0]
+    return name, points
+
+class Corridor:
+    '''
+    Area within a distance of a route
+    '''
+    def __init__(self, points: 'list[tuple]', width: float) -> None:
+        """Constructor for a corridor
+
+        Args:
+            points (list[tuple]): Latitude and longitude of the points along the route
+            width (float): Distance either side of the route in km
+        """
+        self.points = points
+        self.width = width * 1000
+        self.vertices = [geod_nztm(math.radians(lat), math.radians(lon)) for lat, lon in points]
+        # Distance along the route to the start of each segment
+        self.starts = [0.0]
+        for (e1, n1), (e2, n2) in zip(self.vertices, self.vertices[1:]):
+            self.starts.append(self.starts[-1] + math.hypot(e2 - e1, n2 - n1))
+        self.length = self.starts[-1]
+        # Each segment is added to the cells within the corridor width of
+        # it, a piece no longer than the width at a time so that long
+        # segments do not fill the whole of their bounding box
+        self.cells = {}
+        for segment, ((e1, n1), (e2, n2)) in enumerate(zip(self.vertices, self.vertices[1:])):
+            pieces = max(1, math.ceil(math.hypot(e2 - e1, n2 - n1) / self.width))
+            for piece in range(pieces):
+                ea, na = e1 + (e2 - e1) * piece / pieces, n1 + (n2 - n1) * piece / pieces
+                eb, nb = e1 + (e2 - e1) * (piece + 1) / pieces, n1 + (n2 - n1) * (piece + 1) / pieces
+                west, east = self.cell(min(ea, eb) - self.width), self.cell(max(ea, eb) + self.width)
+                south, north = self.cell(min(na, nb) - self.width), self.cell(max(na, nb) + self.width)
+                for x in range(west, east + 1):
+                    for y in range(south, north + 1):
+                        segments = self.cells.setdefault((x, y), [])
+                        if not segments or segments[-1] != segment:
+                            segments.append(segment)
+
+    def cell(self, value: float) -> int:
+        """Returns the grid cell index of an easting or northing
+
+        Args:
+            value (float): Easting or northing in metres
+
+        Returns:
+            int: Cell index
+        """
+        return math.floor(value / self.width)
+
+    def locate(self, lat: float, lon: float) -> tuple:
+        """Returns the distance along and from the route to a position if
+        it is in the corridor, the closest part of the route is used
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+
+        Returns:
+            tuple: Distance along and from the route in km, None if outside the corridor
+        """
+        e, n = geod_nztm(math.radians(lat), math.radians(lon))
+        if len(self.vertices) == 1:
+            d = math.hypot(e - self.vertices[0][0], n - self.vertices[0][1])
+            return (0.0, d / 1000) if d <= self.width else None
+        best = None
+        for segment in self.cells.get((self.cell(e), self.cell(n)), ()):
+            (e1, n1), (e2, n2) = self.vertices[segment], self.vertices[segment + 1]
+            dx, dy = e2 - e1, n2 - n1
+            lengthSq = dx * dx + dy * dy
+            t = 0.0 if lengthSq == 0 else max(0.0, min(1.0, ((e - e1) * dx + (n - n1) * dy) / lengthSq))
+            d = math.hypot(e - e1 - t * dx, n - n1 - t * dy)
+            along = self.starts[segment] + t * math.sqrt(lengthSq)
+            if d <= self.width and (best is None or (d, along) < best):
+                best = (d, along)
+        if best is None:
+            return None
+        return best[1] / 1000, best[0] / 1000
+
+class Route:
+    '''
+    Sites and licences within a corridor of a route
+    '''
+    def __init__(self, name: str, corridor: Corridor, sites: dict) -> None:
+        """Constructor for the route, finds the sites within the corridor
+
+        Args:
+            name (str): Name of the route
+            corridor (Corridor): Corridor of the route
+            sites (dict): Sites indexed by name
+        """
+        self.name = name
+        self.corridor = corridor
+        self.sites = {}
+        for site in sites.values():
+            position = corridor.locate(site.coordinates.lat, site.coordinates.lon)
+            if position is not None:
+                self.sites[site.name] = position
+
+    def licences(self, licences: dict) -> list:
+        """Returns the licences at the sites in the corridor in order along
+        the route
+
+        Args:
+            licences (dict): Licences
+
+        Returns:
+            list: (distance along, distance from, licence) in order along the route
+        """
+        found = [self.sites[licence.site] + (licence,)
+                 for licence in licences.values() if licence.site in self.sites]
+        found.sort(key=lambda item: (item[0], item[2].frequency, item[2].number))
+        return found
+
+    def filter(self, licences: dict, sites: dict, links: list) -> tuple:
+        """Returns the licences, sites and links within the corridor
+
+        Args:
+            licences (dict): Licences
+            sites (dict): Sites indexed by name
+            links (list): Links between licences
+
+        Returns:
+            tuple: licences, sites and links
+        """
+        licences = {key: licence for key, licence in licences.items() if licence.site in self.sites}
+        sites = {name: site for name, site in sites.items() if name in self.sites}
+        numbers = set(licence.number for licence in licences.values())
+        links = [link for link in links if link.numbers[0] in numbers and link.numbers[1] in numbers]
+        return licences, sites, links
+
+def loadRoute(fileName: str, width: float, sites: dict) -> Route:
+    """Reads a GPX route and finds the sites within the corridor
+
+    Args:
+        fileName (str): GPX file name
+        width (float): Distance either side of the route in km
+        sites (dict): Sites indexed by name
+
+    Returns:
+        Route: Route
+    """
+    name, points = readGpx(fileName)
+    if not points:
+        raise ValueError('%s does not contain any track or route points' % fileName)
+    return Route(name, Corridor(points, width), sites)
+
+def generateCsv(fileName: str, route: Route, licences: dict, sites: dict) -> None:
+    """Generates a CSV file of the licences in order along the route
+
+    Args:
+        fileName (str): CSV file name
+        route (Route): Route
+        licences (dict): Licences
+        sites (dict): Sites indexed by name
+    """
+    with open(fileName, 'w', newline='') as f:
+        writer = csv.writer(f, dialect='excel')
+        writer.writerow(ROUTE_COLUMNS + tuple(COLUMN_HEADERS))
+        for along, offset, licence in route.licences(licences):
+            writer.writerow(['%0.1f' % along, '%0.1f' % offset] + licence.dataRow(sites[licence.site]))
+
+def generateHtml(fileName: str, route: Route, licences: dict, sites: dict,
+                 dataDate) -> None:
+    """Generates an HTML file with a table for each licence type of the
+    licences in order along the route
+
+    Args:
+        fileName (str): HTML file name
+        route (Route): Route
+        licences (dict): Licences
+        sites (dict): Sites indexed by name
+        dataDate (datetime): Data update date
+    """
+    found = route.licences(licences)
+    text = htmlHeader()
+    text += '<h1>%s</h1>\n' % html.escape(route.name)
+    text += '<p>Licences within %g km of the %0.0f km route. Data updated on %s</p>\n' % (
+        route.corridor.width / 1000, route.corridor.length / 1000, dataDate.strftime("%d/%m/%Y"))
+    for licType in LICENCE_TYPES:
+        rows = [item for item in found if item[2].licType == licType]
+        if not rows:
+            continue
+        rowspan = ' rowspan=2' if licType == T_REPEATER else ''
+        header = htmlTableHeader(True, licType)
+        text += '<h2>%ss</h2>\n' % licType
+        text += '<table><tr><th%s>Along route</th><th%s>From route</th>' % (rowspan, rowspan)
+        text += header[len('<table><tr>'):] + '\n'
+        for along, offset, licence in rows:
+            text += '<tr><td>%0.1f km</td><td>%0.1f km</td>' % (along, offset)
+            text += licence.htmlRow(sites[licence.site])[len('<tr>'):] + '\n'
+        text += '</table>\n'
+    text += htmlFooter()
+    with open(fileName, 'w') as f:
+        f.write(text)
+
+def generateKml(fileName: str, route: Route, licences: dict, sites: dict,
+                dataDate, compact: bool=False) -> None:
+    """Generates a KML file of the route and the licences along it
+
+    Args:
+        fileName (str): KML file name
+        route (Route): Route
+        licences (dict): Licences
+        sites (dict): Sites indexed by name
+        dataDate (datetime): Data update date
+        compact (bool, optional): True if extended data is to be used. Defaults to False.
+    """
+    kml = kmlHeader()
+    kml += kmlStylesLicences(False, compact)
+    kml += '\n  <Style id="route"><LineStyle><color>%s</color><width>4</width></LineStyle></Style>\n' % ROUTE_COLOUR
+    kml += '    <name>%s</name><open>1</open>\n' % html.escape(route.name)
+    kml += '       <description>Licences within %g km of the route. Data updated on %s</description>\n' % (
+        route.corridor.width / 1000, dataDate.strftime("%d/%m/%Y"))
+    kml += '    <Placemark>\n'
+    kml += '      <name>%s</name>\n' % html.escape(route.name)
+    kml += '      <styleUrl>#route</styleUrl>\n'
+    kml += '      <LineString>\n'
+    kml += '        <tessellate>1</tessellate>\n'
+    kml += '        <coordinates>%s</coordinates>\n' % ' '.join(
+        Coordinate(lat, lon).kml() for lat, lon in route.corridor.points)
+    kml += '      </LineString>\n'
+    kml += '    </Placemark>\n'
+    kml += '    <Folder><name>Licences</name><open>1</open>\n'
+    for along, offset, licence in route.licences(licences):
+        kml += licence.kmlPlacemark(sites[licence.site], compact)
+    kml += '    </Folder>\n'
+    kml += kmlFooter()
+    with open(fileName, 'w') as f:
+        f.write(kml)
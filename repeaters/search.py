@@ -0,0 +1,257 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Search index over the licences.
+
+The licence name, callsign, site name, licensee, branch and licence number
+of each licence are split into lower case words, which are held sorted
+with the licences containing each word, so the words starting with a
+query term are found with a binary search. Query terms that do not start
+any word are matched by the trigrams they share with the words instead,
+so misspellings still find results:
+
+    rpt search belmont
+    rpt search "zl2 wellington"
+    rpt search climie
+
+Every term of a query must match. The results are ranked by how well the
+terms match (a whole word before a prefix before a fuzzy match) weighted
+by the field they matched in, a callsign or licence number match ranking
+above a name or site match. The index is built when the licences are
+loaded, and can be written as JSON for the web map with --search-index
+or queried from rpt serve with /search?q=.
+"""
+
+import bisect
+import datetime
+import json
+import optparse
+import re
+
+from repeaters import repeaters
+
+DEFAULT_LIMIT = 20
+# Weight of a match in each field
+FIELD_WEIGHTS = (('number', 4.0),
+                 ('callsign', 3.0),
+                 ('name', 2.0),
+                 ('site', 2.0),
+                 ('branch', 1.0),
+                 ('licensee', 1.0))
+# Score of a whole word, prefix and fuzzy match before weighting
+WORD_SCORE = 1.0
+PREFIX_SCORE = 0.6
+FUZZY_SCORE = 0.4
+# Minimum trigram similarity (Dice coefficient) for a fuzzy match
+FUZZY_THRESHOLD = 0.5
+
+def words(text: str) -> 'list[str]':
+    """Splits text into lower case words of letters and digits
+
+    Args:
+        text (str): Text
+
+    Returns:
+        list[str]: Words
+    """
+    return re.findall('[a-z0-9]+', str(text).lower())
+
+def trigrams(word: str) -> 'set[str]':
+    """Returns the trigrams of a word padded at both ends
+
+    Args:
+        word (str): Word
+
+    Returns:
+        set[str]: Trigrams
+    """
+    padded = ' %s ' % word
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class SearchIndex:
+    '''
+    Index of the words in the searchable fields of the licences
+    '''
+    def __init__(self, licences: dict, sites: dict) -> None:
+        """Constructor for the index
+
+        Args:
+            licences (dict): Licences
+            sites (dict): Sites indexed by name
+        """
+        self.documents = []
+        postings = {}
+        for key in sorted(licences, key=lambda key: (licences[key].name, licences[key].frequency)):
+            licence = licences[key]
+            site = sites[licence.site]
+            document = len(self.documents)
+            self.documents.append({'number': licence.number,
+                                   'name': licence.formatName(),
+                                   'type': licence.licType,
+                                   'frequency': licence.frequency,
+                                   'callsign': licence.callsign,
+                                   'site': licence.site,
+                                   'branch': licence.branch,
+                                   'licensee': licence.licensee,
+                                   'lat': site.coordinates.lat,
+                                   'lon': site.coordinates.lon})
+            fields = {'number': licence.number,
+                      'callsign': licence.callsign,
+                      'name': licence.formatName(),
+                      'site': licence.site,
+                      'branch': licence.formatBranch(),
+                      'licensee': licence.licensee}
+            for field, weight in FIELD_WEIGHTS:
+                for word in words(fields[field]):
+                    documents = postings.setdefault(word, {})
+                    documents[document] = max(documents.get(document, 0.0), weight)
+        self.words = sorted(postings)
+        self.postings = [sorted(postings[word].items()) for word in self.words]
+        self.trigrams = {}
+        self.trigramCounts = []
+        for index, word in enumerate(self.words):
+            wordTrigrams = trigrams(word)
+            self.trigramCounts.append(len(wordTrigrams))
+            for trigram in wordTrigrams:
+                self.trigrams.setdefault(trigram, []).append(index)
+
+    def matchTerm(self, term: str) -> dict:
+        """Returns the best score of a query term in each matching licence
+
+        Args:
+            term (str): Query term
+
+        Returns:
+            dict: Score indexed by document
+        """
+        matches = []
+        start = bisect.bisect_left(self.words, term)
+        end = bisect.bisect_left(self.words, term + '\x7f', start)
+        for index in range(start, end):
+            score = WORD_SCORE if self.words[index] == term else PREFIX_SCORE
+            matches.append((index, score))
+        if not matches:
+            termTrigrams = trigrams(term)
+            shared = {}
+            for trigram in termTrigrams:
+                for index in self.trigrams.get(trigram, ()):
+                    shared[index] = shared.get(index, 0) + 1
+            for index, count in shared.items():
+                similarity = 2.0 * count / (len(termTrigrams) + self.trigramCounts[index])
+                if similarity >= FUZZY_THRESHOLD:
+                    matches.append((index, FUZZY_SCORE * similarity))
+        scores = {}
+        for index, score in matches:
+            for document, weight in self.postings[index]:
+                if score * weight > scores.get(document, 0.0):
+                    scores[document] = score * weight
+        return scores
+
+    def search(self, query: str, limit: int=DEFAULT_LIMIT) -> 'list[dict]':
+        """Returns the licences matching every term of the query, best
+        first
+
+        Args:
+            query (str): Query
+            limit (int, optional): Maximum number of results. Defaults to DEFAULT_LIMIT.
+
+        Returns:
+            list[dict]: Licence records with their score
+        """
+        terms = words(query)
+        if not terms:
+            return []
+        scores = None
+        for term in terms:
+            termScores = self.matchTerm(term)
+            if scores is None:
+                scores = termScores
+            else:
+                scores = {document: score + termScores[document]
+                          for document, score in scores.items() if document in termScores}
+            if not scores:
+                return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [dict(self.documents[document], score=round(score, 3)) for document, score in ranked]
+
+    def record(self, dataDate: datetime.datetime) -> dict:
+        """Returns the index as a dictionary for JSON output, the words are
+        sorted with the documents and field weights of each
+
+        Args:
+            dataDate (datetime.datetime): Date shown in the index
+
+        Returns:
+            dict: Index record
+        """
+        return {'dataDate': dataDate.strftime('%Y-%m-%d'),
+                'weights': dict(FIELD_WEIGHTS),
+                'documents': self.documents,
+                'words': self.words,
+                'postings': [[[document, weight] for document, weight in posting]
+                             for posting in self.postings]}
+
+def generateIndex(fileName: str, licences: dict, sites: dict,
+                  dataDate: datetime.datetime) -> None:
+    """Generates a JSON search index for the web map
+
+    Args:
+        fileName (str): JSON file name
+        licences (dict): Licences
+        sites (dict): Sites indexed by name
+        dataDate (datetime.datetime): Date shown in the index
+    """
+    with open(fileName, mode='w', encoding='utf-8') as f:
+        json.dump(SearchIndex(licences, sites).record(dataDate), f,
+                  ensure_ascii=False, separators=(',', ':'))
+
+def main(argv: list=None) -> None:
+    """Main for rpt search
+
+    Args:
+        argv (list, optional): Command line arguments after search. Defaults to sys.argv[1:].
+    """
+    parser = optparse.OptionParser(usage='%prog search [options] QUERY')
+    parser.add_option('-n','--limit', action='store', type='int', dest='limit',
+                      default=DEFAULT_LIMIT, help='Maximum number of results, default %i' % DEFAULT_LIMIT)
+    parser.add_option('-J','--json', action='store_true', dest='json',
+                      default=False, help='Print the results as JSON')
+    repeaters.addDataOptions(parser)
+    (options, args) = parser.parse_args(argv)
+
+    if not args or not words(' '.join(args)):
+        parser.error('A query must be given')
+    if options.limit < 1:
+        parser.error('The limit must be at least 1')
+    dataDir = repeaters.applyDataOptions(parser, options)
+
+    filters = (None, None, True, True, True, True, None, None, None, options.noskip)
+    sites, licences, licensees, links = repeaters.loadLicences(dataDir, filters, options.snapshot,
+                                                               options.snapshotAge)
+
+    results = SearchIndex(licences, sites).search(' '.join(args), options.limit)
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print('%-8i %-32s %10.4f %-8s %s' % (result['number'], result['name'], result['frequency'],
+                                                 result['callsign'], result['site']))
@@ -0,0 +1,558 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""HTTP service rendering filtered outputs from a dataset held in memory.
+
+The licence information for all licence types is loaded once and each
+request is rendered from it with the filters given as query parameters,
+which mirror the command line filters:
+
+    type        licence types, comma separated or repeated (beacon, digi,
+                repeater, tv or all), defaults to all
+    minfreq     minimum frequency in MHz
+    maxfreq     maximum frequency in MHz
+    include     only licences with this in their name
+    exclude     exclude licences with this in their name
+    branch      only licences allocated to this branch
+    near        lat,lon[,km] only sites within km (default NEAR_DEFAULT_KM)
+                of the point
+    view        licence or site, defaults to both as for the command line
+    compact     1 for compact KML/KMZ
+
+eg /kml?type=repeater&minfreq=144&maxfreq=148&near=-41.29,174.78,30
+
+/search?q=QUERY[&limit=N] returns the licences best matching the query as
+JSON from a search index built with the dataset, see repeaters.search.
+
+Rendered responses are kept in an LRU cache keyed by the output format and
+filters, and are sent with an ETag so clients can revalidate with
+If-None-Match. The dataset is reloaded in the background when the data files
+change (eg after rpt -u) or the process receives SIGHUP, requests are served
+from the previous dataset until the reload has finished.
+"""
+
+import collections
+import datetime
+import email.utils
+import hashlib
+import json
+import logging
+import optparse
+import os
+import signal
+import tempfile
+import threading
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from repeaters import repeaters
+from repeaters.repeaters import T_BEACON, T_DIGI, T_REPEATER, T_TV, distance
+from repeaters.search import DEFAULT_LIMIT as SEARCH_LIMIT, SearchIndex
+
+# Output formats with their content type and file extension
+FORMATS = {'csv': ('text/csv; charset=utf-8', '.csv'),
+           'html': ('text/html; charset=utf-8', '.html'),
+           'js': ('application/javascript; charset=utf-8', '.js'),
+           'json': ('application/json', '.json'),
+           'kml': ('application/vnd.google-earth.kml+xml', '.kml'),
+           'kmz': ('application/vnd.google-earth.kmz', '.kmz')}
+TYPES = {'beacon': T_BEACON,
+         'digi': T_DIGI,
+         'digipeater': T_DIGI,
+         'repeater': T_REPEATER,
+         'tv': T_TV,
+         'tv_repeater': T_TV}
+ADD_LICENCE = {T_BEACON: repeaters.Site.addBeacon,
+               T_DIGI: repeaters.Site.addDigipeater,
+               T_REPEATER: repeaters.Site.addRepeater,
+               T_TV: repeaters.Site.addTvRepeater}
+PARAMETERS = ('type', 'minfreq', 'maxfreq', 'include', 'exclude', 'branch',
+              'near', 'view', 'compact')
+VIEWS = ('licence', 'site')
+NEAR_DEFAULT_KM = 50.0
+DEFAULT_CACHE_SIZE = 64
+DEFAULT_POLL_INTERVAL = 10.0
+
+class Query:
+    '''
+    Filters for a request parsed from the query parameters
+    '''
+    def __init__(self, params: dict) -> None:
+        """Constructor for a query
+
+        Args:
+            params (dict): Query parameters from urllib.parse.parse_qs()
+
+        Raises:
+            ValueError: If a parameter is unknown or invalid
+        """
+        unknown = [name for name in params if name not in PARAMETERS]
+        if unknown:
+            raise ValueError('Unknown parameter %s' % ', '.join(unknown))
+        value = lambda name: params[name][-1] if name in params else None
+
+        names = [t.strip().lower() for v in params.get('type', []) for t in v.split(',') if t.strip()]
+        if not names or 'all' in names:
+            self.types = frozenset(TYPES.values())
+        else:
+            for name in names:
+                if name not in TYPES:
+                    raise ValueError('Unknown licence type %s' % name)
+            self.types = frozenset(TYPES[name] for name in names)
+
+        self.minFreq = float(value('minfreq')) if value('minfreq') else None
+        self.maxFreq = float(value('maxfreq')) if value('maxfreq') else None
+        if self.minFreq is not None and self.maxFreq is not None and self.minFreq > self.maxFreq:
+            raise ValueError('The maximum frequency must be greater than the minimum frequency')
+        self.include = value('include') or None
+        self.exclude = value('exclude') or None
+        self.branch = value('branch') or None
+
+        self.near = None
+        if value('near'):
+            near = [float(v) for v in value('near').split(',')]
+            if len(near) == 2:
+                near.append(NEAR_DEFAULT_KM)
+            if len(near) != 3:
+                raise ValueError('near must be lat,lon or lat,lon,km')
+            self.near = tuple(near)
+
+        self.view = value('view') or None
+        if self.view is not None and self.view not in VIEWS:
+            raise ValueError('view must be one of %s' % ', '.join(VIEWS))
+        self.compact = value('compact') in ('1', 'true', 'yes')
+
+    def key(self) -> tuple:
+        """Returns the normalised filters for use as a cache key
+
+        Returns:
+            tuple: Filters
+        """
+        return (tuple(sorted(self.types)), self.minFreq, self.maxFreq,
+                self.include, self.exclude, self.branch, self.near,
+                self.view, self.compact)
+
+    def matches(self, licence: repeaters.Licence, site: repeaters.Site) -> bool:
+        """Returns True if the licence passes the filters
+
+        Args:
+            licence (repeaters.Licence): Licence
+            site (repeaters.Site): Site of the licence
+
+        Returns:
+            bool: True if the licence is included
+        """
+        if licence.licType not in self.types:
+            return False
+        if self.minFreq is not None and licence.frequency < self.minFreq:
+            return False
+        if self.maxFreq is not None and licence.frequency > self.maxFreq:
+            return False
+        if self.include is not None and self.include not in licence.name:
+            return False
+        if self.exclude is not None and self.exclude in licence.name:
+            return False
+        if self.branch is not None and self.branch != licence.branch:
+            return False
+        if self.near is not None and distance(site.coordinates, *self.near[:2]) > self.near[2]:
+            return False
+        return True
+
+class Dataset:
+    '''
+    Licence information for all licence types loaded from the data folder
+    and the RSM API
+    '''
+    def __init__(self, dataDir: str, noskip: bool, snapshot: str=None,
+                 snapshotAge: float=0.0, generation: int=0) -> None:
+        """Constructor for the dataset, loads the licence information
+
+        Args:
+            dataDir (str): Folder containing the data files
+            noskip (bool): If True do not skip any licences
+            snapshot (str, optional): Snapshot file to load from or create. Defaults to None.
+            snapshotAge (float, optional): Age in hours below which the snapshot is used without checking the RSM API. Defaults to 0.0.
+            generation (int, optional): Number of the load, part of the cache keys. Defaults to 0.
+        """
+        filters = (None, None, True, True, True, True, None, None, None, noskip)
+        self.signature = repeaters.dataSignature(dataDir)
+        self.sites, self.licences, self.licensees, self.links = repeaters.loadLicences(dataDir, filters, snapshot,
+                                                                                       snapshotAge)
+        self.search = SearchIndex(self.licences, self.sites)
+        self.loaded = datetime.datetime.now()
+        self.generation = generation
+
+    def filter(self, query: Query) -> tuple:
+        """Returns the licences, sites and links passing the filters, the
+        sites are copies holding only the included licences
+
+        Args:
+            query (Query): Filters
+
+        Returns:
+            tuple: licences, sites and links
+        """
+        licences = {}
+        sites = {}
+        for key, licence in self.licences.items():
+            original = self.sites[licence.site]
+            if licence.licType not in ADD_LICENCE or not query.matches(licence, original):
+                continue
+            licences[key] = licence
+            site = sites.get(licence.site)
+            if site is None:
+                site = repeaters.Site(original.name, original.mapRef,
+                                      original.coordinates, original.height)
+                sites[licence.site] = site
+            ADD_LICENCE[licence.licType](site, licence)
+        # Links only hold the coordinates of their ends, which are shared
+        # with the sites
+        included = set(id(site.coordinates) for site in sites.values())
+        links = [link for link in self.links
+                 if id(link.end1) in included and id(link.end2) in included]
+        return licences, sites, links
+
+def render(outputFormat: str, query: Query, licences: dict, sites: dict,
+           links: list, dataDate: datetime) -> bytes:
+    """Renders an output using the output generators
+
+    Args:
+        outputFormat (str): Output format, one of FORMATS
+        query (Query): Filters, for the view and compact options
+        licences (dict): Licences to output
+        sites (dict): Sites to output
+        links (list): Links to output
+        dataDate (datetime): Date shown in the output
+
+    Returns:
+        bytes: Rendered output
+    """
+    byLicence = query.view == 'licence'
+    bySite = query.view == 'site'
+    with tempfile.TemporaryDirectory() as tempDir:
+        fileName = os.path.join(tempDir, 'output' + FORMATS[outputFormat][1])
+        if outputFormat == 'csv':
+            repeaters.generateCsv(fileName, licences, sites)
+        elif outputFormat == 'html':
+            repeaters.generateHtml(fileName, licences, sites, links, byLicence, bySite, dataDate)
+        elif outputFormat == 'js':
+            repeaters.generateJs(fileName, licences, sites, links, byLicence, bySite, dataDate)
+        elif outputFormat == 'json':
+            repeaters.generateJson(fileName, None, licences, sites, links, dataDate)
+        elif outputFormat == 'kml':
+            repeaters.generateKml(fileName, licences, sites, links, byLicence, bySite, dataDate,
+                                  compact=query.compact)
+        elif outputFormat == 'kmz':
+            repeaters.generateKmz(fileName, licences, sites, links, byLicence, bySite, dataDate,
+                                  query.compact)
+        with open(fileName, 'rb') as f:
+            return f.read()
+
+class RenderCache:
+    '''
+    Least recently used cache of rendered responses
+    '''
+    def __init__(self, size: int=DEFAULT_CACHE_SIZE) -> None:
+        """Constructor for the cache
+
+        Args:
+            size (int, optional): Maximum number of responses kept. Defaults to DEFAULT_CACHE_SIZE.
+        """
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> tuple:
+        """Returns a cached response, marking it as recently used
+
+        Args:
+            key (tuple): Cache key
+
+        Returns:
+            tuple: ETag and body or None if the response is not cached
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: tuple) -> None:
+        """Adds a response, removing the least recently used responses if
+        the cache is full
+
+        Args:
+            key (tuple): Cache key
+            entry (tuple): ETag and body
+        """
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Removes all responses
+        """
+        with self.lock:
+            self.entries.clear()
+
+class OutputRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Request handler for the output service
+    '''
+    server: 'OutputServer'
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug('%s - %s' % (self.address_string(), format % args))
+
+    def sendBody(self, status: int, contentType: str, body: bytes,
+                 headers: dict={}) -> None:
+        """Sends a response
+
+        Args:
+            status (int): HTTP status code
+            contentType (str): Content type
+            body (bytes): Response body
+            headers (dict, optional): Additional headers. Defaults to {}.
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def sendError(self, status: int, message: str) -> None:
+        """Sends a plain text error response
+
+        Args:
+            status (int): HTTP status code
+            message (str): Error message
+        """
+        self.sendBody(status, 'text/plain; charset=utf-8', (message + '\n').encode('utf-8'))
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        name = url.path.strip('/')
+        if name == 'status':
+            self.sendBody(200, 'application/json',
+                          json.dumps(self.server.status(), indent=2).encode('utf-8'),
+                          {'Cache-Control': 'no-store'})
+            return
+        if name == 'search':
+            params = urllib.parse.parse_qs(url.query)
+            try:
+                limit = int(params.get('limit', [SEARCH_LIMIT])[-1])
+            except ValueError:
+                self.sendError(400, 'Invalid limit %s' % params['limit'][-1])
+                return
+            results = self.server.dataset.search.search(params.get('q', [''])[-1], max(limit, 1))
+            self.sendBody(200, 'application/json; charset=utf-8',
+                          json.dumps(results, ensure_ascii=False).encode('utf-8'),
+                          {'Cache-Control': 'no-cache'})
+            return
+        if name not in FORMATS:
+            self.sendError(404, 'Unknown output, use one of /%s' % ', /'.join(FORMATS))
+            return
+        try:
+            query = Query(urllib.parse.parse_qs(url.query))
+        except ValueError as e:
+            self.sendError(400, str(e))
+            return
+
+        dataset = self.server.dataset
+        etag, body = self.server.response(dataset, name, query)
+        headers = {'ETag': etag,
+                   'Cache-Control': 'no-cache',
+                   'Last-Modified': email.utils.format_datetime(dataset.loaded.astimezone(datetime.timezone.utc), usegmt=True)}
+        if name == 'kmz':
+            headers['Content-Disposition'] = 'attachment; filename="repeaters.kmz"'
+        if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            for header, value in headers.items():
+                self.send_header(header, value)
+            self.end_headers()
+            return
+        self.sendBody(200, FORMATS[name][0], body, headers)
+
+    do_HEAD = do_GET
+
+class OutputServer(ThreadingHTTPServer):
+    '''
+    Server rendering filtered outputs from a dataset held in memory
+    '''
+    daemon_threads = True
+
+    def __init__(self, address: tuple, dataDir: str, noskip: bool=False,
+                 snapshot: str=None, snapshotAge: float=0.0,
+                 cacheSize: int=DEFAULT_CACHE_SIZE) -> None:
+        """Constructor for the server, loads the dataset
+
+        Args:
+            address (tuple): Host and port to listen on
+            dataDir (str): Folder containing the data files
+            noskip (bool, optional): If True do not skip any licences. Defaults to False.
+            snapshot (str, optional): Snapshot file to load from or create. Defaults to None.
+            snapshotAge (float, optional): Age in hours below which the snapshot is used without checking the RSM API. Defaults to 0.0.
+            cacheSize (int, optional): Maximum number of cached responses. Defaults to DEFAULT_CACHE_SIZE.
+        """
+        self.dataDir = dataDir
+        self.noskip = noskip
+        self.snapshot = snapshot
+        self.snapshotAge = snapshotAge
+        self.cache = RenderCache(cacheSize)
+        self.reloadLock = threading.Lock()
+        self.stopping = threading.Event()
+        self.dataset = Dataset(dataDir, noskip, snapshot, snapshotAge)
+        super().__init__(address, OutputRequestHandler)
+
+    def url(self) -> str:
+        """Returns the base URL for the server
+
+        Returns:
+            str: Base URL
+        """
+        host, port = self.server_address[:2]
+        return 'http://%s:%i' % (host, port)
+
+    def response(self, dataset: Dataset, outputFormat: str, query: Query) -> tuple:
+        """Returns the response for a request from the cache, rendering it
+        if it is not cached
+
+        Args:
+            dataset (Dataset): Dataset to render from
+            outputFormat (str): Output format, one of FORMATS
+            query (Query): Filters
+
+        Returns:
+            tuple: ETag and body
+        """
+        key = (dataset.generation, outputFormat) + query.key()
+        entry = self.cache.get(key)
+        if entry is None:
+            licences, sites, links = dataset.filter(query)
+            body = render(outputFormat, query, licences, sites, links, dataset.loaded)
+            entry = ('"%s"' % hashlib.sha256(body).hexdigest()[:32], body)
+            self.cache.put(key, entry)
+        return entry
+
+    def reload(self) -> bool:
+        """Reloads the dataset, the current dataset is kept if the load fails
+
+        Returns:
+            bool: True if the dataset was reloaded
+        """
+        with self.reloadLock:
+            logging.info('Reloading the licence information')
+            try:
+                dataset = Dataset(self.dataDir, self.noskip, self.snapshot,
+                                  self.snapshotAge, self.dataset.generation + 1)
+            except Exception:
+                logging.exception('Unable to reload the licence information, keeping the existing data')
+                return False
+            self.dataset = dataset
+            self.cache.clear()
+            logging.info('Loaded %i licences at %i sites' % (len(dataset.licences), len(dataset.sites)))
+            return True
+
+    def watch(self, interval: float=DEFAULT_POLL_INTERVAL) -> None:
+        """Reloads the dataset whenever the data files change, until the
+        server is closed
+
+        Args:
+            interval (float, optional): Seconds between checks. Defaults to DEFAULT_POLL_INTERVAL.
+        """
+        while not self.stopping.wait(interval):
+            if repeaters.dataSignature(self.dataDir) != self.dataset.signature:
+                logging.info('The data files in %s have changed' % self.dataDir)
+                self.reload()
+
+    def status(self) -> dict:
+        """Returns the status of the server
+
+        Returns:
+            dict: Dataset and cache statistics
+        """
+        dataset = self.dataset
+        return {'loaded': dataset.loaded.isoformat(),
+                'generation': dataset.generation,
+                'licences': len(dataset.licences),
+                'sites': len(dataset.sites),
+                'links': len(dataset.links),
+                'cache': {'entries': len(self.cache.entries),
+                          'size': self.cache.size,
+                          'hits': self.cache.hits,
+                          'misses': self.cache.misses}}
+
+    def server_close(self) -> None:
+        self.stopping.set()
+        super().server_close()
+
+def main(argv: list=None) -> None:
+    """Main for rpt serve
+
+    Args:
+        argv (list, optional): Command line arguments after serve. Defaults to sys.argv[1:].
+    """
+    parser = optparse.OptionParser(usage='%prog serve [options]')
+    parser.add_option('-p','--port', action='store', type='int', dest='port',
+                      default=8080, help='Port to listen on')
+    parser.add_option('-H','--host', action='store', type='string', dest='host',
+                      default='127.0.0.1', help='Address to listen on')
+    repeaters.addDataOptions(parser)
+    parser.add_option('--cache-size', action='store', type='int', dest='cacheSize',
+                      default=DEFAULT_CACHE_SIZE, help='Maximum number of rendered responses to cache')
+    parser.add_option('--poll', action='store', type='float', dest='poll',
+                      default=DEFAULT_POLL_INTERVAL, help='Seconds between checks for changed data files, 0 to only reload on SIGHUP')
+    (options, args) = parser.parse_args(argv)
+
+    if args:
+        parser.error('Unexpected arguments %s' % ' '.join(args))
+    dataDir = repeaters.applyDataOptions(parser, options)
+    if options.snapshot:
+        options.snapshot = os.path.abspath(options.snapshot)
+
+    # The KMZ icons are read relative to the program's directory
+    os.chdir(os.path.dirname(repeaters.module_path()))
+
+    server = OutputServer((options.host, options.port), dataDir, options.noskip,
+                          options.snapshot, options.snapshotAge, options.cacheSize)
+    if options.poll > 0:
+        threading.Thread(target=server.watch, args=(options.poll,), daemon=True).start()
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP,
+                      lambda signum, frame: threading.Thread(target=server.reload, daemon=True).start())
+    print('Serving %i licences on %s' % (len(server.dataset.licences), server.url()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -0,0 +1,448 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable
+## from the RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+"""Binary snapshots of the licence information.
+
+A snapshot holds the sites, licences, licensees and links built from the
+data files and the RSM API so that a later run can load them without
+parsing the data files or fetching each licence from the API.
+
+The file starts with a header followed by a table giving the offset and
+length of each section. All strings are stored once in a string table and
+referenced by index, the remaining sections are arrays of fixed size
+little endian records so they can be read directly from a memory mapping.
+
+The header records a key for the local inputs (program version, data files
+and filter options) and a key for the list of licences returned by the RSM
+API, a snapshot is only used when both match the current run. The licence
+list has no change marker for each licence, so a change that only shows in
+the details of a licence (eg the site height or emission) does not
+invalidate a snapshot, delete the snapshot to pick it up.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from repeaters import instrument
+from repeaters.repeaters import __version__, DATA_FILES, dataFile, \
+    T_BEACON, T_DIGI, T_REPEATER, T_TV, \
+    Coordinate, Ctcss, Licence, Licensee, Link, Site, \
+    getLicenceRecords, readLicenceInfo
+
+MAGIC = b'NZRS'
+FORMAT_VERSION = 3
+
+# Header: magic, format version, section count, local key, upstream key,
+# creation time
+HEADER = struct.Struct('<4sHH32s32sd')
+SECTION = struct.Struct('<QQ')
+
+# Sections in the order they appear in the section table
+S_STRING_OFFSETS = 0
+S_STRINGS = 1
+S_SITES = 2
+S_LICENCES = 3
+S_LICENSEES = 4
+S_LINKS = 5
+S_NUMBER_INDEX = 6
+SECTION_COUNT = 7
+
+# Number of times a snapshot was used or had to be rebuilt
+stats = {'hits': 0, 'misses': 0}
+
+# Records, string fields are indexes into the string table
+STRING_OFFSET = struct.Struct('<I')
+# name, map reference, latitude, longitude, height
+SITE_RECORD = struct.Struct('<IIddi')
+# key, type, frequency, site row, licensee, number, name, branch,
+# trustee 1, trustee 2, note, callsign, CTCSS frequency, CTCSS note,
+# input offset
+LICENCE_RECORD = struct.Struct('<IIdIIiIIIIIIdId')
+# name, address (lines separated by ADDRESS_SEPARATOR)
+LICENSEE_RECORD = struct.Struct('<II')
+# name, end 1 latitude, end 1 longitude, end 2 latitude, end 2 longitude,
+# end 1 licence number, end 2 licence number
+LINK_RECORD = struct.Struct('<Iddddii')
+# licence number, licence row
+NUMBER_INDEX_RECORD = struct.Struct('<iI')
+
+ADDRESS_SEPARATOR = '\x1f'
+
+
+def inputKey(dataDir: str, filters: tuple) -> bytes:
+    """Returns the key for the local inputs to a snapshot, this changes if
+    the program, any of the data files or the filter options change.
+
+    Args:
+        dataDir (str): Folder containing the data files
+        filters (tuple): Filter options passed to readLicenceInfo()
+
+    Returns:
+        bytes: SHA-256 digest of the inputs
+    """
+    key = hashlib.sha256()
+    key.update(('%s %i %r' % (__version__, FORMAT_VERSION, filters)).encode('utf-8'))
+    for fileName in DATA_FILES:
+        key.update(fileName.encode('utf-8'))
+        try:
+            with open(dataFile(dataDir, fileName), 'rb') as f:
+                key.update(hashlib.sha256(f.read()).digest())
+        except FileNotFoundError:
+            key.update(b'missing')
+    return key.digest()
+
+def upstreamKey(records: list) -> bytes:
+    """Returns the key for the list of licences returned by the RSM API,
+    this does not cover the details fetched for each licence
+
+    Args:
+        records (list): Basic licence records from getLicenceRecords()
+
+    Returns:
+        bytes: SHA-256 digest of the records
+    """
+    return hashlib.sha256(json.dumps(records, sort_keys=True).encode('utf-8')).digest()
+
+def saveSnapshot(fileName: str, localKey: bytes, remoteKey: bytes,
+                 sites: dict, licences: dict, licensees: dict,
+                 links: list) -> None:
+    """Saves the given licence information to a snapshot file, the file is
+    written to a temporary file and then renamed so a partially written
+    snapshot is never read.
+
+    Args:
+        fileName (str): Snapshot file name
+        localKey (bytes): Key for the local inputs
+        remoteKey (bytes): Key for the RSM API licence list
+        sites (dict): Sites indexed by name
+        licences (dict): Licences indexed by licence key
+        licensees (dict): Licensees indexed by name
+        links (list): Links between licences
+    """
+    strings = {}
+
+    def stringIndex(s: str) -> int:
+        if s not in strings:
+            strings[s] = len(strings)
+        return strings[s]
+
+    siteRows = {}
+    siteData = bytearray()
+    for name, site in sites.items():
+        siteRows[name] = len(siteRows)
+        siteData += SITE_RECORD.pack(stringIndex(name), stringIndex(site.mapRef),
+                                     site.coordinates.lat, site.coordinates.lon,
+                                     site.height)
+
+    licenceData = bytearray()
+    numbers = []
+    for row, (key, licence) in enumerate(licences.items()):
+        if licence.ctcss is None:
+            ctcssFreq = math.nan
+            ctcssNote = ''
+        else:
+            ctcssFreq = licence.ctcss.freq
+            ctcssNote = licence.ctcss.note
+        licenceData += LICENCE_RECORD.pack(stringIndex(key),
+                                           stringIndex(licence.licType),
+                                           licence.frequency,
+                                           siteRows[licence.site],
+                                           stringIndex(licence.licensee),
+                                           licence.number,
+                                           stringIndex(licence.name),
+                                           stringIndex(licence.branch),
+                                           stringIndex(licence.trustee1),
+                                           stringIndex(licence.trustee2),
+                                           stringIndex(licence.note),
+                                           stringIndex(licence.callsign),
+                                           ctcssFreq,
+                                           stringIndex(ctcssNote),
+                                           math.nan if licence.offset is None else licence.offset)
+        numbers.append((licence.number, row))
+
+    licenseeData = bytearray()
+    for name, licensee in licensees.items():
+        licenseeData += LICENSEE_RECORD.pack(stringIndex(name),
+                                             stringIndex(ADDRESS_SEPARATOR.join(licensee.address)))
+
+    linkData = bytearray()
+    for link in links:
+        linkData += LINK_RECORD.pack(stringIndex(link.name),
+                                     link.end1.lat, link.end1.lon,
+                                     link.end2.lat, link.end2.lon,
+                                     *link.numbers)
+
+    indexData = bytearray()
+    for number, row in sorted(numbers):
+        indexData += NUMBER_INDEX_RECORD.pack(number, row)
+
+    stringData = bytearray()
+    offsetData = bytearray(STRING_OFFSET.pack(0))
+    for s in strings:
+        stringData += s.encode('utf-8')
+        offsetData += STRING_OFFSET.pack(len(stringData))
+
+    sections = [offsetData, stringData, siteData, licenceData, licenseeData,
+                linkData, indexData]
+    offset = HEADER.size + SECTION.size * SECTION_COUNT
+    table = bytearray()
+    for data in sections:
+        table += SECTION.pack(offset, len(data))
+        offset += len(data)
+
+    folder = os.path.dirname(os.path.abspath(fileName))
+    fd, tempName = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, SECTION_COUNT,
+                                localKey, remoteKey, time.time()))
+            f.write(table)
+            for data in sections:
+                f.write(data)
+        os.replace(tempName, fileName)
+    except:
+        os.remove(tempName)
+        raise
+
+class Snapshot:
+    '''
+    Memory mapped snapshot file
+    '''
+    def __init__(self, fileName: str) -> None:
+        """Opens and memory maps the snapshot file
+
+        Args:
+            fileName (str): Snapshot file name
+
+        Raises:
+            ValueError: If the file is not a snapshot of the current format
+        """
+        with open(fileName, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, count, self.localKey, self.upstreamKey, self.created = \
+                HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC or version != FORMAT_VERSION or count != SECTION_COUNT:
+                raise ValueError('%s is not a version %i snapshot' % (fileName, FORMAT_VERSION))
+            self.view = memoryview(self.map)
+            self.sections = [SECTION.unpack_from(self.map, HEADER.size + SECTION.size * i)
+                             for i in range(SECTION_COUNT)]
+        except:
+            self.map.close()
+            raise
+        self.strings = {}
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes the memory mapping
+        """
+        self.view.release()
+        self.map.close()
+
+    def age(self) -> float:
+        """Returns the age of the snapshot
+
+        Returns:
+            float: Age in hours
+        """
+        return (time.time() - self.created) / 3600
+
+    def records(self, section: int, record: struct.Struct) -> 'iter[tuple]':
+        """Iterates over the records in a section without copying them
+
+        Args:
+            section (int): Section number
+            record (struct.Struct): Record structure
+
+        Returns:
+            iter[tuple]: Unpacked records
+        """
+        offset, length = self.sections[section]
+        return record.iter_unpack(self.view[offset:offset + length])
+
+    def string(self, index: int) -> str:
+        """Returns a string from the string table
+
+        Args:
+            index (int): Index of the string
+
+        Returns:
+            str: The string
+        """
+        if index not in self.strings:
+            offsets = self.sections[S_STRING_OFFSETS][0]
+            base = self.sections[S_STRINGS][0]
+            start, end = struct.unpack_from('<II', self.map, offsets + STRING_OFFSET.size * index)
+            self.strings[index] = str(self.view[base + start:base + end], 'utf-8')
+        return self.strings[index]
+
+    def findLicences(self, number: int) -> 'list[int]':
+        """Finds the licence rows with the given licence number using the
+        licence number index
+
+        Args:
+            number (int): Licence number
+
+        Returns:
+            list[int]: Rows in the licence section
+        """
+        offset, length = self.sections[S_NUMBER_INDEX]
+
+        def entry(i):
+            return NUMBER_INDEX_RECORD.unpack_from(self.map, offset + NUMBER_INDEX_RECORD.size * i)
+
+        # Binary search for the first entry with the licence number
+        low = 0
+        high = count = length // NUMBER_INDEX_RECORD.size
+        while low < high:
+            middle = (low + high) // 2
+            if entry(middle)[0] < number:
+                low = middle + 1
+            else:
+                high = middle
+        rows = []
+        while low < count and entry(low)[0] == number:
+            rows.append(entry(low)[1])
+            low += 1
+        return rows
+
+    def load(self) -> tuple:
+        """Builds the licence information stored in the snapshot
+
+        Returns:
+            tuple: sites, licences, licensees and links
+        """
+        s = self.string
+        sites = {}
+        siteList = []
+        for name, mapRef, lat, lon, height in self.records(S_SITES, SITE_RECORD):
+            site = Site(s(name), s(mapRef), Coordinate(lat, lon), height)
+            sites[site.name] = site
+            siteList.append(site)
+
+        licences = {}
+        for key, licType, frequency, siteRow, licensee, number, name, branch, \
+                trustee1, trustee2, note, callsign, ctcssFreq, ctcssNote, offset \
+                in self.records(S_LICENCES, LICENCE_RECORD):
+            site = siteList[siteRow]
+            licence = Licence(s(licType), frequency, site.name, s(licensee),
+                              number, s(name), s(branch), s(trustee1),
+                              s(trustee2), s(note), s(callsign))
+            if not math.isnan(ctcssFreq):
+                licence.setCtcss(Ctcss(ctcssFreq, s(ctcssNote)))
+            if not math.isnan(offset):
+                licence.setOffset(offset)
+            if licence.licType == T_BEACON:
+                site.addBeacon(licence)
+            elif licence.licType == T_DIGI:
+                site.addDigipeater(licence)
+            elif licence.licType == T_REPEATER:
+                site.addRepeater(licence)
+            elif licence.licType == T_TV:
+                site.addTvRepeater(licence)
+            licences[s(key)] = licence
+
+        licensees = {}
+        for name, address in self.records(S_LICENSEES, LICENSEE_RECORD):
+            licensees[s(name)] = Licensee(s(name), s(address).split(ADDRESS_SEPARATOR))
+
+        links = [Link(s(name), Coordinate(lat1, lon1), Coordinate(lat2, lon2), (number1, number2))
+                 for name, lat1, lon1, lat2, lon2, number1, number2 in self.records(S_LINKS, LINK_RECORD)]
+
+        return sites, licences, licensees, links
+
+def openSnapshot(fileName: str) -> Snapshot:
+    """Opens the given snapshot file if it exists and is valid
+
+    Args:
+        fileName (str): Snapshot file name
+
+    Returns:
+        Snapshot: The snapshot or None if it could not be opened
+    """
+    try:
+        return Snapshot(fileName)
+    except FileNotFoundError:
+        logging.info('Snapshot %s does not exist' % fileName)
+    except (ValueError, struct.error) as e:
+        logging.warning('Ignoring invalid snapshot %s: %s' % (fileName, e))
+    return None
+
+def cachedLicenceInfo(fileName: str, maxAge: float, dataDir: str,
+                      filters: tuple) -> tuple:
+    """Returns the licence information from the given snapshot if it is up
+    to date, otherwise reads it using readLicenceInfo() and saves a new
+    snapshot.
+
+    The snapshot is up to date if the local inputs have not changed and
+    either it is less than maxAge hours old or the list of licences returned
+    by the RSM API has not changed.
+
+    Args:
+        fileName (str): Snapshot file name
+        maxAge (float): Age in hours below which the RSM API is not checked
+        dataDir (str): Folder containing the data files
+        filters (tuple): Filter options passed to readLicenceInfo()
+
+    Returns:
+        tuple: sites, licences, licensees and links
+    """
+    localKey = inputKey(dataDir, filters)
+    snapshot = openSnapshot(fileName)
+    records = None
+    if snapshot is not None:
+        with snapshot:
+            if snapshot.localKey != localKey:
+                logging.info('Snapshot %s is out of date with the data files' % fileName)
+            elif snapshot.age() < maxAge:
+                logging.info('Loading snapshot %s' % fileName)
+                stats['hits'] += 1
+                with instrument.stage('loadSnapshot'):
+                    return snapshot.load()
+            else:
+                records = getLicenceRecords(*filters[:6])
+                if snapshot.upstreamKey == upstreamKey(records):
+                    logging.info('Loading snapshot %s' % fileName)
+                    stats['hits'] += 1
+                    with instrument.stage('loadSnapshot'):
+                        return snapshot.load()
+                logging.info('Snapshot %s is out of date with the RSM database' % fileName)
+
+    stats['misses'] += 1
+    if records is None:
+        records = getLicenceRecords(*filters[:6])
+    sites, licences, licensees, links = readLicenceInfo(dataDir, *filters, records)
+    with instrument.stage('saveSnapshot'):
+        saveSnapshot(fileName, localKey, upstreamKey(records),
+                     sites, licences, licensees, links)
+    return sites, licences, licensees, links
@@ -0,0 +1,334 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+"""Synthetic licence datasets for benchmarking.
+
+Generates a data folder (callsigns.csv, ctcss.csv, info.csv, links.csv,
+skip.csv and version) and a fixture folder for the stand-in RSM API server
+with a multiple of today's amateur licence volume. The licence frequencies
+are spread across the amateur bands in the same proportions as the real
+data and the sites are placed on Topo50 map sheets so they fall within the
+NZTM bounds of New Zealand.
+
+A synthetic elevation model of hills over the same bounds can also be
+generated for the coverage prediction.
+"""
+
+import csv
+import datetime
+import json
+import math
+import optparse
+import os
+import random
+import shutil
+
+from mapping import topo50
+from mapping.nz_coords import nztmToTopo50
+from mapping.nztm import nztm_geod
+
+# Approximate amateur volumes at scale 1
+BASE_LICENCES = 450
+LICENCES_PER_SITE = 2.2
+
+# Licence types with their RSM type code and relative weight
+LICENCE_TYPES = (('Amateur Repeater', 'H1', 60),
+                 ('Amateur Beacon', 'H2', 25),
+                 ('Amateur Digipeater', 'H3', 12),
+                 ('Amateur TV Repeater', 'H9', 3))
+
+# Frequency ranges for each licence type as (minimum, maximum, step, weight)
+FREQUENCIES = {'Amateur Repeater': ((53.0, 53.975, 0.025, 10),
+                                    (145.325, 147.975, 0.025, 55),
+                                    (433.0, 434.975, 0.025, 3),
+                                    (438.0, 439.975, 0.0125, 28),
+                                    (1270.0, 1299.975, 0.025, 4)),
+               'Amateur Beacon': ((28.2, 28.3, 0.001, 10),
+                                  (50.0, 50.1, 0.001, 15),
+                                  (144.4, 144.5, 0.001, 25),
+                                  (432.4, 432.5, 0.001, 25),
+                                  (1296.8, 1296.9, 0.001, 15),
+                                  (2403.0, 2403.5, 0.001, 5),
+                                  (10368.0, 10368.5, 0.001, 5)),
+               'Amateur Digipeater': ((144.575, 144.575, 0.025, 60),
+                                      (144.65, 144.7, 0.05, 25),
+                                      (432.975, 432.975, 0.025, 15)),
+               'Amateur TV Repeater': ((506.0, 506.0, 1.0, 50),
+                                       (1250.0, 1290.0, 5.0, 50))}
+
+CTCSS_TONES = (67.0, 71.9, 77.0, 82.5, 88.5, 94.8, 100.0, 103.5, 110.9,
+               118.8, 123.0, 127.3, 131.8, 136.5, 141.3, 151.4, 162.2, 173.8)
+
+# Fraction of licences with each kind of additional information
+INFO_COVERAGE = 0.95
+CTCSS_COVERAGE = 0.06
+CALLSIGN_COVERAGE = 0.11
+SKIP_COVERAGE = 0.12
+LINK_COVERAGE = 0.11
+NATIONAL_SYSTEM = 0.15
+DMR = 0.05
+
+# Synthetic data folders use the real band plan
+BAND_PLAN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'bandplan.csv')
+
+# NZTM bounds of the synthetic elevation model as (west, south, east, north)
+DEM_BOUNDS = (1000000, 4700000, 2100000, 6250000)
+DEM_CELL_SIZE = 1000
+DEM_HILLS = 400
+
+PLACE_PREFIXES = ('Mount', 'Mt', 'Te', 'Port', 'Cape', 'Lake', 'Glen', '')
+PLACE_WORDS = ('Aroha', 'Ruapehu', 'Kaukau', 'Climie', 'Obelisk', 'Kaikoura',
+               'Hikurangi', 'Egmont', 'Tauhara', 'Cass', 'Pirongia', 'Horohoro',
+               'Otari', 'Belmont', 'Wharite', 'Taranaki', 'Te Aroha', 'Kapiti',
+               'Colonial', 'Marton', 'Otahuna', 'Waitakere', 'Hummock', 'Sugarloaf')
+LICENSEES = (('NEW ZEALAND ASSOCIATION OF RADIO TRANSMITTERS INCORPORATED', 85,
+              'PO Box 1733, Christchurch 8140, New Zealand'),
+             ('AMATEUR RADIO EMERGENCY COMMUNICATIONS', 8,
+              '12 Radio Road, Wellington 6011, New Zealand'),
+             ('CANTERBURY AMATEUR RADIO DIGITAL SOCIETY', 4,
+              '1 Cass Peak Road, Christchurch 8042, New Zealand'),
+             ('PRIVATE LICENSEE', 3,
+              '99 Example Street, Auckland 1010, New Zealand'))
+
+def weighted(rnd: random.Random, items: tuple, weightIndex: int=-1):
+    """Returns a random item from the given items using the weight in each item
+
+    Args:
+        rnd (random.Random): Random number generator
+        items (tuple): Items to choose from
+        weightIndex (int, optional): Index of the weight in each item. Defaults to -1.
+
+    Returns:
+        Chosen item
+    """
+    return rnd.choices(items, weights=[i[weightIndex] for i in items])[0]
+
+def callsign(rnd: random.Random) -> str:
+    """Returns a random NZ amateur callsign
+
+    Args:
+        rnd (random.Random): Random number generator
+
+    Returns:
+        str: Callsign
+    """
+    return 'ZL%i%s' % (rnd.randint(1, 4),
+                       ''.join(rnd.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+                               for i in range(rnd.randint(2, 3))))
+
+def frequency(rnd: random.Random, licType: str) -> float:
+    """Returns a random frequency for the given licence type
+
+    Args:
+        rnd (random.Random): Random number generator
+        licType (str): Licence type
+
+    Returns:
+        float: Frequency in MHz
+    """
+    fMin, fMax, step, weight = weighted(rnd, FREQUENCIES[licType])
+    return round(fMin + step * rnd.randint(0, int(round((fMax - fMin) / step))), 4)
+
+def siteLocation(rnd: random.Random, sheets: list) -> tuple:
+    """Returns a random site location on one of the given Topo50 map sheets
+
+    Args:
+        rnd (random.Random): Random number generator
+        sheets (list): Topo50 map sheet details
+
+    Returns:
+        tuple: Topo50 map reference, latitude and longitude
+    """
+    sheet = rnd.choice(sheets)
+    easting = rnd.uniform(sheet['min_easting'], sheet['max_easting'] - 1)
+    northing = rnd.uniform(sheet['min_northing'], sheet['max_northing'] - 1)
+    lat, lon = nztm_geod(easting, northing)
+    return nztmToTopo50(easting, northing), round(math.degrees(lat), 4), round(math.degrees(lon), 4)
+
+def generateDataset(scale: float=1.0, seed: int=1) -> dict:
+    """Generates a synthetic dataset
+
+    Args:
+        scale (float, optional): Multiple of today's amateur licence volume. Defaults to 1.0.
+        seed (int, optional): Random seed. Defaults to 1.
+
+    Returns:
+        dict: Dataset with the basic licence records and licence details for
+              the RSM API and the rows for each of the data files
+    """
+    rnd = random.Random(seed)
+    numLicences = max(1, int(round(BASE_LICENCES * scale)))
+    numSites = max(1, int(round(numLicences / LICENCES_PER_SITE)))
+    # Only use single sheets that are entirely within the Topo50 grid
+    sheets = [s for name, s in topo50.maps.items()
+              if '/' not in name and
+              s['min_easting'] >= min(topo50.east_min.values()) and
+              s['max_easting'] <= max(topo50.east_max.values()) and
+              s['min_northing'] >= min(topo50.north_min.values()) and
+              s['max_northing'] <= max(topo50.north_max.values())]
+
+    sites = []
+    siteNames = set()
+    while len(sites) < numSites:
+        name = ' '.join(w for w in (rnd.choice(PLACE_PREFIXES), rnd.choice(PLACE_WORDS)) if w).upper()
+        if name in siteNames:
+            name = '%s %i' % (name, len(sites))
+        siteNames.add(name)
+        mapRef, lat, lon = siteLocation(rnd, sheets)
+        sites.append({'name': name, 'mapRef': mapRef, 'lat': lat, 'lon': lon,
+                      'height': rnd.randint(0, 2000)})
+
+    dataset = {'records': [], 'details': {},
+               'callsigns': [], 'ctcss': [], 'info': [], 'links': [], 'offsets': [],
+               'skip': []}
+    repeaters = []
+    for i in range(numLicences):
+        number = 100000 + i
+        licenceId = 1000000 + number
+        licType, typeCode, weight = weighted(rnd, LICENCE_TYPES)
+        licensee, weight, address = weighted(rnd, LICENSEES, 1)
+        site = rnd.choice(sites)
+        freq = frequency(rnd, licType)
+        dataset['records'].append({'licenceID': licenceId,
+                                   'licenceNumber': number,
+                                   'licenceType': licType,
+                                   'licenceTypeCode': typeCode,
+                                   'frequency': freq,
+                                   'location': site['name'],
+                                   'gridReference': site['mapRef'],
+                                   'licensee': licensee,
+                                   'status': 'Current'})
+        dataset['details'][licenceId] = {'licenceID': licenceId,
+                                         'licenceNumber': number,
+                                         'baseCallsign': callsign(rnd),
+                                         'clientDetails': {'physicalAddress': address},
+                                         'summary': {'gridReference': '%0.4f %0.4f' % (site['lat'], site['lon'])},
+                                         'transmitLocations': [{'locationName': site['name'],
+                                                                'locationAltitude': site['height']}]}
+        if rnd.random() < INFO_COVERAGE:
+            name = site['name'].title()
+            r = rnd.random()
+            if r < NATIONAL_SYSTEM:
+                name += ' National System'
+            elif r < NATIONAL_SYSTEM + DMR:
+                name += ' DMR'
+            dataset['info'].append([number, name, str(rnd.randint(1, 90)),
+                                    callsign(rnd), callsign(rnd) if rnd.random() < 0.7 else '',
+                                    rnd.choice(('', '', 'Under construction', 'Linked to <b>national</b> system'))])
+        if rnd.random() < CALLSIGN_COVERAGE:
+            dataset['callsigns'].append([number, callsign(rnd)])
+        if licType == 'Amateur Repeater':
+            repeaters.append(number)
+            if rnd.random() < CTCSS_COVERAGE:
+                dataset['ctcss'].append([number, rnd.choice(CTCSS_TONES), 'Activation'])
+        if rnd.random() < SKIP_COVERAGE:
+            dataset['skip'].append([number, freq if rnd.random() < 0.5 else 0, 'Synthetic skip'])
+    for i in range(int(len(repeaters) * LINK_COVERAGE)):
+        end1, end2 = rnd.sample(repeaters, 2)
+        dataset['links'].append([end1, end2, 'Link %i National System' % i])
+    return dataset
+
+def writeDataFolder(dataset: dict, folder: str, dataDate: datetime.datetime=None) -> None:
+    """Writes the data files for the dataset to the given folder
+
+    Args:
+        dataset (dict): Synthetic dataset
+        folder (str): Folder to write the files to
+        dataDate (datetime.datetime, optional): Date for the version file. Defaults to today.
+    """
+    os.makedirs(folder, exist_ok=True)
+    for name in ('callsigns', 'ctcss', 'info', 'links', 'offsets', 'skip'):
+        with open(os.path.join(folder, name + '.csv'), 'w', newline='') as f:
+            f.write('# Synthetic %s\n' % name)
+            csv.writer(f).writerows(dataset[name])
+    shutil.copyfile(BAND_PLAN, os.path.join(folder, 'bandplan.csv'))
+    if dataDate is None:
+        dataDate = datetime.datetime.now()
+    with open(os.path.join(folder, 'version'), 'w') as f:
+        f.write(dataDate.strftime('%d/%m/%Y'))
+
+def writeDem(fileName: str, seed: int=1, cellSize: float=DEM_CELL_SIZE) -> None:
+    """Writes a synthetic elevation model of random hills as an ESRI binary
+    grid
+
+    Args:
+        fileName (str): Grid file name, the header is written to a .hdr file of the same name
+        seed (int, optional): Random seed. Defaults to 1.
+        cellSize (float, optional): Size of the cells in metres. Defaults to DEM_CELL_SIZE.
+    """
+    import numpy
+    from repeaters.coverage import Dem, writeBinaryGrid
+
+    west, south, east, north = DEM_BOUNDS
+    rnd = numpy.random.default_rng(seed)
+    eastings = west + (numpy.arange(int((east - west) / cellSize)) + 0.5) * cellSize
+    northings = north - (numpy.arange(int((north - south) / cellSize)) + 0.5) * cellSize
+    heights = numpy.zeros((len(northings), len(eastings)), dtype=numpy.float32)
+    for i in range(DEM_HILLS):
+        e = rnd.uniform(west, east)
+        n = rnd.uniform(south, north)
+        size = rnd.uniform(3000, 40000)
+        peak = rnd.uniform(100, 1200)
+        dx = numpy.exp(-((eastings - e) / size) ** 2 / 2)
+        dy = numpy.exp(-((northings - n) / size) ** 2 / 2)
+        heights += peak * numpy.outer(dy, dx).astype(numpy.float32)
+    writeBinaryGrid(fileName, Dem(heights, west, north, cellSize))
+
+def writeFixtures(dataset: dict, folder: str) -> None:
+    """Writes the RSM API responses for the dataset to the given folder in the
+    layout used by the stand-in server
+
+    Args:
+        dataset (dict): Synthetic dataset
+        folder (str): Folder to write the fixtures to
+    """
+    detailDir = os.path.join(folder, 'licences')
+    os.makedirs(detailDir, exist_ok=True)
+    with open(os.path.join(folder, 'licences.json'), 'w', encoding='utf-8') as f:
+        json.dump(dataset['records'], f)
+    for licenceId, detail in dataset['details'].items():
+        with open(os.path.join(detailDir, '%i.json' % licenceId), 'w', encoding='utf-8') as f:
+            json.dump(detail, f)
+
+def main() -> None:
+    """Main
+    """
+    parser = optparse.OptionParser(usage='%prog [options] data-folder fixture-folder')
+    parser.add_option('-s','--scale', action='store', type='float', dest='scale',
+                      default=1.0, help='Multiple of the current amateur licence volume')
+    parser.add_option('-S','--seed', action='store', type='int', dest='seed',
+                      default=1, help='Random seed')
+    parser.add_option('--dem', action='store', type='string', dest='dem',
+                      default=None, help='Also write a synthetic elevation model to the given .flt file')
+    (options, args) = parser.parse_args()
+    if len(args) != 2:
+        parser.error('A data folder and fixture folder must be given')
+
+    dataset = generateDataset(options.scale, options.seed)
+    writeDataFolder(dataset, args[0])
+    writeFixtures(dataset, args[1])
+    print('Generated %i licences at %i sites' % (
+          len(dataset['records']), len(set(r['location'] for r in dataset['records']))))
+    if options.dem is not None:
+        writeDem(options.dem, options.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,595 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Updating the data files from the update server.
+
+The update server publishes:
+    version             date of the data files as dd/mm/yyyy
+    data.zip            the data files
+    data.zip.sha256     SHA-256 checksum of data.zip (sha256sum format)
+    manifest.json       version, SHA-256 hash and size of each data file and
+                        the patches available for it
+    *.csv               the individual data files
+    *.patch.json        line patches from the previously published version
+                        of a data file to the current one
+
+When a manifest is published only the data files whose hash differs from
+the local copy are fetched, using a patch from the local copy when one is
+available, otherwise the whole file. Every file is checked against the hash
+in the manifest, if the delta update fails the whole data.zip is fetched.
+
+Requests are conditional on the ETag and Last-Modified validators from the
+previous update, which are kept in .update.json in the data folder, so an
+unchanged version costs a 304 response. data.zip is streamed to a .part
+file, an interrupted download is resumed with a Range request on the next
+update, and the archive is verified against the published checksum before
+it is extracted to a staging folder and moved into the data folder. The
+version file is replaced last so a failed update is retried.
+
+The update files can be created with:
+    python -m repeaters.update source-data-folder publish-folder
+and served for testing with:
+    python -m repeaters.updateserver publish-folder
+"""
+
+import datetime
+import difflib
+import hashlib
+import http.client
+import json
+import logging
+import optparse
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import zipfile
+
+from repeaters.publish import atomicFile, fileHash
+from repeaters.repeaters import DATA_FILES, UPDATE_URL, __version__
+
+STATE_FILE = '.update.json'
+VERSION_FILE = 'version'
+ARCHIVE = 'data.zip'
+MANIFEST = 'manifest.json'
+PATCH_SUFFIX = '.patch.json'
+CHECKSUM_SUFFIX = '.sha256'
+PART_SUFFIX = '.part'
+BUFFER_SIZE = 1 << 20
+TIMEOUT = 60
+# Fixed member dates so republishing unchanged data gives an identical archive
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+class UpdateError(Exception):
+    '''
+    Raised when an update can not be completed
+    '''
+
+def loadState(folder: str) -> dict:
+    """Loads the validators saved by the previous update
+
+    Args:
+        folder (str): Data folder
+
+    Returns:
+        dict: Validators indexed by URL
+    """
+    try:
+        with open(os.path.join(folder, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logging.warning('Ignoring invalid %s: %s' % (STATE_FILE, e))
+        return {}
+
+def saveState(folder: str, state: dict) -> None:
+    """Saves the validators for the next update
+
+    Args:
+        folder (str): Data folder
+        state (dict): Validators indexed by URL
+    """
+    with atomicFile(os.path.join(folder, STATE_FILE)) as tempName:
+        with open(tempName, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+
+def validators(response) -> dict:
+    """Returns the validators of a response
+
+    Args:
+        response: HTTP response
+
+    Returns:
+        dict: ETag and Last-Modified values that were given
+    """
+    return {name: response.headers[header]
+            for name, header in (('etag', 'ETag'), ('lastModified', 'Last-Modified'))
+            if response.headers.get(header)}
+
+def conditionalHeaders(saved: dict) -> dict:
+    """Returns the headers for a request conditional on the saved validators
+
+    Args:
+        saved (dict): Validators of the copy held locally
+
+    Returns:
+        dict: Request headers
+    """
+    headers = {}
+    if 'etag' in saved:
+        headers['If-None-Match'] = saved['etag']
+    if 'lastModified' in saved:
+        headers['If-Modified-Since'] = saved['lastModified']
+    return headers
+
+def openUrl(url: str, headers: dict={}):
+    """Makes a GET request
+
+    Args:
+        url (str): URL
+        headers (dict, optional): Request headers. Defaults to {}.
+
+    Returns:
+        HTTP response or None if the response was 304 Not Modified
+    """
+    request = urllib.request.Request(url, headers=dict(headers, **{'User-Agent': 'nzrepeaters/' + __version__}))
+    try:
+        return urllib.request.urlopen(request, timeout=TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+def fetchVersion(url: str, saved: dict) -> tuple:
+    """Fetches the date of the data files on the update server
+
+    Args:
+        url (str): URL of the version file
+        saved (dict): Validators of the local version file, empty if there is none
+
+    Returns:
+        tuple: Date (None if not modified) and the validators of the response
+    """
+    response = openUrl(url, conditionalHeaders(saved))
+    if response is None:
+        return None, saved
+    with response:
+        text = response.read(64).decode('utf-8')
+        return datetime.datetime(*time.strptime(text[:10], "%d/%m/%Y")[0:5]), validators(response)
+
+def download(url: str, fileName: str, state: dict) -> bool:
+    """Downloads a file if it has changed, resuming an interrupted download
+
+    Args:
+        url (str): URL of the file
+        fileName (str): Local file name
+        state (dict): Validators indexed by URL, updated with those of the download
+
+    Raises:
+        UpdateError: If the download was incomplete, the part is kept to be resumed
+
+    Returns:
+        bool: True if the file was downloaded, False if the local copy is current
+    """
+    saved = state.get(url, {})
+    partName = fileName + PART_SUFFIX
+    headers = {}
+    offset = 0
+    partial = saved.get('partial')
+    if partial and os.path.isfile(partName):
+        offset = os.path.getsize(partName)
+        headers['Range'] = 'bytes=%i-' % offset
+        # Only resume if the file has not changed since the part was downloaded
+        headers['If-Range'] = partial.get('etag') or partial.get('lastModified')
+    elif os.path.isfile(fileName):
+        headers = conditionalHeaders(saved.get('complete', {}))
+
+    response = openUrl(url, headers)
+    if response is None:
+        logging.info('%s has not changed' % url)
+        return False
+    with response:
+        if response.status == 206:
+            rangeStart = int(response.headers.get('Content-Range', 'bytes -').split()[1].split('-')[0] or -1)
+            if rangeStart != offset:
+                raise UpdateError('Server resumed %s at %i instead of %i' % (url, rangeStart, offset))
+            logging.info('Resuming download of %s at %i bytes' % (url, offset))
+            mode = 'ab'
+        else:
+            offset = 0
+            mode = 'wb'
+        length = response.headers.get('Content-Length')
+        expected = offset + int(length) if length is not None else None
+        responseValidators = validators(response)
+        state[url] = {'complete': saved.get('complete', {}), 'partial': responseValidators}
+
+        start = time.perf_counter()
+        received = offset
+        with open(partName, mode) as f:
+            try:
+                while True:
+                    block = response.read(BUFFER_SIZE)
+                    if not block:
+                        break
+                    f.write(block)
+                    received += len(block)
+            except (OSError, http.client.HTTPException) as e:
+                logging.info('Download of %s interrupted: %r' % (url, e))
+    if expected is not None and received != expected:
+        raise UpdateError('Download of %s incomplete, received %i of %i bytes, it will be resumed on the next update' % (
+                          url, received, expected))
+
+    os.replace(partName, fileName)
+    state[url] = {'complete': responseValidators}
+    logging.info('Downloaded %s, %i bytes in %0.1fs' % (url, received - offset, time.perf_counter() - start))
+    return True
+
+def verify(url: str, fileName: str) -> None:
+    """Verifies a downloaded file against the checksum published with it,
+    files without a published checksum are not verified
+
+    Args:
+        url (str): URL of the file
+        fileName (str): Local file name
+
+    Raises:
+        UpdateError: If the checksum does not match
+    """
+    try:
+        response = openUrl(url + CHECKSUM_SUFFIX)
+    except urllib.error.HTTPError as e:
+        if e.code != 404:
+            raise
+        logging.warning('No checksum published for %s, it has not been verified' % url)
+        return
+    with response:
+        expected = response.read(1024).decode('utf-8').split()[0].lower()
+    actual = fileHash(fileName)
+    if actual != expected:
+        raise UpdateError('Checksum of %s does not match, expected %s got %s' % (url, expected, actual))
+
+def extract(archive: str, folder: str, version: datetime) -> 'list[str]':
+    """Extracts the data files into a staging folder and then moves them
+    into the data folder, finishing with the version file
+
+    Args:
+        archive (str): Archive file name
+        folder (str): Data folder
+        version (datetime): Date of the data files
+
+    Raises:
+        UpdateError: If the archive is corrupt or contains unexpected files
+
+    Returns:
+        list[str]: Names of the extracted files
+    """
+    with zipfile.ZipFile(archive) as z:
+        bad = z.testzip()
+        if bad is not None:
+            raise UpdateError('%s is corrupt at %s' % (archive, bad))
+        names = [info.filename for info in z.infolist() if not info.is_dir() and info.filename != VERSION_FILE]
+        for name in names:
+            if os.path.basename(name) != name or name.startswith('.'):
+                raise UpdateError('Unexpected file %s in %s' % (name, archive))
+
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=folder)
+        try:
+            for name in names:
+                with z.open(name) as src, open(os.path.join(staging, name), 'wb') as dst:
+                    shutil.copyfileobj(src, dst, BUFFER_SIZE)
+            install(staging, folder, names, version)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    return names
+
+def install(staging: str, folder: str, names: 'list[str]', version: datetime) -> None:
+    """Moves the data files from the staging folder into the data folder,
+    finishing with the version file
+
+    Args:
+        staging (str): Staging folder in the data folder
+        folder (str): Data folder
+        names (list[str]): Names of the staged data files
+        version (datetime): Date of the data files
+    """
+    with open(os.path.join(staging, VERSION_FILE), 'w') as f:
+        f.write(version.strftime("%d/%m/%Y"))
+    for name in list(names) + [VERSION_FILE]:
+        os.replace(os.path.join(staging, name), os.path.join(folder, name))
+
+def makePatch(old: bytes, new: bytes) -> list:
+    """Returns the line changes turning the old content into the new
+
+    Args:
+        old (bytes): Old file content
+        new (bytes): New file content
+
+    Returns:
+        list: Changes as [first old line, end old line, new lines]
+    """
+    # latin-1 maps every byte to a character so any content round trips
+    oldLines = old.decode('latin-1').splitlines(keepends=True)
+    newLines = new.decode('latin-1').splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, oldLines, newLines, autojunk=False)
+    return [[i1, i2, newLines[j1:j2]]
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+def applyPatch(old: bytes, changes: list) -> bytes:
+    """Applies the line changes from makePatch() to the old content
+
+    Args:
+        old (bytes): Old file content
+        changes (list): Changes from makePatch()
+
+    Returns:
+        bytes: New file content
+    """
+    lines = old.decode('latin-1').splitlines(keepends=True)
+    for start, end, newLines in reversed(changes):
+        lines[start:end] = newLines
+    return ''.join(lines).encode('latin-1')
+
+def fetch(url: str) -> bytes:
+    """Fetches a small file
+
+    Args:
+        url (str): URL of the file
+
+    Returns:
+        bytes: File content
+    """
+    with openUrl(url) as response:
+        return response.read()
+
+def fetchManifest(url: str, version: datetime) -> dict:
+    """Fetches the manifest of the data files
+
+    Args:
+        url (str): URL of the update folder
+        version (datetime): Date of the data files given by the version file
+
+    Returns:
+        dict: Manifest or None if no manifest for the version is published
+    """
+    try:
+        manifest = json.loads(fetch(url + MANIFEST))
+    except urllib.error.HTTPError as e:
+        if e.code != 404:
+            raise
+        logging.info('No manifest published, downloading %s' % ARCHIVE)
+        return None
+    if manifest.get('version') != version.strftime("%d/%m/%Y"):
+        logging.info('The manifest is for version %s, downloading %s' % (manifest.get('version'), ARCHIVE))
+        return None
+    return manifest
+
+def deltaUpdate(url: str, manifest: dict, folder: str, version: datetime) -> 'list[str]':
+    """Updates the data files that differ from the manifest, applying a
+    patch to the local copy where one is published
+
+    Args:
+        url (str): URL of the update folder
+        manifest (dict): Manifest from fetchManifest()
+        folder (str): Data folder
+        version (datetime): Date of the data files
+
+    Raises:
+        UpdateError: If a downloaded file does not match the manifest
+
+    Returns:
+        list[str]: Names of the updated files
+    """
+    names = []
+    received = 0
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=folder)
+    try:
+        for name, entry in manifest['files'].items():
+            if os.path.basename(name) != name or name.startswith('.') or name == VERSION_FILE:
+                raise UpdateError('Unexpected file %s in the manifest' % name)
+            fileName = os.path.join(folder, name)
+            localHash = fileHash(fileName) if os.path.isfile(fileName) else None
+            if localHash == entry['sha256']:
+                continue
+
+            content = None
+            patchName = entry.get('patches', {}).get(localHash)
+            if patchName is not None:
+                patch = fetch(url + patchName)
+                received += len(patch)
+                with open(fileName, 'rb') as f:
+                    content = applyPatch(f.read(), json.loads(patch))
+                if hashlib.sha256(content).hexdigest() != entry['sha256']:
+                    logging.info('Patch %s did not give the expected %s, downloading it' % (patchName, name))
+                    content = None
+                else:
+                    logging.info('Patched %s, %i bytes' % (name, len(patch)))
+            if content is None:
+                content = fetch(url + name)
+                received += len(content)
+                if hashlib.sha256(content).hexdigest() != entry['sha256']:
+                    raise UpdateError('Checksum of %s%s does not match the manifest' % (url, name))
+                logging.info('Downloaded %s, %i bytes' % (name, len(content)))
+            with open(os.path.join(staging, name), 'wb') as f:
+                f.write(content)
+            names.append(name)
+        install(staging, folder, names, version)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    print('Updated %i of %i data files, %i bytes downloaded' % (len(names), len(manifest['files']), received))
+    return names
+
+def updateData(dataFolder: str, localDate: datetime, url: str=UPDATE_URL) -> datetime:
+    """Updates the local data for the application from the internet if the files on
+    the internet are newer than the local copy.
+
+    Args:
+        dataFolder (str): folder to place downloaded data files in
+        localDate (datetime): date of the existing data files (datetime.min if they do not exist)
+        url (str, optional): URL of the update folder. Defaults to UPDATE_URL.
+
+    Returns:
+        datetime: Date of updated datafiles or None if data update unsusesful
+    """
+    if not url.endswith('/'):
+        url += '/'
+    # Validators for other update servers no longer apply
+    state = {key: value for key, value in loadState(dataFolder).items() if key.startswith(url)}
+    versionUrl = url + VERSION_FILE
+    try:
+        hasVersion = os.path.isfile(os.path.join(dataFolder, VERSION_FILE))
+        remoteDate, versionValidators = fetchVersion(versionUrl,
+                                                     state.get(versionUrl, {}) if hasVersion else {})
+        if remoteDate is None or localDate >= remoteDate:
+            print('Data already up to date, continuing without downloading data')
+            state[versionUrl] = versionValidators
+            return localDate
+
+        try:
+            manifest = fetchManifest(url, remoteDate)
+        except (ValueError, http.client.HTTPException) as e:
+            logging.warning('Unable to read the manifest (%s), downloading %s' % (e, ARCHIVE))
+            manifest = None
+        if manifest is not None:
+            try:
+                deltaUpdate(url, manifest, dataFolder, remoteDate)
+                state[versionUrl] = versionValidators
+                return remoteDate
+            except (OSError, ValueError, KeyError, http.client.HTTPException, UpdateError) as e:
+                logging.warning('Delta update failed (%s), downloading %s' % (e, ARCHIVE))
+
+        archive = os.path.join(dataFolder, ARCHIVE)
+        download(url + ARCHIVE, archive, state)
+        try:
+            verify(url + ARCHIVE, archive)
+            extract(archive, dataFolder, remoteDate)
+        except (UpdateError, zipfile.BadZipFile):
+            # Download it again on the next update
+            os.unlink(archive)
+            state.pop(url + ARCHIVE, None)
+            raise
+        # Only saved once the data files are updated so a failed update is retried
+        state[versionUrl] = versionValidators
+        return remoteDate
+    except (OSError, ValueError, zipfile.BadZipFile, http.client.HTTPException, UpdateError) as e:
+        logging.error('Unable to update the data files from %s: %s' % (url, e))
+        return None
+    finally:
+        saveState(dataFolder, state)
+
+def writeFile(fileName: str, content: bytes) -> None:
+    """Writes a file atomically
+
+    Args:
+        fileName (str): File name
+        content (bytes): File content
+    """
+    with atomicFile(fileName) as tempName:
+        with open(tempName, 'wb') as f:
+            f.write(content)
+
+def publishData(sourceFolder: str, publishFolder: str, version: datetime=None) -> None:
+    """Creates the files for the update server from a data folder.
+
+    Patches are created from the data files previously published in the
+    folder, the patches to a file are kept while it is unchanged so clients
+    that missed an update can still patch that file.
+
+    Args:
+        sourceFolder (str): Folder containing the data files
+        publishFolder (str): Folder to write the update files to
+        version (datetime, optional): Date of the data files. Defaults to the date in the source folder.
+    """
+    if version is None:
+        with open(os.path.join(sourceFolder, VERSION_FILE)) as f:
+            version = datetime.datetime(*time.strptime(f.read()[:10], "%d/%m/%Y")[0:5])
+    os.makedirs(publishFolder, exist_ok=True)
+    archive = os.path.join(publishFolder, ARCHIVE)
+    with atomicFile(archive) as tempName:
+        with zipfile.ZipFile(tempName, 'w', zipfile.ZIP_DEFLATED) as z:
+            for name in DATA_FILES:
+                if name == VERSION_FILE or not os.path.isfile(os.path.join(sourceFolder, name)):
+                    continue
+                with open(os.path.join(sourceFolder, name), 'rb') as f:
+                    z.writestr(zipfile.ZipInfo(name, ZIP_DATE), f.read(), zipfile.ZIP_DEFLATED)
+    with atomicFile(archive + CHECKSUM_SUFFIX) as tempName:
+        with open(tempName, 'w') as f:
+            f.write('%s  %s\n' % (fileHash(archive), ARCHIVE))
+
+    previous = {}
+    manifestName = os.path.join(publishFolder, MANIFEST)
+    if os.path.isfile(manifestName):
+        with open(manifestName) as f:
+            previous = json.load(f)['files']
+    files = {}
+    for name in DATA_FILES:
+        # Data folders from before the band plan and offsets files were
+        # added do not have them
+        if name == VERSION_FILE or not os.path.isfile(os.path.join(sourceFolder, name)):
+            continue
+        with open(os.path.join(sourceFolder, name), 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        old = previous.get(name)
+        patches = {}
+        if old is not None and old['sha256'] == digest:
+            patches = old.get('patches', {})
+        elif old is not None and os.path.isfile(os.path.join(publishFolder, name)):
+            with open(os.path.join(publishFolder, name), 'rb') as f:
+                patch = json.dumps(makePatch(f.read(), content)).encode('utf-8')
+            # Only worth publishing if it is smaller than the file
+            if len(patch) < len(content):
+                patchName = '%s.%s%s' % (name, old['sha256'][:16], PATCH_SUFFIX)
+                writeFile(os.path.join(publishFolder, patchName), patch)
+                patches = {old['sha256']: patchName}
+        writeFile(os.path.join(publishFolder, name), content)
+        files[name] = {'sha256': digest, 'size': len(content), 'patches': patches}
+
+    # Remove the patches that no longer apply
+    current = set(n for entry in files.values() for n in entry['patches'].values())
+    for fileName in os.listdir(publishFolder):
+        if fileName.endswith(PATCH_SUFFIX) and fileName not in current:
+            os.unlink(os.path.join(publishFolder, fileName))
+    writeFile(manifestName, json.dumps({'version': version.strftime("%d/%m/%Y"),
+                                        'files': files}, indent=2).encode('utf-8'))
+    with atomicFile(os.path.join(publishFolder, VERSION_FILE)) as tempName:
+        with open(tempName, 'w') as f:
+            f.write(version.strftime("%d/%m/%Y"))
+
+def main() -> None:
+    """Main, creates the update files from a data folder
+    """
+    parser = optparse.OptionParser(usage='%prog [options] data-folder publish-folder')
+    parser.add_option('-d','--date', action='store', type='string', dest='date',
+                      default=None, help='Date of the data as dd/mm/yyyy, defaults to the version in the data folder')
+    (options, args) = parser.parse_args()
+    if len(args) != 2:
+        parser.error('A data folder and publish folder must be given')
+    version = None
+    if options.date:
+        version = datetime.datetime(*time.strptime(options.date, "%d/%m/%Y")[0:5])
+    publishData(args[0], args[1], version)
+
+if __name__ == '__main__':
+    main()
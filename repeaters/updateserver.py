@@ -0,0 +1,192 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Local stand-in for the data update server.
+
+Serves the files in a folder created with python -m repeaters.update with
+ETag and Last-Modified validators, conditional requests and Range requests,
+and can truncate responses to test resuming interrupted downloads, eg:
+    python -m repeaters.update repeaters/data publish
+    python -m repeaters.updateserver -p 8081 --truncate 1000 publish &
+    rpt -u --update-url http://localhost:8081/
+"""
+
+import email.utils
+import logging
+import optparse
+import os
+import re
+import threading
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from repeaters.publish import fileHash
+
+class UpdateRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Request handler for the stand-in update server
+    '''
+    server: 'UpdateServer'
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug('%s - %s' % (self.address_string(), format % args))
+
+    def sendHeaders(self, status: int, headers: dict) -> None:
+        """Sends the status line and headers
+
+        Args:
+            status (int): HTTP status code
+            headers (dict): Headers
+        """
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        name = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).strip('/')
+        fileName = os.path.join(self.server.folder, name)
+        if not name or '/' in name or not os.path.isfile(fileName):
+            self.sendHeaders(404, {'Content-Length': '0'})
+            return
+        with open(fileName, 'rb') as f:
+            data = f.read()
+        etag = '"%s"' % fileHash(fileName)[:32]
+        lastModified = email.utils.formatdate(os.path.getmtime(fileName), usegmt=True)
+        headers = {'ETag': etag, 'Last-Modified': lastModified, 'Accept-Ranges': 'bytes'}
+        with self.server.lock:
+            self.server.stats['requests'] += 1
+
+        if self.headers.get('If-None-Match') == etag or \
+           (self.headers.get('If-None-Match') is None and self.headers.get('If-Modified-Since') == lastModified):
+            with self.server.lock:
+                self.server.stats['notModified'] += 1
+            self.sendHeaders(304, headers)
+            return
+
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        ifRange = self.headers.get('If-Range')
+        if match and (ifRange is None or ifRange in (etag, lastModified)):
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(data) - 1
+            if start >= len(data):
+                self.sendHeaders(416, {'Content-Range': 'bytes */%i' % len(data), 'Content-Length': '0'})
+                return
+            body = data[start:end + 1]
+            with self.server.lock:
+                self.server.stats['ranges'] += 1
+            self.sendHeaders(206, dict(headers, **{'Content-Range': 'bytes %i-%i/%i' % (start, start + len(body) - 1, len(data)),
+                                                   'Content-Length': str(len(body))}))
+            self.wfile.write(body)
+            return
+
+        self.sendHeaders(200, dict(headers, **{'Content-Length': str(len(data))}))
+        with self.server.lock:
+            truncate = self.server.truncate is not None and name not in self.server.truncated and \
+                       len(data) > self.server.truncate
+            if truncate:
+                self.server.truncated.add(name)
+                self.server.stats['truncated'] += 1
+        if truncate:
+            # Send part of the body and drop the connection
+            self.wfile.write(data[:self.server.truncate])
+            self.close_connection = True
+            return
+        self.wfile.write(data)
+
+class UpdateServer(ThreadingHTTPServer):
+    '''
+    Stand-in update server
+    '''
+    daemon_threads = True
+
+    def __init__(self, address: tuple, folder: str, truncate: int=None) -> None:
+        """Constructor for the stand-in server
+
+        Args:
+            address (tuple): Host and port to listen on
+            folder (str): Folder containing the update files
+            truncate (int, optional): Truncate the first full response for each file after this many bytes. Defaults to None.
+        """
+        super().__init__(address, UpdateRequestHandler)
+        self.folder = folder
+        self.truncate = truncate
+        self.truncated = set()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'notModified': 0, 'ranges': 0, 'truncated': 0}
+
+    def url(self) -> str:
+        """Returns the URL of the update folder
+
+        Returns:
+            str: URL
+        """
+        host, port = self.server_address[:2]
+        return 'http://%s:%i/' % (host, port)
+
+def startServer(folder: str, port: int=0, **kwargs) -> UpdateServer:
+    """Starts a stand-in server on a background thread
+
+    Args:
+        folder (str): Folder containing the update files
+        port (int, optional): Port to listen on, 0 for any free port. Defaults to 0.
+        **kwargs: Other options passed to UpdateServer
+
+    Returns:
+        UpdateServer: The running server, stop it with shutdown()
+    """
+    server = UpdateServer(('127.0.0.1', port), folder, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main() -> None:
+    """Main
+    """
+    parser = optparse.OptionParser(usage='%prog [options] update-folder')
+    parser.add_option('-p','--port', action='store', type='int', dest='port',
+                      default=8081, help='Port to listen on')
+    parser.add_option('-H','--host', action='store', type='string', dest='host',
+                      default='127.0.0.1', help='Address to listen on')
+    parser.add_option('-t','--truncate', action='store', type='int', dest='truncate',
+                      default=None, help='Truncate the first full response for each file after TRUNCATE bytes')
+    parser.add_option('-v','--verbose', action='store_true', dest='verbose',
+                      help='Log each request')
+    (options, args) = parser.parse_args()
+
+    if options.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+    if len(args) != 1:
+        parser.error('The update folder must be given')
+
+    server = UpdateServer((options.host, options.port), args[0], options.truncate)
+    logging.info('Serving updates from %s on %s' % (args[0], server.url()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+
+"""Watch mode, rebuilding the outputs affected by a changed data file.
+
+The licence information is kept in memory after the first build and the
+data folder is polled for changes. When one of the overlay files changes
+only the licences whose entries changed are updated in place:
+
+    callsigns.csv   callsign, reverting to the RSM callsign when removed
+    ctcss.csv       CTCSS tone
+    info.csv        name, branch, trustees and note
+    offsets.csv     repeater input offset
+    bandplan.csv    repeater input offsets of all the repeaters
+    links.csv       links are re-read, only outputs showing links are rebuilt
+
+Changes that alter which licences are included (skip.csv, or info.csv when
+filtering on the name or branch) rebuild the licence information from the
+RSM responses kept in memory, so no requests are repeated. A new data
+version (eg after rpt -u) reloads everything from the RSM API.
+"""
+
+import datetime
+import logging
+import time
+
+from rsmapi import session as rsmSession
+from rsmapi.licences import getLicence
+
+from repeaters import repeaters
+from repeaters.overlays import ATTRIBUTES, entryValue, loadOverlays
+from repeaters.repeaters import I_BRANCH, I_NAME, I_NOTE, I_TRUSTEE1, I_TRUSTEE2
+
+WATCH_INTERVAL = 1.0
+# Overlays indexed by licence number
+OVERLAYS = ('callsigns', 'ctcss', 'info', 'offsets')
+VERSION_FILE = 'version'
+OUTPUTS = ('csv', 'xlsx', 'columnar', 'html', 'js', 'json', 'kml', 'kmz', 'search')
+# Outputs showing links, only JSON includes them when output by site
+LINK_OUTPUTS = ('html', 'js', 'json', 'kml', 'kmz')
+SITE_LINK_OUTPUTS = ('json',)
+# Positions of the include, exclude, branch and noskip filters
+F_INCLUDE = 6
+F_EXCLUDE = 7
+F_BRANCH = 8
+F_NOSKIP = 9
+
+def changedNumbers(old: dict, new: dict) -> set:
+    """Returns the keys (licence numbers) added, removed or changed in an overlay
+
+    Args:
+        old (dict): Previous overlay indexed by licence number
+        new (dict): New overlay indexed by licence number
+
+    Returns:
+        set: Licence numbers
+    """
+    return set(number for number in old.keys() | new.keys()
+               if entryValue(old.get(number)) != entryValue(new.get(number)))
+
+class Model:
+    '''
+    Licence information held in memory with the overlays applied to it
+    '''
+    def __init__(self, dataDir: str, filters: tuple, sites: dict,
+                 licences: dict, licensees: dict, links: list) -> None:
+        """Constructor for the model
+
+        Args:
+            dataDir (str): Folder containing the data files
+            filters (tuple): Filter options passed to readLicenceInfo()
+            sites (dict): Sites from the first build
+            licences (dict): Licences from the first build
+            licensees (dict): Licensees from the first build
+            links (list): Links from the first build
+        """
+        self.dataDir = dataDir
+        self.filters = filters
+        self.sites = sites
+        self.licences = licences
+        self.licensees = licensees
+        self.links = links
+        self.signature = repeaters.dataSignature(dataDir)
+        self.overlays = loadOverlays(dataDir)
+        self.records = None
+
+    def basicRecords(self) -> dict:
+        """Returns the basic licence records from the RSM API indexed by
+        licence number and frequency
+
+        Returns:
+            dict: Basic licence records
+        """
+        if self.records is None:
+            records = repeaters.getLicenceRecords(*self.filters[:6])
+            self.records = {(r['licenceNumber'], r['frequency']): r for r in records}
+        return self.records
+
+    def changedFiles(self) -> 'list[str]':
+        """Returns the data files changed since they were last read
+
+        Returns:
+            list[str]: Names of the changed files
+        """
+        signature = repeaters.dataSignature(self.dataDir)
+        return [new[0] for old, new in zip(self.signature, signature) if old != new]
+
+    def rebuild(self) -> None:
+        """Rebuilds the licence information from the overlays, the RSM
+        responses are served from memory
+        """
+        records = list(self.basicRecords().values())
+        self.sites, self.licences, self.licensees = repeaters.getLicenceInfo(
+            self.overlays.callsigns, self.overlays.ctcss,
+            self.overlays.info, self.overlays.skip,
+            *self.filters, records)
+        repeaters.calcOffsets(self.licences.values(), self.overlays.bandPlan, self.overlays.offsets)
+        self.links = repeaters.readLinks(self.overlays.links, self.licences, self.sites)
+
+    def applyOverlays(self, licence: repeaters.Licence) -> None:
+        """Applies the info, callsign, CTCSS and offset overlays to a licence
+
+        Args:
+            licence (repeaters.Licence): Licence to update
+        """
+        info = self.overlays.info.get(licence.number)
+        if info is None:
+            licence.setName(licence.licensee.title())
+            licence.branch = ''
+            licence.trustee1 = ''
+            licence.trustee2 = ''
+            licence.note = 'No info record available'
+        else:
+            licence.setName(info[I_NAME])
+            licence.branch = info[I_BRANCH]
+            licence.trustee1 = info[I_TRUSTEE1]
+            licence.trustee2 = info[I_TRUSTEE2]
+            licence.note = info[I_NOTE]
+
+        callsign = self.overlays.callsigns.get(licence.number)
+        if callsign is None:
+            record = self.basicRecords()[(licence.number, licence.frequency)]
+            callsign = getLicence(record['licenceID'], gridRefDefault='LAT_LONG_NZGD2000_D2000')['baseCallsign']
+        licence.setCallsign(callsign)
+        licence.setCtcss(self.overlays.ctcss.get(licence.number))
+        repeaters.calcOffsets([licence], self.overlays.bandPlan, self.overlays.offsets)
+
+    def update(self, changed: 'list[str]') -> tuple:
+        """Applies the changed data files to the model
+
+        Args:
+            changed (list[str]): Names of the changed data files
+
+        Returns:
+            tuple: True if licences changed and True if links changed
+        """
+        self.signature = repeaters.dataSignature(self.dataDir)
+        if VERSION_FILE in changed:
+            logging.info('New data version, reloading the licence information')
+            rsmSession.startMemoryCache()
+            self.records = None
+            self.overlays = loadOverlays(self.dataDir)
+            self.rebuild()
+            return True, True
+
+        old = self.overlays
+        if any(name in ATTRIBUTES for name in changed):
+            self.overlays = loadOverlays(self.dataDir)
+
+        filtered = any(self.filters[i] is not None for i in (F_INCLUDE, F_EXCLUDE, F_BRANCH))
+        numbers = {name: changedNumbers(getattr(old, name), getattr(self.overlays, name))
+                   for name in OVERLAYS}
+        skipChanged = changedNumbers(old.skip, self.overlays.skip)
+        if (skipChanged and not self.filters[F_NOSKIP]) or (numbers['info'] and filtered):
+            logging.info('The included licences may have changed, rebuilding the licence information')
+            self.rebuild()
+            return True, True
+
+        affected = set().union(*numbers.values())
+        licencesChanged = False
+        for licence in self.licences.values():
+            if licence.number in affected:
+                self.applyOverlays(licence)
+                licencesChanged = True
+        if old.bandPlan != self.overlays.bandPlan:
+            repeaters.calcOffsets(self.licences.values(), self.overlays.bandPlan, self.overlays.offsets)
+            licencesChanged = True
+        linksChanged = old.links != self.overlays.links
+        if linksChanged:
+            self.links = repeaters.readLinks(self.overlays.links, self.licences, self.sites)
+        return licencesChanged, linksChanged
+
+def affectedOutputs(licencesChanged: bool, linksChanged: bool, bySite: bool) -> 'set[str]':
+    """Returns the outputs whose content depends on the changes
+
+    Args:
+        licencesChanged (bool): True if licences changed
+        linksChanged (bool): True if links changed
+        bySite (bool): True if the outputs are by site only
+
+    Returns:
+        set[str]: Names of the outputs to regenerate
+    """
+    if licencesChanged:
+        return set(OUTPUTS)
+    if linksChanged:
+        return set(SITE_LINK_OUTPUTS if bySite else LINK_OUTPUTS)
+    return set()
+
+def watch(options, dataDir: str, filters: tuple, sites: dict, licences: dict,
+          licensees: dict, links: list, interval: float=WATCH_INTERVAL) -> None:
+    """Watches the data folder and regenerates the outputs affected by
+    changes until interrupted
+
+    Args:
+        options (optparse.Values): Command line options
+        dataDir (str): Folder containing the data files
+        filters (tuple): Filter options passed to readLicenceInfo()
+        sites (dict): Sites from the first build
+        licences (dict): Licences from the first build
+        licensees (dict): Licensees from the first build
+        links (list): Links from the first build
+        interval (float, optional): Seconds between checks. Defaults to WATCH_INTERVAL.
+    """
+    model = Model(dataDir, filters, sites, licences, licensees, links)
+    print('Watching %s for changes, press Ctrl-C to stop' % dataDir)
+    try:
+        while True:
+            time.sleep(interval)
+            changed = model.changedFiles()
+            if not changed:
+                continue
+            # Wait for the files to stop changing, eg an editor saving in parts
+            signature = repeaters.dataSignature(dataDir)
+            time.sleep(interval)
+            while repeaters.dataSignature(dataDir) != signature:
+                signature = repeaters.dataSignature(dataDir)
+                time.sleep(interval)
+            changed = model.changedFiles()
+
+            start = time.perf_counter()
+            try:
+                outputs = affectedOutputs(*model.update(changed), options.site)
+                if outputs:
+                    repeaters.generateOutputs(options, model.licences, model.sites,
+                                              model.links, datetime.datetime.now(), outputs)
+            except Exception:
+                logging.exception('Unable to apply the changes to %s' % ', '.join(changed))
+                continue
+            generated = [o for o in OUTPUTS
+                         if o in outputs and getattr(options, o + 'filename') is not None]
+            print('%s changed, regenerated %s in %0.2fs' % (
+                  ', '.join(changed),
+                  ', '.join(generated) if generated else 'nothing',
+                  time.perf_counter() - start))
+    except KeyboardInterrupt:
+        pass
@@ -1,11 +1,37 @@
 from os import getenv
-from dotenv import load_dotenv
 
-load_dotenv()
+RSM_DEFAULT_URL = 'https://api.business.govt.nz/gateway/radio-spectrum-management/v1'
+RSM_DEFAULT_DELAY = 0
 
-rsmBaseUrl = 'https://api.business.govt.nz/gateway/radio-spectrum-management/v1'
+# Settings resolved from the environment (and .env file) on first use, any
+# of them may be overridden by assigning to the module attribute, eg to use
+# a local stand-in server (see rsmapi.server)
+SETTINGS = ('rsmBaseUrl', 'rsmHeaders', 'rsmDelay')
 
-rsmHeaders ={'Cache-Control': 'no-cache',
-            'Ocp-Apim-Subscription-Key': getenv('RSM_SECRET')}
+_settings = None
 
-rsmDelay = int(getenv('RSM_DELAY'))
\ No newline at end of file
+def settings() -> dict:
+    """Returns the settings for the RSM API, loading the .env file and
+    reading the environment the first time it is called
+
+    RSM_SECRET      subscription key for the API
+    RSM_BASE_URL    base URL of the API, defaults to RSM_DEFAULT_URL
+    RSM_DELAY       delay after each request in ms, defaults to RSM_DEFAULT_DELAY
+
+    Returns:
+        dict: Settings indexed by attribute name
+    """
+    global _settings
+    if _settings is None:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _settings = {'rsmBaseUrl': getenv('RSM_BASE_URL', RSM_DEFAULT_URL),
+                     'rsmHeaders': {'Cache-Control': 'no-cache',
+                                    'Ocp-Apim-Subscription-Key': getenv('RSM_SECRET')},
+                     'rsmDelay': int(getenv('RSM_DELAY') or RSM_DEFAULT_DELAY)}
+    return _settings
+
+def __getattr__(name: str):
+    if name in SETTINGS:
+        return settings()[name]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
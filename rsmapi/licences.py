@@ -19,13 +19,9 @@
 ## You should have received a copy of the GNU General Public Licence
 ## along with this program. If not, see <http://www.gnu.org/licences/>.
 
-import requests
 import json
-import logging
 
-from time import sleep
-
-from .common import rsmBaseUrl, rsmHeaders, rsmDelay
+from . import session
 
 # Valid Licence Statuses
 LICENCE_STATUSES = ("All",
@@ -120,7 +116,6 @@ def getLicences(page: int = 1, pageSize: int = 200,
         dict: JSON response object
     """
 
-    url = rsmBaseUrl + '/licences'
     params = {'page': page,
               'page-size': pageSize}
     if sortBy:
@@ -163,13 +158,7 @@ def getLicences(page: int = 1, pageSize: int = 200,
         assert gridRefDefault in GRID_DEFAULT_OPTS
         params['gridRefDefault'] = gridRefDefault
 
-    response = requests.get(url, headers=rsmHeaders, params=params)
-    logging.info(response.url)
-    response.raise_for_status()
-
-    if rsmDelay: sleep(rsmDelay / 1000) #delay for ratelimiting requests
-
-    return response.json()
+    return session.get('/licences', params)
 
 def getLicence(licenceId: int, gridRefDefault: str = None) -> dict:
     """Get licence details for the given licenceId fromthe RSM database
@@ -181,19 +170,12 @@ def getLicence(licenceId: int, gridRefDefault: str = None) -> dict:
     Returns:
         dict: Licence JSON response
     """
-    url = rsmBaseUrl + f'/licences/' + str(licenceId)
     params = {}
     if gridRefDefault:
         assert gridRefDefault in GRID_DEFAULT_OPTS
         params['gridRefDefault'] = gridRefDefault
 
-    response = requests.get(url, headers=rsmHeaders, params=params)
-    logging.info(response.url)
-    response.raise_for_status()
-
-    if rsmDelay: sleep(rsmDelay / 1000) #delay for ratelimiting requests
-
-    return response.json()
+    return session.get('/licences/' + str(licenceId), params)
 
 def getLicenceList(sortBy: str = None,
                    sortAscending: bool = True,
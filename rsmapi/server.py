@@ -0,0 +1,288 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+"""Local stand-in for the RSM API for offline builds and benchmarks.
+
+Serves /licences and /licences/{id} from a fixture folder containing:
+    licences.json       list of the basic licence records returned by /licences
+    licences/{id}.json  licence details returned by /licences/{id}
+
+The client can be pointed at the server by setting RSM_BASE_URL, eg:
+    python -m rsmapi.server -p 8080 rsmapi/fixtures &
+    RSM_BASE_URL=http://localhost:8080 RSM_DELAY=0 rpt -ak all.kml
+"""
+
+import json
+import logging
+import math
+import optparse
+import os
+import random
+import threading
+import time
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+class RsmRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Request handler for the stand-in RSM API
+    '''
+    server: 'RsmServer'
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug('%s - %s' % (self.address_string(), format % args))
+
+    def sendJson(self, status: int, body: dict, headers: dict={}) -> None:
+        """Sends a JSON response
+
+        Args:
+            status (int): HTTP status code
+            body (dict): Response body
+            headers (dict, optional): Additional headers. Defaults to {}.
+        """
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        path = url.path.rstrip('/').split('/')
+
+        error = self.server.checkRequest(self.headers)
+        if error is not None:
+            status, headers = error
+            self.sendJson(status, {'statusCode': status,
+                                   'message': self.responses[status][0]},
+                          headers)
+            return
+
+        if path[-1] == 'licences':
+            self.sendJson(200, self.server.licencePage(params))
+        elif len(path) >= 2 and path[-2] == 'licences' and path[-1] in self.server.details:
+            self.sendJson(200, self.server.details[path[-1]])
+        else:
+            self.sendJson(404, {'statusCode': 404, 'message': 'Resource not found'})
+
+class RsmServer(ThreadingHTTPServer):
+    '''
+    Stand-in RSM API server
+    '''
+    daemon_threads = True
+
+    def __init__(self, address: tuple, fixtureDir: str=FIXTURES_DIR,
+                 latency: float=0.0, jitter: float=0.0,
+                 rateLimit: float=0.0, errorRate: float=0.0,
+                 errorCodes: tuple=(429, 500, 503),
+                 key: str=None, seed: int=None) -> None:
+        """Constructor for the stand-in server
+
+        Args:
+            address (tuple): Host and port to listen on
+            fixtureDir (str, optional): Folder containing the fixtures. Defaults to FIXTURES_DIR.
+            latency (float, optional): Delay before each response in ms. Defaults to 0.0.
+            jitter (float, optional): Maximum random extra delay in ms. Defaults to 0.0.
+            rateLimit (float, optional): Requests per second before 429 responses are returned, 0 for no limit. Defaults to 0.0.
+            errorRate (float, optional): Fraction of requests that fail with one of errorCodes. Defaults to 0.0.
+            errorCodes (tuple, optional): Status codes for injected errors. Defaults to (429, 500, 503).
+            key (str, optional): Subscription key required in requests, None to accept any. Defaults to None.
+            seed (int, optional): Seed for the injected errors and jitter. Defaults to None.
+        """
+        super().__init__(address, RsmRequestHandler)
+        self.licences, self.details = readFixtures(fixtureDir)
+        self.latency = latency
+        self.jitter = jitter
+        self.rateLimit = rateLimit
+        self.errorRate = errorRate
+        self.errorCodes = errorCodes
+        self.key = key
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = []
+        self.stats = {'requests': 0, 'rateLimited': 0, 'errors': 0}
+
+    def url(self) -> str:
+        """Returns the base URL for the server to use as RSM_BASE_URL
+
+        Returns:
+            str: Base URL
+        """
+        host, port = self.server_address[:2]
+        return 'http://%s:%i' % (host, port)
+
+    def checkRequest(self, headers) -> tuple:
+        """Applies the latency, subscription key, rate limit and injected
+        errors to a request.
+
+        Args:
+            headers: Request headers
+
+        Returns:
+            tuple: Status code and headers of the error response or None
+        """
+        with self.lock:
+            self.stats['requests'] += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            injectError = self.random.random() < self.errorRate
+            errorCode = self.random.choice(self.errorCodes)
+            if self.rateLimit > 0:
+                now = time.monotonic()
+                self.window = [t for t in self.window if now - t < 1.0]
+                if len(self.window) >= self.rateLimit:
+                    self.stats['rateLimited'] += 1
+                    retryAfter = max(1, math.ceil(1.0 - (now - self.window[0])))
+                    return (429, {'Retry-After': str(retryAfter)})
+                self.window.append(now)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if self.key is not None and headers.get('Ocp-Apim-Subscription-Key') != self.key:
+            return (401, {})
+        if injectError:
+            with self.lock:
+                self.stats['errors'] += 1
+            if errorCode == 429:
+                return (429, {'Retry-After': '1'})
+            return (errorCode, {})
+        return None
+
+    def licencePage(self, params: dict) -> dict:
+        """Returns a page of the licence list filtered by licence type and
+        frequency, as returned by the /licences API call
+
+        Args:
+            params (dict): Query parameters
+
+        Returns:
+            dict: Page of licences
+        """
+        page = int(params.get('page', ['1'])[0])
+        pageSize = int(params.get('page-size', ['200'])[0])
+        items = self.licences
+        types = []
+        for t in params.get('licenceTypeCode', []):
+            types += t.split(',')
+        if types:
+            items = [i for i in items if i.get('licenceTypeCode') in types]
+        if 'fromFrequency' in params:
+            fromFrequency = float(params['fromFrequency'][0])
+            toFrequency = float(params.get('toFrequency', [fromFrequency])[0])
+            items = [i for i in items if fromFrequency <= i['frequency'] <= toFrequency]
+        if params.get('sort-by', [None])[0] == 'frequency':
+            items = sorted(items, key=lambda i: i['frequency'],
+                           reverse=params.get('sort-order', ['asc'])[0] == 'desc')
+        totalPages = max(1, math.ceil(len(items) / pageSize))
+        return {'page': page,
+                'pageSize': pageSize,
+                'totalItems': len(items),
+                'totalPages': totalPages,
+                'items': items[(page - 1) * pageSize:page * pageSize]}
+
+def readFixtures(fixtureDir: str) -> tuple:
+    """Reads the licence list and licence details from the fixture folder
+
+    Args:
+        fixtureDir (str): Folder containing the fixtures
+
+    Returns:
+        tuple: List of basic licence records and details indexed by licence ID
+    """
+    with open(os.path.join(fixtureDir, 'licences.json'), encoding='utf-8') as f:
+        licences = json.load(f)
+    details = {}
+    detailDir = os.path.join(fixtureDir, 'licences')
+    for fileName in os.listdir(detailDir):
+        if fileName.endswith('.json'):
+            with open(os.path.join(detailDir, fileName), encoding='utf-8') as f:
+                details[fileName[:-5]] = json.load(f)
+    return licences, details
+
+def startServer(fixtureDir: str=FIXTURES_DIR, port: int=0, **kwargs) -> RsmServer:
+    """Starts a stand-in server on a background thread
+
+    Args:
+        fixtureDir (str, optional): Folder containing the fixtures. Defaults to FIXTURES_DIR.
+        port (int, optional): Port to listen on, 0 for any free port. Defaults to 0.
+        **kwargs: Other options passed to RsmServer
+
+    Returns:
+        RsmServer: The running server, stop it with shutdown()
+    """
+    server = RsmServer(('127.0.0.1', port), fixtureDir, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main() -> None:
+    """Main
+    """
+    parser = optparse.OptionParser(usage='%prog [options] [fixture folder]')
+    parser.add_option('-p','--port', action='store', type='int', dest='port',
+                      default=8080, help='Port to listen on')
+    parser.add_option('-H','--host', action='store', type='string', dest='host',
+                      default='127.0.0.1', help='Address to listen on')
+    parser.add_option('-l','--latency', action='store', type='float', dest='latency',
+                      default=0.0, help='Delay before each response in ms')
+    parser.add_option('-j','--jitter', action='store', type='float', dest='jitter',
+                      default=0.0, help='Maximum random extra delay for each response in ms')
+    parser.add_option('-r','--rate-limit', action='store', type='float', dest='rateLimit',
+                      default=0.0, help='Requests per second allowed before returning 429 responses')
+    parser.add_option('-e','--error-rate', action='store', type='float', dest='errorRate',
+                      default=0.0, help='Fraction of requests to fail with an injected error')
+    parser.add_option('-c','--error-codes', action='store', type='string', dest='errorCodes',
+                      default='429,500,503', help='Comma separated status codes for injected errors')
+    parser.add_option('-k','--key', action='store', type='string', dest='key',
+                      default=None, help='Subscription key to require in requests')
+    parser.add_option('-s','--seed', action='store', type='int', dest='seed',
+                      default=None, help='Random seed for injected errors and jitter')
+    parser.add_option('-v','--verbose', action='store_true', dest='verbose',
+                      help='Log each request')
+    (options, args) = parser.parse_args()
+
+    if options.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    if len(args) > 1:
+        parser.error('Only one fixture folder may be given')
+    fixtureDir = args[0] if args else FIXTURES_DIR
+
+    server = RsmServer((options.host, options.port), fixtureDir,
+                       latency=options.latency, jitter=options.jitter,
+                       rateLimit=options.rateLimit, errorRate=options.errorRate,
+                       errorCodes=tuple(int(c) for c in options.errorCodes.split(',')),
+                       key=options.key, seed=options.seed)
+    logging.info('Serving %i licences from %s on %s' % (len(server.licences), fixtureDir, server.url()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+if __name__ == '__main__':
+    main()
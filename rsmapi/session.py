@@ -0,0 +1,184 @@
+# -*- coding: UTF-8 -*-
+
+## NZ Repeater list/map builder
+## URL: https://github.com/anakhanz/nzrepeaters
+## Copyright (C) 2024, Rob Wallace rob[at]wallace[dot]kiwi
+## Builds lists of NZ repeaters from the licence information avaliable from the
+## RSM's smart system.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public Licence as published by
+## the Free Software Foundation; either version 3 of the Licence, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+## GNU General Public Licence for more details.
+##
+## You should have received a copy of the GNU General Public Licence
+## along with this program. If not, see <http://www.gnu.org/licences/>.
+
+"""Requests to the RSM API with optional recording and replay.
+
+When recording every request and its JSON response is appended to a gzip
+compressed JSON lines archive in the recording folder. When replaying the
+responses are served from the archive and no network requests are made.
+
+Long running processes (eg rpt --watch) can also keep the responses in
+memory so rebuilding the licence information makes no repeated requests.
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import os
+import time
+import urllib.parse
+
+from . import common
+
+ARCHIVE_NAME = 'rsm-session.jsonl.gz'
+
+_recording = None
+_replay = None
+_memory = None
+
+# Request counters and times in seconds
+stats = {'requests': 0, 'replayed': 0, 'cached': 0, 'bytes': 0,
+         'requestTime': 0.0, 'delayTime': 0.0}
+latencies = []
+
+class ReplayError(Exception):
+    '''
+    Raised when a request is not in the replayed session
+    '''
+
+def requestKey(path: str, params: dict) -> str:
+    """Returns the key identifying a request in an archive, this does not
+    include the base URL so sessions can be replayed against any server.
+
+    Args:
+        path (str): Path of the request below the base URL
+        params (dict): Query parameters
+
+    Returns:
+        str: Request key
+    """
+    return path + '?' + urllib.parse.urlencode(sorted(params.items()), doseq=True)
+
+def startRecording(folder: str) -> None:
+    """Starts recording requests and responses to an archive in the given
+    folder, replacing any existing recording.
+
+    Args:
+        folder (str): Folder to save the archive in
+    """
+    import gzip
+    global _recording
+    stop()
+    os.makedirs(folder, exist_ok=True)
+    _recording = gzip.open(os.path.join(folder, ARCHIVE_NAME), 'wt', encoding='utf-8')
+    _recording.write(json.dumps({'recorded': datetime.datetime.now().isoformat(),
+                                 'baseUrl': common.rsmBaseUrl}) + '\n')
+    atexit.register(stop)
+
+def startReplay(folder: str) -> None:
+    """Starts replaying the responses from the archive in the given folder
+
+    Args:
+        folder (str): Folder containing the archive
+    """
+    import gzip
+    global _replay
+    stop()
+    _replay = {}
+    with gzip.open(os.path.join(folder, ARCHIVE_NAME), 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        for line in f:
+            record = json.loads(line)
+            _replay[record['request']] = record['response']
+    logging.info('Replaying %i responses recorded %s from %s' % (
+                 len(_replay), header['recorded'], header['baseUrl']))
+
+def startMemoryCache() -> None:
+    """Starts keeping the responses in memory and returning them for
+    repeated requests, calling it again empties the cache
+    """
+    global _memory
+    _memory = {}
+
+def stop() -> None:
+    """Stops any recording or replay
+    """
+    global _recording, _replay
+    if _recording is not None:
+        _recording.close()
+        _recording = None
+    _replay = None
+
+def get(path: str, params: dict) -> dict:
+    """Makes a GET request to the RSM API
+
+    Args:
+        path (str): Path of the request below the base URL
+        params (dict): Query parameters
+
+    Raises:
+        ReplayError: If replaying and the request was not recorded
+
+    Returns:
+        dict: JSON response object
+    """
+    key = requestKey(path, params)
+    if _memory is not None and key in _memory:
+        stats['cached'] += 1
+        return _memory[key]
+
+    if _replay is not None:
+        if key not in _replay:
+            raise ReplayError('Request %s is not in the replayed session' % key)
+        logging.info('Replaying ' + key)
+        stats['replayed'] += 1
+        result = _replay[key]
+    else:
+        result = fetch(path, params, key)
+
+    if _memory is not None:
+        _memory[key] = result
+    return result
+
+def fetch(path: str, params: dict, key: str) -> dict:
+    """Makes a GET request to the RSM API over the network, recording it if
+    recording
+
+    Args:
+        path (str): Path of the request below the base URL
+        params (dict): Query parameters
+        key (str): Key identifying the request in an archive
+
+    Returns:
+        dict: JSON response object
+    """
+    import requests
+    start = time.perf_counter()
+    response = requests.get(common.rsmBaseUrl + path, headers=common.rsmHeaders, params=params)
+    logging.info(response.url)
+    response.raise_for_status()
+    result = response.json()
+    latency = time.perf_counter() - start
+    latencies.append(latency)
+    stats['requests'] += 1
+    stats['bytes'] += len(response.content)
+    stats['requestTime'] += latency
+
+    if _recording is not None:
+        _recording.write(json.dumps({'request': key, 'response': result},
+                                    separators=(',', ':')) + '\n')
+
+    if common.rsmDelay: #delay for ratelimiting requests
+        time.sleep(common.rsmDelay / 1000)
+        stats['delayTime'] += common.rsmDelay / 1000
+
+    return result
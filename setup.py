@@ -61,8 +61,9 @@ setup(name = 'NZ_Repeaters',
         'Topic :: Scientific/Engineering :: Visualization',
         'Topic :: Utilities'],
       license = 'GPL-2',
-      packages = ['repeaters', 'mapping'],
+      packages = ['repeaters', 'mapping', 'rsmapi'],
       scripts = ['rpt'],
-      package_data={'repeaters': ['data/*.csv','data/*.sqlite']},
+      package_data={'repeaters': ['data/*.csv','data/*.sqlite'],
+                    'rsmapi': ['fixtures/*.json', 'fixtures/licences/*.json']},
       console=['repeaters/repeaters.py','rpt'],
-      options={'py2exe':{'includes':['repeaters', 'mapping']}})
\ No newline at end of file
+      options={'py2exe':{'includes':['repeaters', 'mapping', 'rsmapi']}})
\ No newline at end of file
@@ -0,0 +1,56 @@
+"""Tests of choosing the nearest repeaters for the codeplugs."""
+
+import random
+
+import pytest
+
+from repeaters.codeplug import Location, SiteIndex, nearestRepeaters
+from repeaters.repeaters import Coordinate, Licence, Site
+
+def makeIndex() -> SiteIndex:
+    """Returns an index of random sites around New Zealand, with some on
+    the Chatham Islands and either side of 180 degrees longitude"""
+    rng = random.Random(5)
+    sites = {}
+    licences = []
+
+    def add(name: str, lat: float, lon: float) -> None:
+        sites[name] = Site(name, '', Coordinate(lat, lon), 100)
+        licences.append(Licence('Amateur Repeater', 146.0 + len(licences) * 0.0125, name, 'X',
+                                100000 + len(licences), name, '01', '', '', '', 'ZL1AA', None))
+
+    for i in range(400):
+        add('S%i' % i, rng.uniform(-47, -34.5), rng.uniform(166, 178.6))
+    add('CHAT1', -43.95, -176.55)
+    add('CHAT2', -44.0, -176.4)
+    add('EDGE', -43.9, 179.9)
+    add('WEST', -43.95, -179.9)
+    add('EASTCAPE', -37.7, 178.5)
+    return SiteIndex(licences, sites)
+
+def makeLocations() -> 'list[Location]':
+    """Returns locations including some either side of 180 degrees longitude"""
+    rng = random.Random(7)
+    locations = [Location('Waitangi', -43.95, -176.56),
+                 Location('Antimeridian', -43.95, -179.95),
+                 Location('Antimeridian East', -40.0, 179.99),
+                 Location('London', 51.5, -0.1)]
+    for i in range(150):
+        lon = rng.uniform(165, 180) if i % 2 else rng.uniform(-180, -175)
+        locations.append(Location('R%i' % i, rng.uniform(-48, -33), lon))
+    return locations
+
+@pytest.mark.parametrize('count,maxDistance', [(5, None), (20, None), (10, 300.0)])
+def test_nearest_matches_scan(count, maxDistance):
+    index = makeIndex()
+    locations = makeLocations()
+    nearest = nearestRepeaters(index, locations, count, maxDistance)
+    for location in locations:
+        expected = index.scan(location, count, maxDistance)
+        assert ([licence.number for d, licence in nearest[location.name]] ==
+                [licence.number for d, licence in expected]), location.name
+
+def test_nearest_across_antimeridian():
+    index = makeIndex()
+    nearest = nearestRepeaters(index, [Location('Antimeridian', -43.95, -179.95)], 2)
+    assert [licence.site for d, licence in nearest['Antimeridian']] == ['WEST', 'EDGE']
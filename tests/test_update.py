@@ -0,0 +1,49 @@
+"""Tests of the data update against the stand-in update server."""
+
+import datetime
+import glob
+import logging
+import os
+import shutil
+
+from repeaters import update, updateserver
+
+OLD_VERSION = datetime.datetime(2024, 1, 1)
+NEW_VERSION = datetime.datetime(2024, 2, 1)
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'repeaters', 'data')
+
+def makeDataFolder(folder: str, version: datetime.datetime) -> None:
+    """Copies the packaged data files to a folder with a version file"""
+    os.makedirs(folder)
+    for fileName in glob.glob(os.path.join(DATA_FOLDER, '*.csv')):
+        shutil.copy(fileName, folder)
+    with open(os.path.join(folder, update.VERSION_FILE), 'w') as f:
+        f.write(version.strftime('%d/%m/%Y'))
+
+def test_truncated_patch_falls_back_to_archive(tmp_path, caplog):
+    source = str(tmp_path / 'source')
+    publish = str(tmp_path / 'publish')
+    local = str(tmp_path / 'local')
+    makeDataFolder(source, OLD_VERSION)
+    makeDataFolder(local, OLD_VERSION)
+    update.publishData(source, publish, OLD_VERSION)
+    with open(os.path.join(source, 'info.csv'), 'a') as f:
+        f.write('999999,Test,01,,,Added\n')
+    update.publishData(source, publish, NEW_VERSION)
+    patches = [name for name in os.listdir(publish) if name.endswith(update.PATCH_SUFFIX)]
+    assert len(patches) == 1
+
+    # Only the patch is cut short
+    server = updateserver.startServer(publish, truncate=10)
+    server.truncated.update(name for name in os.listdir(publish) if name not in patches)
+    try:
+        with caplog.at_level(logging.WARNING):
+            assert update.updateData(local, OLD_VERSION, server.url()) == NEW_VERSION
+    finally:
+        server.shutdown()
+    assert server.stats['truncated'] == 1
+    assert 'Delta update failed' in caplog.text
+    with open(os.path.join(source, 'info.csv'), 'rb') as f, \
+         open(os.path.join(local, 'info.csv'), 'rb') as g:
+        assert f.read() == g.read()